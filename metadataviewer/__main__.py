@@ -31,6 +31,13 @@ import argparse
 import logging
 
 from metadataviewer.dao.numpy_dao import NumpyDao
+from metadataviewer.dao.star_dao import StarDao
+from metadataviewer.dao.sqlite_dao import SqliteDao
+from metadataviewer.dao.xmd_dao import XmdDao
+from metadataviewer.dao.csv_dao import CsvDao
+from metadataviewer.model.cache import ThumbnailDiskCache
+from metadataviewer.model.constants import THUMBNAIL_DISK_CACHE_SIZE
+from metadataviewer.model.renderers import ImageRenderer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -47,6 +54,16 @@ def defineArgs():
     parser.add_argument("--extensionpath", help="Path to a module to load to extend the viewer", type=str, default=None)
     parser.add_argument("--visiblelabels", help="List of column names that will be visible", type=str, default=None)
     parser.add_argument("--orderlabels", help="List of column names that will be used to stablished a columns order", type=str, default=None)
+    parser.add_argument("--nommap", help="Load the numpy files completely in memory instead of memory-mapping them", action="store_true", default=False)
+    parser.add_argument("--mmapthreshold", help="File size (in MB) from which numpy files are memory-mapped", type=int, default=None)
+    parser.add_argument("--pagecachesize", help="Memory (in MB) used to keep the already read pages", type=int, default=None)
+    parser.add_argument("--thumbnailcachesize", help="Memory (in MB) used to keep the rendered images", type=int, default=None)
+    parser.add_argument("--diskcache", help="Keep the rendered images on disk, so they are not rendered again when the viewer is reopened", action="store_true", default=False)
+    parser.add_argument("--diskcachedir", help="Directory of the rendered images kept with --diskcache (the user cache directory by default)", type=str, default=None)
+    parser.add_argument("--diskcachesize", help="Disk space (in MB) used by the rendered images kept with --diskcache", type=int, default=THUMBNAIL_DISK_CACHE_SIZE)
+    parser.add_argument("--imagethreads", help="Number of threads that render the images in background (0 renders them before showing the cells)", type=int, default=None)
+    parser.add_argument("--sqliteimmutable", help="Open the sqlite files as immutable (faster, but they must not change while they are shown)", action="store_true", default=False)
+    parser.add_argument("--prefetchpages", help="Number of pages loaded in background before and after the displayed ones (0 disables it)", type=int, default=None)
 
     return parser
 
@@ -69,6 +86,41 @@ def main():
 
     objectManager = ObjectManager()
     objectManager.registerDAO(NumpyDao)
+    objectManager.registerDAO(StarDao)
+    objectManager.registerDAO(SqliteDao)
+    objectManager.registerDAO(XmdDao)
+    objectManager.registerDAO(CsvDao)
+
+    if args.nommap:
+        NumpyDao.setUseMmap(False)
+
+    if args.mmapthreshold is not None:
+        logger.info("Memory-mapping threshold: %d MB" % args.mmapthreshold)
+        NumpyDao.setMmapThreshold(args.mmapthreshold * 1024 * 1024)
+
+    if args.sqliteimmutable:
+        SqliteDao.setImmutable(True)
+
+    if args.pagecachesize is not None:
+        logger.info("Pages cache size: %d MB" % args.pagecachesize)
+        objectManager.setPageCacheSize(args.pagecachesize)
+
+    if args.thumbnailcachesize is not None:
+        logger.info("Thumbnails cache size: %d MB" % args.thumbnailcachesize)
+        ImageRenderer.setThumbnailCacheSize(args.thumbnailcachesize)
+
+    if args.diskcache:
+        diskCache = ThumbnailDiskCache(args.diskcachedir,
+                                       args.diskcachesize * 1024 * 1024)
+        logger.info("Thumbnails disk cache: %s (%d MB)" % (diskCache.getPath(),
+                                                          args.diskcachesize))
+        ImageRenderer.setDiskCache(diskCache)
+
+    if args.imagethreads is not None:
+        ImageRenderer.getImageLoader().setThreads(args.imagethreads)
+
+    if args.prefetchpages is not None:
+        objectManager.setPrefetchPages(args.prefetchpages)
 
     if args.visiblelabels:
         logger.info("Visible labels: %s" % args.visiblelabels)
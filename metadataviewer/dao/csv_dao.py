@@ -0,0 +1,348 @@
+import csv
+import io
+import itertools
+import logging
+import os
+import threading
+from array import array
+
+import numpy
+logger = logging.getLogger(__name__)
+from metadataviewer.dao.model import IDAO
+from metadataviewer.model import (Table, Column, Page, StrRenderer, IntRenderer,
+                                  FloatRenderer)
+from metadataviewer.model.constants import COLUMN_ID, ROW_INDEX_STEP
+from metadataviewer.model.page import _guessType, _convertValue
+
+DEFAULT_TABLE = 'data'
+SAMPLE_ROWS = 1000  # Rows used to guess the columns types
+INDEX_CHUNK_SIZE = 16 * 1024 * 1024  # Bytes read at once by the indexer
+NEWLINE = ord('\n')
+TYPES_ORDER = [int, float, str]
+DEFAULT_ENCODING = 'utf-8'
+FALLBACK_ENCODING = 'latin-1'  # Used if the sample rows are not valid UTF-8
+
+
+class CsvDao(IDAO):
+    """ DAO for the metadata viewer to read delimited text files (.csv and
+    .tsv) with a header line. The rows are available immediately: a
+    background thread indexes the offset of every Kth row while the first
+    pages are read, and the row count grows until the whole file is indexed.
+    Quoted values can not contain line breaks """
+    _compatibleExtensions = ['csv', 'tsv']
+    _indexStep = ROW_INDEX_STEP
+
+    def __init__(self, filename: str):
+        self.file = filename
+        self._fileSize = os.path.getsize(filename)
+        self._delimiter = None
+        self._encoding = DEFAULT_ENCODING
+        self._columns = None
+        self._types = None
+        self._dataOffset = 0
+        self._offsets = array('q')
+        self._rowCount = 0
+        self._indexedBytes = 0
+        self._indexed = False
+        self._condition = threading.Condition()
+        self._indexer = None
+        self._sortedIndexes = {}
+
+    @classmethod
+    def setIndexStep(cls, indexStep: int):
+        """Set the number of rows between two recorded offsets"""
+        cls._indexStep = indexStep
+
+    def _readHeader(self):
+        """Read the column names and guess the delimiter, the encoding and
+        the column types from a sample of rows"""
+        if self._columns is not None:
+            return
+
+        with open(self.file, 'rb') as csvFile:
+            header = csvFile.readline()
+            self._dataOffset = len(header)
+            sample = [csvFile.readline() for _ in range(SAMPLE_ROWS)]
+        try:
+            (header + b''.join(sample)).decode(DEFAULT_ENCODING)
+        except UnicodeDecodeError:
+            self._encoding = FALLBACK_ENCODING
+        header = self._decode(header)
+        sample = [self._decode(line) for line in sample]
+        sample = [line for line in sample if line.strip()]
+
+        if self.file.endswith('.tsv'):
+            self._delimiter = '\t'
+        else:
+            try:
+                dialect = csv.Sniffer().sniff(header + ''.join(sample[:10]),
+                                              delimiters=',;\t')
+                self._delimiter = dialect.delimiter
+            except csv.Error:
+                self._delimiter = ','
+
+        self._columns = next(csv.reader([header], delimiter=self._delimiter))
+        self._types = [int] * len(self._columns)
+        for values in csv.reader(sample, delimiter=self._delimiter):
+            for i, value in enumerate(values[:len(self._columns)]):
+                valueType = _guessType(value) if value else self._types[i]
+                self._types[i] = max(self._types[i], valueType,
+                                     key=TYPES_ORDER.index)
+
+    def _decode(self, line: bytes) -> str:
+        """Decode a line with the encoding of the file. Values that can't be
+        decoded (e.g. not present in the sample) are replaced"""
+        return line.decode(self._encoding, errors='replace')
+
+    def _startIndexing(self):
+        """Start the thread that indexes the rows"""
+        self._readHeader()
+        with self._condition:
+            if self._indexer is None:
+                self._indexer = threading.Thread(target=self._index, daemon=True,
+                                                 name='CsvIndexer')
+                self._indexer.start()
+
+    def _index(self):
+        """Find the start of every Kth row reading the file by chunks. The
+        row count is updated after every chunk"""
+        step = self._indexStep
+        rowStart = self._dataOffset
+        position = self._dataOffset
+        try:
+            with open(self.file, 'rb') as csvFile:
+                csvFile.seek(position)
+                while True:
+                    chunk = csvFile.read(INDEX_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    newlines = numpy.flatnonzero(numpy.frombuffer(chunk, numpy.uint8) == NEWLINE)
+                    newlines += position + 1
+                    position += len(chunk)
+                    # Starts of the rows ended in this chunk
+                    starts = numpy.concatenate(([rowStart], newlines[:-1]))
+                    if newlines.size:
+                        rowStart = int(newlines[-1])
+                    else:
+                        starts = starts[:0]
+                    with self._condition:
+                        firstIndexed = -self._rowCount % step
+                        self._offsets.frombytes(starts[firstIndexed::step].astype(numpy.int64).tobytes())
+                        self._rowCount += starts.size
+                        self._indexedBytes = position
+                        self._condition.notify_all()
+
+                # Last row without line break
+                csvFile.seek(rowStart)
+                if csvFile.read().strip():
+                    with self._condition:
+                        if self._rowCount % step == 0:
+                            self._offsets.append(rowStart)
+                        self._rowCount += 1
+        finally:
+            with self._condition:
+                self._indexed = True
+                self._condition.notify_all()
+            logger.debug("%s indexed: %d rows" % (self.file, self._rowCount))
+
+    def _waitForRows(self, rowCount: int) -> int:
+        """Wait until 'rowCount' rows (or the whole file) are indexed and
+        return the number of indexed rows"""
+        self._startIndexing()
+        with self._condition:
+            while not self._indexed and self._rowCount < rowCount:
+                self._condition.wait()
+            return self._rowCount
+
+    def waitForIndex(self) -> int:
+        """Wait until the whole file is indexed"""
+        return self._waitForRows(float('inf'))
+
+    def _iterLines(self, csvFile, firstRow: int):
+        """Iterate over the lines of the rows starting at 'firstRow'"""
+        step = self._indexStep
+        csvFile.seek(self._offsets[firstRow // step])
+        for _ in range(firstRow % step):
+            csvFile.readline()
+        for line in csvFile:
+            yield self._decode(line)
+
+    def _readRows(self, rows, columns=None) -> list:
+        """Read the given rows. 'rows' may be a range (read sequentially) or
+        any sequence of row numbers. Only the given column indexes are
+        converted (all of them if None)"""
+        if not len(rows):
+            return []
+
+        with open(self.file, 'rb') as csvFile:
+            if isinstance(rows, range):
+                # The file may be shorter than indexed (e.g. truncated)
+                lines = list(itertools.islice(self._iterLines(csvFile, rows.start),
+                                              len(rows)))
+            else:
+                # Missing rows are shown empty to keep the ids aligned
+                lines = [next(self._iterLines(csvFile, row), '') for row in rows]
+
+        return [self._convert(values, columns)
+                for values in csv.reader(lines, delimiter=self._delimiter)]
+
+    def _convert(self, values: list, columns=None) -> list:
+        values += [''] * (len(self._columns) - len(values))
+        if columns is None:
+            return [_convertValue(value, valueType) if value else value
+                    for value, valueType in zip(values, self._types)]
+        rowValues = [None] * len(self._columns)
+        for column in columns:
+            if column >= len(rowValues):
+                continue
+            value = values[column]
+            rowValues[column] = (_convertValue(value, self._types[column])
+                                 if value else value)
+        return rowValues
+
+    def _readColumns(self, columns: list, limit=None) -> list:
+        """Read the values of the given column indexes streaming the file"""
+        values = [[] for _ in columns]
+        with open(self.file, 'rb') as csvFile:
+            csvFile.seek(self._dataOffset)
+            textFile = io.TextIOWrapper(csvFile, encoding=self._encoding,
+                                        errors='replace', newline='')
+            for i, rowValues in enumerate(csv.reader(textFile, delimiter=self._delimiter)):
+                if limit is not None and i >= limit:
+                    break
+                for columnValues, column in zip(values, columns):
+                    value = rowValues[column] if column < len(rowValues) else ''
+                    columnValues.append(_convertValue(value, self._types[column])
+                                        if value else value)
+        return values
+
+    def fillPage(self, page: Page, actualColumn: str, orderAsc: bool) -> None:
+        pageNumber = page.getPageNumber()
+        pageSize = page.getPageSize()
+        firstRow = pageNumber * pageSize - pageSize
+        self.fillRange(page, firstRow, pageSize)
+
+    def supportsRandomAccess(self) -> bool:
+        return True
+
+    def fillRange(self, page: Page, firstRow: int, numberOfRows: int) -> None:
+        table = page.getTable()
+        sortedIndexes = self.getSortedIndexes(table.getSortingColumn(),
+                                              table.isSortingAsc(),
+                                              table.getName())
+        rowCount = self._waitForRows(firstRow + numberOfRows)
+        limit = min(firstRow + numberOfRows, rowCount)
+        firstRow = max(min(firstRow, limit), 0)
+
+        if sortedIndexes is None:
+            ids = range(firstRow, limit)
+        else:
+            ids = sortedIndexes[firstRow:limit].tolist()
+
+        page.addRows(zip(ids, self._readRows(ids, page.getProjection())))
+
+    def getSortedIndexes(self, column: str, orderAsc: bool = True,
+                         tableName: str = None):
+        """Return the permutation that sorts the rows by the given column or
+        None if the file order must be used. The column is read once and its
+        permutation is kept"""
+        self._readHeader()
+        if column not in self._columns:
+            return None
+
+        if column not in self._sortedIndexes:
+            # The permutation covers all the rows
+            self.waitForIndex()
+            logger.debug("Sorting %s by %s" % (self.file, column))
+            values, = self._readColumns([self._columns.index(column)])
+            if self._types[self._columns.index(column)] is not str:
+                values = [numpy.nan if value == '' else value for value in values]
+            self._sortedIndexes[column] = numpy.argsort(numpy.asarray(values),
+                                                        kind='stable')
+
+        sortedIndexes = self._sortedIndexes[column]
+        return sortedIndexes if orderAsc else sortedIndexes[::-1]
+
+    def fillTable(self, table: Table, objectManager) -> None:
+        self._readHeader()
+        renderers = {int: IntRenderer, float: FloatRenderer}
+        for name, valueType in zip(self._columns, self._types):
+            table.addColumn(Column(name=name,
+                                   renderer=renderers.get(valueType, StrRenderer)()))
+
+    def getTables(self) -> dict:
+        self._startIndexing()
+        return {DEFAULT_TABLE: Table(DEFAULT_TABLE)}
+
+    @classmethod
+    def addCompatibleFileType(cls, extension: str):
+        cls._compatibleExtensions.append(extension)
+
+    @classmethod
+    def getCompatibleFileTypes(cls) -> list:
+        return cls._compatibleExtensions
+
+    def getTableRowCount(self, tableName: str) -> int:
+        """Return the number of rows. While the file is being indexed it is
+        estimated from the mean size of the indexed rows"""
+        self._startIndexing()
+        with self._condition:
+            if self._indexed or not self._rowCount:
+                return self._rowCount
+            rowSize = (self._indexedBytes - self._dataOffset) / self._rowCount
+            return self._rowCount + int((self._fileSize - self._indexedBytes) / rowSize)
+
+    def isRowCountFinal(self, tableName: str) -> bool:
+        self._startIndexing()
+        return self._indexed
+
+    def getTableWithAdditionalInfo(self):
+        pass
+
+    def allowsConcurrentAccess(self) -> bool:
+        # Every read opens its own file
+        return True
+
+    def getRowIdsRange(self, tableName: str):
+        # The rows ids are their positions in the file
+        return 0, self.waitForIndex()
+
+    def getSelectedRangeRowsIds(self, tableName, startRow, numberOfRows, column, reverse=True) -> list:
+        """Return the ids of the rows placed between 'startRow' (starting at
+        1) and 'startRow' + 'numberOfRows' when the table is sorted by the
+        given column"""
+        size = self._waitForRows(startRow + numberOfRows + 1)
+        firstRow = min(max(startRow - 1, 0), size)
+        lastRow = min(firstRow + numberOfRows + 1, size)
+        sortedIndexes = self.getSortedIndexes(column, reverse, tableName)
+        if sortedIndexes is None:
+            return numpy.arange(firstRow, lastRow)
+        return sortedIndexes[firstRow:lastRow]
+
+    def getColumnsValues(self, tableName, columns, xAxis, selection, limit,
+                         useSelection, reverse=True):
+        """Return a dictionary with the values of the given columns (and the
+        row ids). The values are read streaming the file"""
+        self._readHeader()
+        columns = [column for column in columns if column in self._columns]
+        if xAxis and xAxis in self._columns and xAxis not in columns:
+            columns.append(xAxis)
+
+        ids = None
+        if useSelection and selection is not None and not selection.isEmpty():
+            ids = numpy.asarray(selection.getIds(), dtype=numpy.int64)
+            ids = ids[:limit] if limit else ids
+            limit = int(ids.max()) + 1 if ids.size else 0
+
+        values = self._readColumns([self._columns.index(column) for column in columns],
+                                   limit or None)
+        columnsValues = {}
+        for column, columnValues in zip(columns, values):
+            columnValues = numpy.asarray(columnValues)
+            columnsValues[column] = columnValues if ids is None else columnValues[ids]
+
+        if ids is None:
+            size = len(values[0]) if values else self.waitForIndex()
+            ids = numpy.arange(min(size, limit) if limit else size)
+        columnsValues[COLUMN_ID] = ids
+        return columnsValues
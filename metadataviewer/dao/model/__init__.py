@@ -70,5 +70,47 @@ class IDAO:
                          useSelection, reverse=True):
         pass
 
+    def supportsRandomAccess(self) -> bool:
+        """Return True if the DAO implements fillRange, so any range of rows
+        can be read without going through the pages"""
+        return False
 
+    def fillRange(self, page: Page, firstRow: int, numberOfRows: int) -> None:
+        """Fill the page with the rows in the range
+        [firstRow, firstRow + numberOfRows) of the table sorted as
+        indicated by the page table"""
+        raise NotImplementedError("%s does not support random access" % type(self).__name__)
 
+    def isColumnar(self) -> bool:
+        """Return True if the DAO implements getColumnsBlock"""
+        return False
+
+    def getColumnsBlock(self, table: Table, firstRow: int, numberOfRows: int,
+                        ids=None) -> tuple:
+        """Return a tuple (ids, columns) with the rows in the range
+        [firstRow, firstRow + numberOfRows) of the table (sorted as the
+        table indicates) or, if 'ids' is given, the rows with those ids.
+        'columns' is a list with a sequence of values (preferably a numpy
+        array) per table column"""
+        raise NotImplementedError("%s is not columnar" % type(self).__name__)
+
+    def isRowCountFinal(self, tableName: str) -> bool:
+        """Return False while getTableRowCount returns an estimation, e.g.
+        while the DAO is indexing the file in background"""
+        return True
+
+    def getTableDtype(self, tableName: str):
+        """Return the numpy dtype of the table rows or None if the DAO
+        doesn't know it"""
+        return None
+
+    def allowsConcurrentAccess(self) -> bool:
+        """Return True if the DAO can fill pages from a thread other than the
+        GUI one (needed to prefetch pages in background)"""
+        return False
+
+    def getRowIdsRange(self, tableName: str):
+        """Return the range (start, stop) of the rows ids if the table has
+        one row per id in it, so the selection can be inverted without
+        reading the ids. Return None if the ids must be read"""
+        return None
@@ -1,23 +1,157 @@
 import logging
+import os
+import struct
+import zipfile
+
 import numpy
 logger = logging.getLogger(__name__)
 from metadataviewer.dao.model import IDAO
 from metadataviewer.model import Table, Column, StrRenderer, IntRenderer, FloatRenderer,Page
+from metadataviewer.model.constants import MMAP_THRESHOLD, COLUMN_ID
+
+DEFAULT_TABLE = 'data'
+ZIP_LOCAL_HEADER_SIZE = 30
 
 
 class NumpyDao(IDAO):
     """ DAO for the metadata viewer to read numpy files """
-    _compatibleExtensions = ['npy']
+    _compatibleExtensions = ['npy', 'npz']
+    _useMmap = True
+    _mmapThreshold = MMAP_THRESHOLD
 
     def __init__(self, filename: str):
         self.file = filename
-        self._data = None
+        self._members = None
+        self._data = {}
+        self._headers = {}
+        self._sortedIndexes = {}
+
+    @classmethod
+    def setUseMmap(cls, useMmap: bool):
+        """Enable or disable the memory-mapped loading mode"""
+        cls._useMmap = useMmap
+
+    @classmethod
+    def setMmapThreshold(cls, threshold: int):
+        """Set the file size (in bytes) from which files are memory-mapped"""
+        cls._mmapThreshold = threshold
+
+    def isArchive(self) -> bool:
+        """Return True if the file is a .npz archive"""
+        if self._members is None:
+            self._members = {}
+            if zipfile.is_zipfile(self.file):
+                with zipfile.ZipFile(self.file) as archive:
+                    for info in archive.infolist():
+                        if info.filename.endswith('.npy'):
+                            self._members[info.filename[:-4]] = info
+        return bool(self._members)
+
+    def getTableNames(self) -> list:
+        """Return the names of the tables: the archive members or 'data'
+        for .npy files"""
+        return list(self._members) if self.isArchive() else [DEFAULT_TABLE]
+
+    def getData(self, tableName: str = None) -> numpy.ndarray:
+        tableName = tableName or self.getTableNames()[0]
+        if tableName not in self._data:
+            self._data[tableName] = self._load(tableName)
+
+        return self._data[tableName]
+
+    def getHeader(self, tableName: str = None) -> tuple:
+        """Return the shape and dtype of the table array. They are read from
+        the .npy header, so the data is not loaded"""
+        tableName = tableName or self.getTableNames()[0]
+        if tableName not in self._headers:
+            self._headers[tableName] = self._readHeader(tableName)
 
-    def getData(self) -> numpy.ndarray:
-        if self._data is None:
-            self._data = numpy.load(self.file)
+        return self._headers[tableName]
 
-        return self._data
+    def _readHeader(self, tableName: str) -> tuple:
+        if tableName not in self._data:
+            try:
+                with self._openMember(tableName) as npyFile:
+                    header = self._readArrayHeader(npyFile)
+                if header is not None:
+                    return header[0], header[2]
+            except ValueError as e:
+                logger.debug("The header of %s can not be read: %s" % (tableName, e))
+
+        # Other formats are loaded
+        data = self.getData(tableName)
+        return data.shape, data.dtype
+
+    def _openMember(self, tableName: str):
+        """Open the .npy file or the archive member of a table"""
+        if not self.isArchive():
+            return open(self.file, 'rb')
+        archive = zipfile.ZipFile(self.file)
+        try:
+            member = archive.open(self._members[tableName])
+        finally:
+            # The member keeps the file opened
+            archive.close()
+        return member
+
+    @staticmethod
+    def _readArrayHeader(npyFile):
+        """Read the header of an opened .npy file. Return a tuple
+        (shape, fortranOrder, dtype) or None for unknown versions"""
+        version = numpy.lib.format.read_magic(npyFile)
+        if version == (1, 0):
+            return numpy.lib.format.read_array_header_1_0(npyFile)
+        elif version == (2, 0):
+            return numpy.lib.format.read_array_header_2_0(npyFile)
+        return None
+
+    def _load(self, tableName: str) -> numpy.ndarray:
+        """Load a table. Files (or uncompressed archive members) larger than
+        the threshold are memory-mapped (read only) so only the touched
+        pages are read from disk"""
+        if not self.isArchive():
+            if self._useMmap and os.path.getsize(self.file) >= self._mmapThreshold:
+                try:
+                    logger.debug("Memory-mapping %s" % self.file)
+                    return numpy.load(self.file, mmap_mode='r')
+                except ValueError as e:
+                    # Arrays with python objects can not be memory-mapped
+                    logger.debug("The file can not be memory-mapped: %s" % e)
+
+            return numpy.load(self.file)
+
+        info = self._members[tableName]
+        if (self._useMmap and info.compress_type == zipfile.ZIP_STORED
+                and info.file_size >= self._mmapThreshold):
+            data = self._mapMember(info)
+            if data is not None:
+                return data
+
+        logger.debug("Loading %s from %s" % (tableName, self.file))
+        with numpy.load(self.file) as archive:
+            return archive[tableName]
+
+    def _mapMember(self, info: zipfile.ZipInfo):
+        """Memory-map an uncompressed archive member. Its data starts after
+        the zip local header and the .npy header"""
+        with open(self.file, 'rb') as npzFile:
+            npzFile.seek(info.header_offset)
+            localHeader = npzFile.read(ZIP_LOCAL_HEADER_SIZE)
+            nameLength, extraLength = struct.unpack('<HH', localHeader[26:30])
+            npzFile.seek(info.header_offset + ZIP_LOCAL_HEADER_SIZE
+                         + nameLength + extraLength)
+            try:
+                header = self._readArrayHeader(npzFile)
+            except ValueError:
+                header = None
+            if header is None or header[2].hasobject:
+                return None
+            offset = npzFile.tell()
+
+        shape, fortranOrder, dtype = header
+        logger.debug("Memory-mapping %s from %s" % (info.filename, self.file))
+        return numpy.memmap(self.file, dtype=dtype, mode='r', offset=offset,
+                            shape=shape, order='F' if fortranOrder else 'C')
 
     def fillPage(self, page: Page, actualColumn: str, orderAsc: bool) -> None:
 
@@ -25,33 +159,95 @@ class NumpyDao(IDAO):
         pageNumber = page.getPageNumber()
         pageSize = page.getPageSize()
         firstRow = pageNumber * pageSize - pageSize
-        data = self.getData()
-        limit = min(firstRow+pageSize, data.size)
+        self.fillRange(page, firstRow, pageSize)
+
+    def supportsRandomAccess(self) -> bool:
+        return True
+
+    def fillRange(self, page: Page, firstRow: int, numberOfRows: int) -> None:
         table = page.getTable()
+        data = self.getData(table.getName())
+        limit = min(firstRow + numberOfRows, data.size)
+        firstRow = min(firstRow, limit)
+
+        sortedIndexes = self.getSortedIndexes(table.getSortingColumn(),
+                                              table.isSortingAsc(),
+                                              table.getName())
+
+        # Only the projected fields are read
+        names = data.dtype.names
+        projection = page.getProjection()
+        fields = [field for index, field in enumerate(names)
+                  if projection is None or index in projection]
+        if projection is not None:
+            data = data[fields]
+
+        # Reading the whole page at once
+        if sortedIndexes is None:
+            ids = numpy.arange(firstRow, limit)
+            pageData = data[firstRow:limit]
+        else:
+            ids = sortedIndexes[firstRow:limit]
+            pageData = data[ids]
+
+        # Every field is copied, so the page never keeps a view of the data
+        columns = [numpy.ascontiguousarray(pageData[field]) if field in fields else None
+                   for field in names]
+        page.addColumns(ids, columns)
+
+    def getTableDtype(self, tableName: str):
+        return self.getHeader(tableName)[1]
+
+    def isColumnar(self) -> bool:
+        return True
+
+    def getColumnsBlock(self, table: Table, firstRow: int, numberOfRows: int,
+                        ids=None) -> tuple:
+        data = self.getData(table.getName())
+        if ids is not None:
+            ids = numpy.asarray(ids, dtype=numpy.int64)
+            block = data[ids]
+        else:
+            limit = min(firstRow + numberOfRows, data.size)
+            sortedIndexes = self.getSortedIndexes(table.getSortingColumn(),
+                                                  table.isSortingAsc(),
+                                                  table.getName())
+            if sortedIndexes is None:
+                ids = numpy.arange(firstRow, limit)
+                block = data[firstRow:limit]
+            else:
+                ids = sortedIndexes[firstRow:limit]
+                block = data[ids]
+
+        return ids, [block[field] for field in data.dtype.names]
 
-        # If sorting changed
-        if table.hasSortingChanged():
-            # do the sorting
-            sortingColIdx = table.getColumnIndexFromLabel(table.getSortingColumn())
-            sortingCol = data.dtype.descr[sortingColIdx][0]
-            data.sort(order=sortingCol)
+    def getSortedIndexes(self, column: str, orderAsc: bool = True,
+                         tableName: str = None):
+        """Return the permutation that sorts the data by the given column or
+        None if the natural order must be used. The data is never sorted in
+        place: one permutation is computed (and kept) per column, and the
+        descending order is a reversed view of the ascending one"""
+        data = self.getData(tableName)
+        if column not in (data.dtype.names or ()) or data[column].ndim != 1:
+            return None
 
-            if table.isSortingAsc():
-                data = numpy.flipud(data)
+        key = (tableName or self.getTableNames()[0], column)
+        if key not in self._sortedIndexes:
+            logger.debug("Sorting the data by %s" % column)
+            self._sortedIndexes[key] = numpy.argsort(data[column], kind='stable')
 
-        for i in range(firstRow, limit):
-            row = data[i]
-            values = [value for value in row]
-            id = i
-            page.addRow((int(id), values))
+        sortedIndexes = self._sortedIndexes[key]
+        return sortedIndexes if orderAsc else sortedIndexes[::-1]
 
     def fillTable(self, table: Table, objectManager) -> None:
 
-        for descr in self.getData().dtype.descr:
+        for descr in self.getHeader(table.getName())[1].descr:
             field, fType = descr[0], descr[1]
-            if len(descr) == 3:
-                fType = "S"
             newCol = Column(name=field, renderer=self.getRenderer(fType))
+            if len(descr) == 3:
+                # Sub-arrays are shown as strings and can not be sorted
+                newCol = Column(name=field, renderer=self.getRenderer("S"))
+                newCol.setIsSorteable(False)
             table.addColumn(newCol)
 
     def getRenderer(self, fType):
@@ -63,7 +259,7 @@ class NumpyDao(IDAO):
             return StrRenderer()
 
     def getTables(self):
-        return {"data": Table("data")}
+        return {tableName: Table(tableName) for tableName in self.getTableNames()}
 
     @classmethod
     def addCompatibleFileType(cls, extension: str):
@@ -75,10 +271,52 @@ class NumpyDao(IDAO):
         return cls._compatibleExtensions
 
     def getTableRowCount(self, tableName: str) -> int:
-        return self.getData().size
+        return int(numpy.prod(self.getHeader(tableName)[0]))
 
     def getTableWithAdditionalInfo(self):
         pass
 
+    def allowsConcurrentAccess(self) -> bool:
+        return True
+
+    def getRowIdsRange(self, tableName: str):
+        # The rows ids are their positions in the array
+        return 0, self.getTableRowCount(tableName)
+
     def getSelectedRangeRowsIds(self, tableName, startRow, numberOfRows, column, reverse=True) -> list:
-        pass
+        """Return the ids of the rows placed between 'startRow' (starting at
+        1) and 'startRow' + 'numberOfRows' when the table is sorted by the
+        given column"""
+        size = self.getData(tableName).size
+        firstRow = min(max(startRow - 1, 0), size)
+        lastRow = min(firstRow + numberOfRows + 1, size)
+        sortedIndexes = self.getSortedIndexes(column, reverse, tableName)
+        if sortedIndexes is None:
+            return numpy.arange(firstRow, lastRow)
+        return sortedIndexes[firstRow:lastRow]
+
+    def getColumnsValues(self, tableName, columns, xAxis, selection, limit,
+                         useSelection, reverse=True):
+        """Return a dictionary with the values of the given columns (and the
+        row ids). Without selection the values are views of the data, so no
+        copy is made"""
+        data = self.getData(tableName)
+        columns = list(columns)
+        if xAxis and xAxis not in columns:
+            columns.append(xAxis)
+
+        if useSelection and selection is not None and not selection.isEmpty():
+            ids = numpy.asarray(selection.getIds(), dtype=numpy.int64)
+            ids = ids[:limit] if limit else ids
+            rows = ids
+        else:
+            size = min(limit, data.size) if limit else data.size
+            ids = numpy.arange(size)
+            rows = slice(0, size)
+
+        columnsValues = {COLUMN_ID: ids}
+        for column in columns:
+            if column in data.dtype.names:
+                columnsValues[column] = data[column][rows]
+
+        return columnsValues
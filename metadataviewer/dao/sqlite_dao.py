@@ -0,0 +1,309 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from urllib.request import pathname2url
+
+import numpy
+logger = logging.getLogger(__name__)
+from metadataviewer.dao.model import IDAO
+from metadataviewer.model import (Table, Column, Page, StrRenderer, IntRenderer,
+                                  FloatRenderer, BoolRenderer, MatrixRender)
+from metadataviewer.model.constants import COLUMN_ID
+
+OBJECTS_TABLE = 'Objects'
+CLASSES_TABLE = 'Classes'
+PROPERTIES_TABLE = 'Properties'
+
+RENDERERS = {'Integer': IntRenderer,
+             'Float': FloatRenderer,
+             'Boolean': BoolRenderer,
+             'Matrix': MatrixRender}
+NUMERIC_TYPES = ('Integer', 'Float', 'Boolean')
+
+
+class SqliteTable:
+    """Description of a table of a Scipion set: its sql table, the column
+    used as row id and the (name, sql column, type) of every column"""
+    def __init__(self, name, sqlName, idColumn, columns):
+        self.name = name
+        self.sqlName = sqlName
+        self.idColumn = idColumn
+        self.columns = columns
+        self.rowCount = None
+        self.minId = None
+        self.maxId = None
+
+    def getSqlColumn(self, columnName):
+        for name, sqlColumn, _ in self.columns:
+            if name == columnName:
+                return sqlColumn
+        return None
+
+    def getColumnType(self, columnName):
+        for name, _, columnType in self.columns:
+            if name == columnName:
+                return columnType
+        return None
+
+    def hasContiguousIds(self):
+        """Return True if the row at position i has the id minId + i"""
+        return self.rowCount == 0 or self.maxId - self.minId + 1 == self.rowCount
+
+
+class SqliteDao(IDAO):
+    """ DAO for the metadata viewer to read Scipion sets stored in sqlite
+    files. The database is opened in read-only mode (optionally immutable,
+    see setImmutable). Pages are read with keyset pagination: sorted columns
+    get a temporary table with the row ranks the first time they are used,
+    so any page is a primary key range"""
+    _compatibleExtensions = ['sqlite']
+    _immutable = False
+
+    def __init__(self, filename: str):
+        self.file = filename
+        self._connection = None
+        self._tables = None
+        self._rankTables = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def setImmutable(cls, immutable: bool):
+        """Open the databases as immutable (no locks at all) or only as
+        read-only. Immutable databases must not change while they are open
+        (e.g. sets of a running protocol), otherwise sqlite may return wrong
+        results or report them as corrupted"""
+        cls._immutable = immutable
+
+    def getConnection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            uri = 'file:%s?mode=ro' % pathname2url(os.path.abspath(self.file))
+            if self._immutable:
+                uri += '&immutable=1'
+            self._connection = sqlite3.connect(uri, uri=True,
+                                               check_same_thread=False)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            self._rankTables.clear()
+
+    def _execute(self, query, params=()) -> list:
+        """Run a query and return all its rows. The connection is shared by
+        the GUI and the worker threads"""
+        logger.debug("%s %s" % (query, params))
+        with self._lock:
+            return self.getConnection().execute(query, params).fetchall()
+
+    def getSqlTables(self) -> dict:
+        if self._tables is None:
+            self._tables = self._readSqlTables()
+
+        return self._tables
+
+    def getSqlTable(self, tableName: str) -> SqliteTable:
+        return self.getSqlTables()[tableName]
+
+    def _readSqlTables(self) -> dict:
+        """Find the Objects tables (and their Classes tables with the column
+        labels) and the Properties table"""
+        sqlTables = [row[0] for row in
+                     self._execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        tables = {}
+        for sqlName in sqlTables:
+            if not sqlName.endswith(OBJECTS_TABLE):
+                continue
+            prefix = sqlName[:-len(OBJECTS_TABLE)]
+            if prefix + CLASSES_TABLE not in sqlTables:
+                continue
+            name = prefix.rstrip('_') or OBJECTS_TABLE.lower()
+            existingColumns = {row[1] for row in
+                               self._execute('PRAGMA table_info("%s")' % sqlName)}
+            columns = [(COLUMN_ID, 'id', 'Integer')]
+            if 'enabled' in existingColumns:
+                columns.append(('enabled', 'enabled', 'Boolean'))
+            query = ('SELECT label_property, column_name, class_name FROM "%s" '
+                     'ORDER BY id' % (prefix + CLASSES_TABLE))
+            for label, sqlColumn, className in self._execute(query):
+                if sqlColumn in existingColumns:
+                    columns.append((label, sqlColumn, className))
+            tables[name] = SqliteTable(name, sqlName, 'id', columns)
+
+        if PROPERTIES_TABLE in sqlTables:
+            name = PROPERTIES_TABLE.lower()
+            tables[name] = SqliteTable(name, PROPERTIES_TABLE, 'rowid',
+                                       [('key', 'key', 'String'),
+                                        ('value', 'value', 'String')])
+        return tables
+
+    def _loadCounts(self, sqlTable: SqliteTable):
+        if sqlTable.rowCount is None:
+            query = 'SELECT COUNT(*), MIN({0}), MAX({0}) FROM "{1}"'.format(
+                sqlTable.idColumn, sqlTable.sqlName)
+            sqlTable.rowCount, sqlTable.minId, sqlTable.maxId = self._execute(query)[0]
+
+    def _getRankTable(self, sqlTable: SqliteTable, sqlColumn: str) -> str:
+        """Return a temporary table with the row ids sorted by a column. The
+        rank is its primary key, so a page is found by a key range.
+
+        The database is read-only, so the sorting column can not be indexed.
+        Building the table sorts all the rows once (O(n log n), a couple of
+        seconds per million rows) and it takes about 20 bytes per row of
+        sqlite temporary storage. It is kept until the DAO is closed, so
+        every sorted column costs it once"""
+        key = (sqlTable.name, sqlColumn)
+        with self._lock:
+            if key not in self._rankTables:
+                self._rankTables[key] = self._createRankTable(sqlTable, sqlColumn)
+        return self._rankTables[key]
+
+    def _createRankTable(self, sqlTable: SqliteTable, sqlColumn: str) -> str:
+        rankTable = 'rank%d' % len(self._rankTables)
+        logger.debug("Indexing %s by %s" % (sqlTable.name, sqlColumn))
+        self._execute('CREATE TEMP TABLE %s (rank INTEGER PRIMARY KEY, id INTEGER)'
+                      % rankTable)
+        self._execute('INSERT INTO {0} (id) SELECT {1} FROM "{2}" ORDER BY {3}, {1}'.format(
+            rankTable, sqlTable.idColumn, sqlTable.sqlName, sqlColumn))
+        return rankTable
+
+    def _selectRange(self, sqlTable: SqliteTable, sqlColumns: list, column: str,
+                     orderAsc: bool, firstRow: int, numberOfRows: int):
+        """Return the rows with the given sql columns of the rows in the
+        range [firstRow, firstRow + numberOfRows) when the table is sorted by
+        'column'. The range is a key range, never an OFFSET scan"""
+        self._loadCounts(sqlTable)
+        sqlColumn = sqlTable.getSqlColumn(column)
+        idColumn = sqlTable.idColumn
+        columns = ', '.join('o.%s' % col for col in [idColumn] + sqlColumns)
+
+        if sqlColumn in (None, 'id') and sqlTable.hasContiguousIds():
+            if orderAsc or sqlColumn is None:
+                query = 'SELECT %s FROM "%s" o WHERE o.%s >= ? ORDER BY o.%s LIMIT ?'
+                firstId = sqlTable.minId + firstRow if sqlTable.rowCount else 0
+            else:
+                query = 'SELECT %s FROM "%s" o WHERE o.%s <= ? ORDER BY o.%s DESC LIMIT ?'
+                firstId = sqlTable.maxId - firstRow if sqlTable.rowCount else 0
+            return self._execute(query % (columns, sqlTable.sqlName, idColumn, idColumn),
+                                 (firstId, numberOfRows))
+
+        rankTable = self._getRankTable(sqlTable, sqlColumn or idColumn)
+        if orderAsc or sqlColumn is None:
+            query = ('SELECT %s FROM %s r JOIN "%s" o ON o.%s = r.id '
+                     'WHERE r.rank > ? ORDER BY r.rank LIMIT ?')
+            firstRank = firstRow
+        else:
+            query = ('SELECT %s FROM %s r JOIN "%s" o ON o.%s = r.id '
+                     'WHERE r.rank <= ? ORDER BY r.rank DESC LIMIT ?')
+            firstRank = sqlTable.rowCount - firstRow
+        return self._execute(query % (columns, rankTable, sqlTable.sqlName, idColumn),
+                             (firstRank, numberOfRows))
+
+    def fillPage(self, page: Page, actualColumn: str, orderAsc: bool) -> None:
+        pageNumber = page.getPageNumber()
+        pageSize = page.getPageSize()
+        firstRow = pageNumber * pageSize - pageSize
+        self.fillRange(page, firstRow, pageSize)
+
+    def supportsRandomAccess(self) -> bool:
+        return True
+
+    def fillRange(self, page: Page, firstRow: int, numberOfRows: int) -> None:
+        table = page.getTable()
+        sqlTable = self.getSqlTable(table.getName())
+        sqlColumns = [sqlColumn for _, sqlColumn, _ in sqlTable.columns]
+        projection = page.getProjection()
+        if projection is not None:
+            # Only the projected columns are selected
+            sqlColumns = [sqlColumns[index] for index in projection
+                          if index < len(sqlColumns)]
+        rows = self._selectRange(sqlTable, sqlColumns, table.getSortingColumn(),
+                                 table.isSortingAsc(), max(firstRow, 0),
+                                 numberOfRows)
+        columnsCount = len(sqlTable.columns)
+        page.addRows((row[0], page.projectValues(list(row[1:]), columnsCount))
+                     for row in rows)
+
+    def fillTable(self, table: Table, objectManager) -> None:
+        sqlTable = self.getSqlTable(table.getName())
+        for name, _, columnType in sqlTable.columns:
+            renderer = RENDERERS.get(columnType, StrRenderer)()
+            column = Column(name=name, renderer=renderer)
+            if columnType == 'Matrix':
+                column.setIsSorteable(False)
+            table.addColumn(column)
+
+    def getTables(self) -> dict:
+        return {name: Table(name) for name in self.getSqlTables()}
+
+    @classmethod
+    def addCompatibleFileType(cls, extension: str):
+        cls._compatibleExtensions.append(extension)
+
+    @classmethod
+    def getCompatibleFileTypes(cls) -> list:
+        return cls._compatibleExtensions
+
+    def getTableRowCount(self, tableName: str) -> int:
+        sqlTable = self.getSqlTable(tableName)
+        self._loadCounts(sqlTable)
+        return sqlTable.rowCount
+
+    def getTableWithAdditionalInfo(self):
+        pass
+
+    def allowsConcurrentAccess(self) -> bool:
+        return True
+
+    def getRowIdsRange(self, tableName: str):
+        sqlTable = self.getSqlTable(tableName)
+        self._loadCounts(sqlTable)
+        if not sqlTable.rowCount:
+            return 0, 0
+        if not sqlTable.hasContiguousIds():
+            return None
+        return sqlTable.minId, sqlTable.maxId + 1
+
+    def getSelectedRangeRowsIds(self, tableName, startRow, numberOfRows, column, reverse=True) -> list:
+        """Return the ids of the rows placed between 'startRow' (starting at
+        1) and 'startRow' + 'numberOfRows' when the table is sorted by the
+        given column"""
+        sqlTable = self.getSqlTable(tableName)
+        rows = self._selectRange(sqlTable, [], column, reverse,
+                                 max(startRow - 1, 0), numberOfRows + 1)
+        return numpy.fromiter((row[0] for row in rows), dtype=numpy.int64)
+
+    def getColumnsValues(self, tableName, columns, xAxis, selection, limit,
+                         useSelection, reverse=True):
+        """Return a dictionary with the values of the given columns (and the
+        row ids) read with a single query"""
+        sqlTable = self.getSqlTable(tableName)
+        columns = [column for column in columns if sqlTable.getSqlColumn(column)]
+        if xAxis and sqlTable.getSqlColumn(xAxis) and xAxis not in columns:
+            columns.append(xAxis)
+
+        sqlColumns = [sqlTable.idColumn] + [sqlTable.getSqlColumn(column)
+                                            for column in columns]
+        query = 'SELECT %s FROM "%s"' % (', '.join(sqlColumns), sqlTable.sqlName)
+        params = []
+        if useSelection and selection is not None and not selection.isEmpty():
+            ids = selection.getIds()
+            ids = ids[:limit] if limit else ids
+            query += ' WHERE %s IN (SELECT value FROM json_each(?))' % sqlTable.idColumn
+            params.append(json.dumps([int(rowId) for rowId in ids]))
+        query += ' ORDER BY %s LIMIT ?' % sqlTable.idColumn
+        params.append(limit or -1)
+
+        rows = self._execute(query, params)
+        values = list(zip(*rows)) or [()] * len(sqlColumns)
+        columnsValues = {COLUMN_ID: numpy.asarray(values[0], dtype=numpy.int64)}
+        for column, columnValues in zip(columns, values[1:]):
+            if sqlTable.getColumnType(column) in NUMERIC_TYPES:
+                # None values are converted to nan
+                columnsValues[column] = numpy.array(columnValues, dtype=float)
+            else:
+                columnsValues[column] = numpy.asarray(columnValues)
+
+        return columnsValues
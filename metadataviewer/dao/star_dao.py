@@ -0,0 +1,347 @@
+import logging
+import shlex
+from array import array
+
+import numpy
+logger = logging.getLogger(__name__)
+from metadataviewer.dao.model import IDAO
+from metadataviewer.model import Table, Page
+from metadataviewer.model.constants import COLUMN_ID, ROW_INDEX_STEP
+from metadataviewer.model.page import _guessType, _convertValue
+
+DEFAULT_TABLE = 'data'
+END_OF_ROWS = (b'data_', b'loop_', b'_')
+COMMENT = ord('#')
+
+
+class TextBlock:
+    """Table of a text metadata file. Only the offset of every Kth row is
+    kept, the rows are read from the file when they are requested"""
+    def __init__(self, name):
+        self.name = name
+        self.labels = []
+        self.values = []  # Values of the blocks without loop
+        self.types = None
+        self.rowCount = 0
+        self.offsets = array('q')
+        self.isLoop = False
+
+
+class StarDao(IDAO):
+    """ DAO for the metadata viewer to read STAR files. The file is scanned
+    once recording the byte offset of every Kth row of each data block, so
+    pages are read seeking straight to them """
+    _compatibleExtensions = ['star']
+    _indexStep = ROW_INDEX_STEP
+
+    def __init__(self, filename: str):
+        self.file = filename
+        self._blocks = None
+        self._sortedIndexes = {}
+
+    @classmethod
+    def setIndexStep(cls, indexStep: int):
+        """Set the number of rows between two recorded offsets"""
+        cls._indexStep = indexStep
+
+    def getBlocks(self) -> dict:
+        if self._blocks is None:
+            self._blocks = self._scan()
+
+        return self._blocks
+
+    def getBlock(self, tableName: str) -> TextBlock:
+        return self.getBlocks()[tableName]
+
+    def _scan(self) -> dict:
+        """Read the file once, line by line, finding the blocks, their labels
+        and the offsets of the rows"""
+        logger.debug("Indexing %s" % self.file)
+        blocks = {}
+        block = None
+        inLabels = inRows = False
+        step = self._indexStep
+        offset = 0
+        with open(self.file, 'rb') as textFile:
+            for line in textFile:
+                lineOffset = offset
+                offset += len(line)
+                stripped = line.strip()
+                if inRows:
+                    if stripped and not stripped.startswith(END_OF_ROWS):
+                        if stripped[0] != COMMENT:
+                            if block.rowCount % step == 0:
+                                block.offsets.append(lineOffset)
+                            block.rowCount += 1
+                        continue
+                    inRows = False
+
+                if not stripped or stripped[0] == COMMENT:
+                    continue
+                elif stripped.startswith(b'data_'):
+                    block = TextBlock(self._getBlockName(stripped[5:].decode(), blocks))
+                    blocks[block.name] = block
+                    inLabels = False
+                elif block is None:
+                    continue
+                elif stripped.startswith(b'loop_'):
+                    if block.isLoop:
+                        logger.debug("Block %s has several loops, only the last one "
+                                     "is read" % block.name)
+                    block.isLoop = inLabels = True
+                    block.labels, block.values = [], []
+                    block.offsets, block.rowCount, block.types = array('q'), 0, None
+                elif stripped.startswith(b'_'):
+                    label, *value = stripped.decode().split(None, 1)
+                    label = self.getColumnName(label)
+                    if inLabels:
+                        block.labels.append(label)
+                    elif not block.isLoop:
+                        block.labels.append(label)
+                        block.values.append(value[0] if value else '')
+                        block.rowCount = 1
+                elif inLabels:
+                    # First row of the loop
+                    inLabels, inRows = False, True
+                    block.offsets.append(lineOffset)
+                    block.rowCount = 1
+
+        for block in blocks.values():
+            if not block.isLoop and block.values:
+                block.values = [self._unquote(value) for value in block.values]
+                block.types = [_guessType(value) for value in block.values]
+
+        return {name: block for name, block in blocks.items() if block.labels}
+
+    @staticmethod
+    def _getBlockName(name, blocks):
+        name = name or DEFAULT_TABLE
+        uniqueName, count = name, 1
+        while uniqueName in blocks:
+            count += 1
+            uniqueName = '%s_%d' % (name, count)
+        return uniqueName
+
+    @staticmethod
+    def getColumnName(label: str) -> str:
+        """Return the column name of a label (without the leading '_')"""
+        return label[1:]
+
+    @staticmethod
+    def _unquote(value):
+        if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+            return value[1:-1]
+        return value
+
+    @staticmethod
+    def _splitLine(line: bytes) -> list:
+        line = line.decode()
+        if '"' in line or "'" in line:
+            return shlex.split(line)
+        return line.split()
+
+    def _parseLine(self, block: TextBlock, line: bytes, columns=None) -> list:
+        """Split a row line and convert its values"""
+        values = self._splitLine(line)
+        if block.types is None:
+            block.types = [_guessType(value) for value in values]
+        return self._convert(values, block.types, columns)
+
+    @staticmethod
+    def _convert(values: list, types: list, columns=None) -> list:
+        """Convert the values to the column types (guessed from the first
+        row). If the column indexes are given, the other values are None.
+        Missing values (e.g. in truncated rows) are empty"""
+        values = values + [''] * (len(types) - len(values))
+        if columns is None:
+            return [_convertValue(value, valueType)
+                    for value, valueType in zip(values, types)]
+        rowValues = [None] * len(types)
+        for column in columns:
+            if column < len(values):
+                rowValues[column] = _convertValue(values[column], types[column])
+        return rowValues
+
+    def _iterLines(self, textFile, block: TextBlock, firstRow: int = 0):
+        """Iterate over the row lines of a block starting at 'firstRow'. The
+        file is placed at the closest recorded offset"""
+        step = self._indexStep
+        textFile.seek(block.offsets[firstRow // step])
+        skip = firstRow % step
+        for line in textFile:
+            stripped = line.strip()
+            if not stripped or stripped.startswith(END_OF_ROWS):
+                return
+            if stripped[0] == COMMENT:
+                continue
+            if skip:
+                skip -= 1
+                continue
+            yield stripped
+
+    def _readRows(self, block: TextBlock, rows, columns=None) -> list:
+        """Read the given rows of a block. 'rows' may be a range (read
+        sequentially) or any sequence of row numbers. Only the given column
+        indexes are converted (all of them if None)"""
+        if not block.isLoop:
+            return [self._convert(block.values, block.types, columns) for _ in rows]
+
+        values = []
+        with open(self.file, 'rb') as textFile:
+            if isinstance(rows, range):
+                if len(rows):
+                    for line in self._iterLines(textFile, block, rows.start):
+                        values.append(self._parseLine(block, line, columns))
+                        if len(values) == len(rows):
+                            break
+            else:
+                for row in rows:
+                    line = next(self._iterLines(textFile, block, row), None)
+                    if line is None:
+                        # Missing rows are shown empty to keep the ids aligned
+                        types = block.types or [str] * len(block.labels)
+                        values.append(self._convert([], types, columns))
+                    else:
+                        values.append(self._parseLine(block, line, columns))
+        return values
+
+    def _readColumns(self, block: TextBlock, columns: list, limit=None) -> list:
+        """Read the values of the given column indexes streaming the block"""
+        values = [[] for _ in columns]
+        if not block.isLoop:
+            rowValues = self._convert(block.values, block.types)
+            for columnValues, column in zip(values, columns):
+                columnValues.append(rowValues[column])
+            return values
+
+        if not block.rowCount:
+            return values
+
+        with open(self.file, 'rb') as textFile:
+            for i, line in enumerate(self._iterLines(textFile, block)):
+                if limit is not None and i >= limit:
+                    break
+                if block.types is None:
+                    self._parseLine(block, line)
+                # Only the requested values are converted
+                rowValues = self._splitLine(line)
+                rowValues += [''] * (len(block.types) - len(rowValues))
+                for columnValues, column in zip(values, columns):
+                    columnValues.append(_convertValue(rowValues[column],
+                                                      block.types[column]))
+        return values
+
+    def fillPage(self, page: Page, actualColumn: str, orderAsc: bool) -> None:
+        pageNumber = page.getPageNumber()
+        pageSize = page.getPageSize()
+        firstRow = pageNumber * pageSize - pageSize
+        self.fillRange(page, firstRow, pageSize)
+
+    def supportsRandomAccess(self) -> bool:
+        return True
+
+    def fillRange(self, page: Page, firstRow: int, numberOfRows: int) -> None:
+        table = page.getTable()
+        block = self.getBlock(table.getName())
+        limit = min(firstRow + numberOfRows, block.rowCount)
+        firstRow = max(min(firstRow, limit), 0)
+
+        sortedIndexes = self.getSortedIndexes(table.getSortingColumn(),
+                                              table.isSortingAsc(),
+                                              table.getName())
+        if sortedIndexes is None:
+            ids = range(firstRow, limit)
+        else:
+            ids = sortedIndexes[firstRow:limit].tolist()
+
+        page.addRows(zip(ids, self._readRows(block, ids, page.getProjection())))
+
+    def getSortedIndexes(self, column: str, orderAsc: bool = True,
+                         tableName: str = None):
+        """Return the permutation that sorts the block rows by the given
+        column or None if the file order must be used. The column is read
+        once and its permutation is kept"""
+        block = self.getBlock(tableName or next(iter(self.getBlocks())))
+        if column not in block.labels or block.rowCount < 2:
+            return None
+
+        key = (block.name, column)
+        if key not in self._sortedIndexes:
+            logger.debug("Sorting %s by %s" % (block.name, column))
+            values, = self._readColumns(block, [block.labels.index(column)])
+            self._sortedIndexes[key] = numpy.argsort(numpy.asarray(values),
+                                                     kind='stable')
+
+        sortedIndexes = self._sortedIndexes[key]
+        return sortedIndexes if orderAsc else sortedIndexes[::-1]
+
+    def fillTable(self, table: Table, objectManager) -> None:
+        block = self.getBlock(table.getName())
+        firstValues = self._readRows(block, range(min(block.rowCount, 1)))
+        values = [str(value) for value in firstValues[0]] if firstValues else []
+        values += [None] * (len(block.labels) - len(values))
+        table.createColumns(block.labels, values)
+
+    def getTables(self) -> dict:
+        return {name: Table(name) for name in self.getBlocks()}
+
+    @classmethod
+    def addCompatibleFileType(cls, extension: str):
+        cls._compatibleExtensions.append(extension)
+
+    @classmethod
+    def getCompatibleFileTypes(cls) -> list:
+        return cls._compatibleExtensions
+
+    def getTableRowCount(self, tableName: str) -> int:
+        return self.getBlock(tableName).rowCount
+
+    def getTableWithAdditionalInfo(self):
+        pass
+
+    def allowsConcurrentAccess(self) -> bool:
+        # Every read opens its own file
+        return True
+
+    def getRowIdsRange(self, tableName: str):
+        # The rows ids are their positions in the block
+        return 0, self.getTableRowCount(tableName)
+
+    def getSelectedRangeRowsIds(self, tableName, startRow, numberOfRows, column, reverse=True) -> list:
+        """Return the ids of the rows placed between 'startRow' (starting at
+        1) and 'startRow' + 'numberOfRows' when the table is sorted by the
+        given column"""
+        size = self.getTableRowCount(tableName)
+        firstRow = min(max(startRow - 1, 0), size)
+        lastRow = min(firstRow + numberOfRows + 1, size)
+        sortedIndexes = self.getSortedIndexes(column, reverse, tableName)
+        if sortedIndexes is None:
+            return numpy.arange(firstRow, lastRow)
+        return sortedIndexes[firstRow:lastRow]
+
+    def getColumnsValues(self, tableName, columns, xAxis, selection, limit,
+                         useSelection, reverse=True):
+        """Return a dictionary with the values of the given columns (and the
+        row ids). The values are read streaming the block"""
+        block = self.getBlock(tableName)
+        columns = [column for column in columns if column in block.labels]
+        if xAxis and xAxis in block.labels and xAxis not in columns:
+            columns.append(xAxis)
+
+        ids = None
+        if useSelection and selection is not None and not selection.isEmpty():
+            ids = numpy.asarray(selection.getIds(), dtype=numpy.int64)
+            ids = ids[:limit] if limit else ids
+            limit = int(ids.max()) + 1 if ids.size else 0
+
+        values = self._readColumns(block, [block.labels.index(column) for column in columns],
+                                   limit or None)
+        columnsValues = {}
+        for column, columnValues in zip(columns, values):
+            columnValues = numpy.asarray(columnValues)
+            columnsValues[column] = columnValues if ids is None else columnValues[ids]
+
+        if ids is None:
+            ids = numpy.arange(min(limit, block.rowCount) if limit else block.rowCount)
+        columnsValues[COLUMN_ID] = ids
+        return columnsValues
@@ -0,0 +1,11 @@
+import logging
+logger = logging.getLogger(__name__)
+from metadataviewer.dao.star_dao import StarDao
+
+
+class XmdDao(StarDao):
+    """ DAO for the metadata viewer to read Xmipp metadata (.xmd) files.
+    They follow the STAR syntax (data_ blocks with loop_ or label-value
+    pairs), so the blocks and row offsets are indexed in a single streaming
+    pass like in StarDao """
+    _compatibleExtensions = ['xmd']
@@ -115,6 +115,9 @@ DEFAULT_STATUS_BAR_HEIGHT = 30
 MAX_ITEMS_INDEX = 8000000
 DEFAULT_BINS = 50
 LIMIT_ROWS = 100000
+ROWS_COUNT_REFRESH = 500  # Milliseconds between two updates of a growing row count
+PLACEHOLDER_COLOR = 'lightgray'  # Color of the images that are being rendered
+IMAGES_PREFETCH_SCREENS = 1  # Screens of images rendered in advance before and after the gallery view
 
 # -------------------- STATUS BAR LABELS ------------------
 
@@ -36,12 +36,15 @@ from matplotlib.patches import Polygon
 from matplotlib.widgets import RangeSlider, PolygonSelector
 
 from ...model import IntRenderer, FloatRenderer
+from ...model.image_loader import ImageScheduler
+from ...model.renderers import ImageRenderer, getImageFilters
 
 logger = logging.getLogger()
 
 from PIL import Image, ImageOps, ImageFilter
 from PyQt5 import QtGui
-from PyQt5.QtCore import Qt, QItemSelectionModel, QCoreApplication
+from PyQt5.QtCore import (Qt, QItemSelectionModel, QCoreApplication, QThread,
+                          QTimer, QObject, pyqtSignal)
 from PyQt5.QtGui import (QIcon, QKeySequence, QPixmap, QPalette, QColor,
                          QFontMetrics, QIntValidator)
 from PyQt5.QtWidgets import (QMainWindow, QMenuBar, QMenu, QLabel,
@@ -52,7 +55,8 @@ from PyQt5.QtWidgets import (QMainWindow, QMenuBar, QMenu, QLabel,
                              QPushButton, QApplication,
                              QTableWidgetSelectionRange, QFrame, QDesktopWidget,
                              QFileDialog, QLineEdit, QGridLayout, QHeaderView,
-                             QFormLayout, QRadioButton, QButtonGroup, QMessageBox, QListView)
+                             QFormLayout, QRadioButton, QButtonGroup, QMessageBox, QListView,
+                             QProgressDialog)
 
 from metadataviewer.model.object_manager import IGUI
 from .constants import *
@@ -221,10 +225,9 @@ class PlotColumns(QDialog):
         tableSelection.clear()
 
         if hasattr(self, 'rangeSlider'):  # Histogram or plot cases
-            selectedIndexes = [
-                index for index, value in enumerate(self.data[self.xAxisValue])
-                if self.minSliderValue <= value <= self.maxSliderValue
-            ]
+            values = np.asarray(self.data[self.xAxisValue])
+            selectedIndexes = np.nonzero((values >= self.minSliderValue) &
+                                         (values <= self.maxSliderValue))[0]
         elif hasattr(self, 'currentPolygon'):  # Case of scatter
             selectedIndexes = self.scatterIndexes
 
@@ -233,8 +236,8 @@ class PlotColumns(QDialog):
                                     QMessageBox.Ok)
             return
 
-        for rowId in selectedIndexes:
-            tableSelection.addRowSelected(self.data[COLUMN_ID][rowId])
+        tableSelection.addRows(np.asarray(self.data[COLUMN_ID])[selectedIndexes],
+                               remove=False)
 
         if tableSelection.isEmpty():
             QMessageBox.information(self, "Information", "The selection has generated an empty set. "
@@ -475,9 +478,9 @@ class PlotColumns(QDialog):
 
             self.rangeLines = []
             if not xAxis:
-                xAxis = max(data, key=lambda k: max(data[k]) if k != COLUMN_ID else float('-inf'))
+                xAxis = max(data, key=lambda k: np.max(data[k]) if k != COLUMN_ID else float('-inf'))
 
-            minValue, maxValue = min(data[xAxis]), max(data[xAxis])
+            minValue, maxValue = np.min(data[xAxis]), np.max(data[xAxis])
             self.xAxisValue = xAxis
 
             if minValue != maxValue:
@@ -523,8 +526,8 @@ class PlotColumns(QDialog):
             self.rangeLines = []
 
             if not xAxis:
-                xAxis = max(data, key=lambda k: max(data[k]) if k != COLUMN_ID else float('-inf'))
-            minValue, maxValue = min(data[xAxis]), max(data[xAxis])
+                xAxis = max(data, key=lambda k: np.max(data[k]) if k != COLUMN_ID else float('-inf'))
+            minValue, maxValue = np.min(data[xAxis]), np.max(data[xAxis])
             self.xAxisValue = xAxis
 
             if minValue != maxValue:
@@ -795,6 +798,71 @@ class CustomScrollBar(QScrollBar):
         event.accept()
 
 
+class AsyncImages(QObject):
+    """Images of the cells of a view that are rendered in background. The
+    cells show a placeholder until their image is ready. The requests are
+    ranked by an ImageScheduler, so the ones of the cells that are not shown
+    any more are dropped when the view moves"""
+    imageLoaded = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._scheduler = ImageScheduler(ImageRenderer.getImageLoader())
+        # The signal is emitted by the workers, the slot runs in the GUI thread
+        self.imageLoaded.connect(self._setImage)
+
+    def getScheduler(self):
+        return self._scheduler
+
+    def newGeneration(self, firstItem, visibleItems):
+        """Drop the pending requests, the view shows now 'visibleItems'
+        items from 'firstItem'"""
+        self._scheduler.newGeneration(firstItem, visibleItems)
+
+    def render(self, renderer, value, values):
+        """Return the image that renders a value and True if it is a
+        placeholder (the cell widget must be passed to request then)"""
+        image = renderer.getCachedImage(value, values)
+        if image is not None:
+            return image, False
+        if not renderer.getImageLoader().isAsync():
+            return renderer.render(value, values), False
+        size = renderer.getSize()
+        return Image.new('RGB', (size, size), PLACEHOLDER_COLOR), True
+
+    def request(self, renderer, value, values, item, widget):
+        """Render a value in background and show it in the given widget"""
+        self._scheduler.request(renderer, value, values, self._onLoaded, item,
+                                widget)
+
+    def prefetch(self, renderer, value, values, item):
+        """Render in background the value of an item that is not shown, so
+        it is in the thumbnails cache when the view gets there"""
+        if renderer.getImageLoader().isAsync() \
+                and renderer.getCachedImage(value, values) is None:
+            self._scheduler.request(renderer, value, values, self._onLoaded, item)
+
+    def cancelPrefetch(self):
+        """Drop the pending requests of the items that are not shown"""
+        self._scheduler.cancel(lambda request: request.data is None)
+
+    def cancel(self):
+        """Drop all the pending requests"""
+        self._scheduler.cancel()
+
+    def _onLoaded(self, request, image):
+        if request.data is not None:
+            self.imageLoaded.emit(request, image)
+
+    def _setImage(self, request, image):
+        if image is None or request.isCancelled():
+            return
+        try:
+            request.data.setImage(image)
+        except RuntimeError:  # The cell widget was deleted
+            pass
+
+
 class CustomWidget(QWidget):
     """Class to  custom the table cell widget"""
     def __init__(self, data, id, value, addText=False, text='', autocontrast=False, gaussianBlurFilter=False):
@@ -834,17 +902,7 @@ class CustomWidget(QWidget):
 
         else:  # Assuming the data is a file path to an image
             try:
-                if autocontrast:
-                    data = ImageOps.autocontrast(data)
-                if gaussianBlurFilter:
-                    data = data.filter(ImageFilter.GaussianBlur(radius=0.5))
-                im = data.convert("RGBA")
-                data = im.tobytes("raw", "RGBA")
-                qimage = QtGui.QImage(data, im.size[0], im.size[1],
-                                      QtGui.QImage.Format_RGBA8888)
-
-                pixmap = QPixmap.fromImage(qimage)
-                self._label.setPixmap(pixmap)
+                self.setImage(data, autocontrast, gaussianBlurFilter)
                 if addText:
                     self._layout.addSpacing(5)
                 self._layout.addWidget(self._label, alignment=Qt.AlignCenter)
@@ -857,6 +915,21 @@ class CustomWidget(QWidget):
 
         self.setLayout(self._layout)
 
+    def setImage(self, data, autocontrast=False, gaussianBlurFilter=False):
+        """Show a PIL image. It is used to replace the placeholders when the
+        images are rendered in background"""
+        if autocontrast:
+            data = ImageOps.autocontrast(data)
+        if gaussianBlurFilter:
+            data = data.filter(ImageFilter.GaussianBlur(radius=0.5))
+        im = data.convert("RGBA")
+        data = im.tobytes("raw", "RGBA")
+        qimage = QtGui.QImage(data, im.size[0], im.size[1],
+                              QtGui.QImage.Format_RGBA8888)
+
+        pixmap = QPixmap.fromImage(qimage)
+        self._label.setPixmap(pixmap)
+
     def widgetType(self):
         """Return the type of the widget content"""
         return self._type
@@ -897,6 +970,9 @@ class TableView(QTableWidget):
         self._oldzoom = ZOOM_SIZE
         self._hasTransformation = False
         self.setAutoScroll(False)
+        self._rowsCountTimer = QTimer(self)
+        self._rowsCountTimer.timeout.connect(self._updateRowsCount)
+        self._asyncImages = AsyncImages(self)
 
     def createPlotDialog(self):
         self.plotDialog = PlotColumns(self, self)
@@ -905,6 +981,7 @@ class TableView(QTableWidget):
 
     def _createTable(self, tableName):
         """Create the table structure"""
+        self._asyncImages.cancel()
         self.setColumnCount(0)
         self._tableName = tableName
         self._rowsCount = self.objectManager.getTableRowCount(self._tableName)
@@ -937,12 +1014,24 @@ class TableView(QTableWidget):
         self.vScrollBar.valueChanged.connect(lambda: self._loadRows())
         rowHeight = self._rowHeight if self._rowHeight else DEFAULT_ROW_HEIGHT
         self.vScrollBar.setMaximum(rowHeight * self.getRowsCount())
+        self._rowsCountTimer.stop()
+        if not self.objectManager.isTableRowCountFinal(tableName):
+            self._rowsCountTimer.start(ROWS_COUNT_REFRESH)
         self.hScrollBar.valueChanged.connect(lambda: self._loadRows())
         self.cellClicked.connect(self.setCurrentRowColumn)
         self.horizontalHeader().sectionClicked.connect(self.setCurrentColumn)
         self.verticalHeader().sectionClicked.connect(self.setCurrentRow)
         self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
 
+    def _updateRowsCount(self):
+        """Grow the scrollbar range while the DAO is counting the rows"""
+        isFinal = self.objectManager.isTableRowCountFinal(self._tableName)
+        self._rowsCount = self.objectManager.getTableRowCount(self._tableName)
+        rowHeight = self._rowHeight if self._rowHeight else DEFAULT_ROW_HEIGHT
+        self.vScrollBar.setMaximum(rowHeight * self._rowsCount)
+        if isFinal:
+            self._rowsCountTimer.stop()
+
     def hasColumnId(self):
         """Return True if the tabel has the id column"""
         return self._hasColumnId
@@ -1096,7 +1185,7 @@ class TableView(QTableWidget):
         for i in range(len(rows)):
             row = rows[i]
             values = row.getValues()
-            if row.getId() in self._table.getSelection().getSelection():
+            if self._table.getSelection().isRowSelected(row.getId()):
                 self.setRangeSelected(QTableWidgetSelectionRange(i + currentRowIndex,
                                                                  0, i + currentRowIndex,
                                                                  self.columnCount() - 1), True)
@@ -1112,25 +1201,24 @@ class TableView(QTableWidget):
                             widget = CustomWidget(item, row.getId(), values[valueIndex])
                         else:
                             if self.propertiesTableDialog.renderCheckBoxList[column.getIndex()].isChecked():
-                                item = renderer.render(values[valueIndex], values)
+                                renderer.setFilters(getImageFilters(self.getApplyImageAutocontrast(),
+                                                                    self.getApplyImageGaussianBlurFilter()))
+                                item, isPlaceholder = self._asyncImages.render(renderer, values[valueIndex], values)
                                 if self.tableWithAdditionalInfo and self._tableName == self.tableWithAdditionalInfo[0]:
                                     text = self.composeAdditionaInfo(row)
                                     widget = CustomWidget(item, row.getId(),
                                                           values[valueIndex],
-                                                          addText=True, text=text,
-                                                          autocontrast=self.getApplyImageAutocontrast(),
-                                                          gaussianBlurFilter=self.getApplyImageGaussianBlurFilter())
+                                                          addText=True, text=text)
                                 else:
                                     widget = CustomWidget(item, row.getId(),
-                                                          values[valueIndex],
-                                                          autocontrast=self.getApplyImageAutocontrast(),
-                                                          gaussianBlurFilter=self.getApplyImageGaussianBlurFilter())
+                                                          values[valueIndex])
+                                if isPlaceholder:
+                                    self._asyncImages.request(renderer, values[valueIndex], values,
+                                                              i + currentRowIndex, widget)
                             else:
                                 item = values[valueIndex]
                                 widget = CustomWidget(item, row.getId(),
-                                                      values[valueIndex],
-                                                      autocontrast=self.getApplyImageAutocontrast(),
-                                                      gaussianBlurFilter=self.getApplyImageGaussianBlurFilter())
+                                                      values[valueIndex])
 
                         if widget.sizeHint().height() > self._rowHeight:
                             self._rowHeight = widget.sizeHint().height()
@@ -1174,13 +1262,33 @@ class TableView(QTableWidget):
                 text += column.getName() + '=' + str(values[i]) + ' '
         return text
 
+    def _getShownColumns(self, currenctColumnIndex):
+        """Return the indexes of the values painted by _addRows: the visible
+        columns inside the viewport and the ones of the additional info"""
+        columnsCount = self._calculateVisibleColumns()
+        indexes = []
+        for col in range(currenctColumnIndex, len(self._columns)):
+            if self._columnsOrder[col] in self._columnsMap:
+                valueIndex, column = self._columnsMap[self._columnsOrder[col]]
+                if column.isVisible():
+                    indexes.append(valueIndex)
+                    if len(indexes) > columnsCount:
+                        break
+
+        if self.tableWithAdditionalInfo and self._tableName == self.tableWithAdditionalInfo[0]:
+            indexes += [i for i, column in enumerate(self._columns)
+                        if column.getName() in self.tableWithAdditionalInfo[1]]
+        return indexes
+
     def _loadRows(self):
-        """Load the table rows"""
+        """Load the table rows. Only the shown columns are read"""
         currentRowIndex = self.vScrollBar.value() - 1
         currenctColumnIndex = self.hScrollBar.value()
         visibleRows = self._calculateVisibleRows() + 1
+        self._asyncImages.newGeneration(currentRowIndex, visibleRows)
         self.rows = self.objectManager.getRows(self._tableName, currentRowIndex,
-                                               visibleRows)
+                                               visibleRows,
+                                               self._getShownColumns(currenctColumnIndex))
         self.clearSelection()
         self._addRows(self.rows, currentRowIndex, currenctColumnIndex)
 
@@ -1232,6 +1340,7 @@ class GalleryView(QTableWidget):
         self._rowHeight = ZOOM_SIZE
         self._defineStyles()
         self.setAutoScroll(False)
+        self._asyncImages = AsyncImages(self)
 
     def setTableName(self, tableName):
         """Set the table name"""
@@ -1263,6 +1372,7 @@ class GalleryView(QTableWidget):
 
     def _createGallery(self, tableName):
         """Creating the gallery for a given table"""
+        self._asyncImages.cancel()
         self.setColumnCount(0)
         self._tableName = tableName
         self._table = self.objectManager.getTable(self._tableName)
@@ -1353,36 +1463,37 @@ class GalleryView(QTableWidget):
         visibleRows = viewportHeight // self.getOldZoom() + 1
         return visibleRows
 
-    def _addImages(self, rows, currentValue, visibleRows, seekFirstImage):
-        """Add images to the gallery"""
+    def _addImages(self, page, currentValue, visibleRows, seekFirstImage):
+        """Add images to the gallery. The values are read column by column
+        from the page (a ColumnarPage), so the rows are not boxed"""
         renderer = self.getRenderer()
-        rowsValues = [row.getValues() for row in rows]
         countImages = 0
         selection = self.getTable().getSelection().getSelection()
+        addText = self.tableWithAdditionalInfo and self._tableName == self.tableWithAdditionalInfo[0]
         if self._columnWithImages:
+            renderer.setFilters(getImageFilters(self.getApplyImageAutocontrast(),
+                                                self.getApplyImageGaussianBlurFilter()))
             for row in range(visibleRows):
                 for col in range(self._columnsCount):
                     if seekFirstImage + countImages == self._tableSize:
                         break
-                    value = rowsValues[countImages][self._columnWithImages]
-                    item = renderer.render(value, rowsValues[countImages])
-                    currentRow = rows[countImages]
-                    if self.tableWithAdditionalInfo and self._tableName == self.tableWithAdditionalInfo[0]:
-                        text = self.composeAdditionaInfo(currentRow)
-                        widget = CustomWidget(item, currentRow.getId(),
-                                              value, addText=True,
-                                              text=text,
-                                              autocontrast=self.getApplyImageAutocontrast(),
-                                              gaussianBlurFilter=self.getApplyImageGaussianBlurFilter()
-                                              )
+                    value = page.getValue(self._columnWithImages, countImages)
+                    rowId = page.getValue(COLUMN_ID, countImages)
+                    # The row values are only needed to rotate the images
+                    values = page.getRowValues(countImages) if renderer.hasTransformation() else None
+                    item, isPlaceholder = self._asyncImages.render(renderer, value, values)
+                    if addText:
+                        text = self.composeAdditionaInfo(page.getRow(countImages))
+                        widget = CustomWidget(item, rowId, value, addText=True,
+                                              text=text)
                     else:
-                        widget = CustomWidget(item, currentRow.getId(),
-                                              value, autocontrast=self.getApplyImageAutocontrast(),
-                                              gaussianBlurFilter=self.getApplyImageGaussianBlurFilter()
-                                              )
+                        widget = CustomWidget(item, rowId, value)
+                    if isPlaceholder:
+                        self._asyncImages.request(renderer, value, values,
+                                                  seekFirstImage + countImages, widget)
 
                     self.setCellWidget(currentValue + row, col, widget)
-                    if rows[countImages].getId() in selection:
+                    if rowId in selection:
                         self.setRangeSelected(QTableWidgetSelectionRange(currentValue + row, col, currentValue + row, col),  True)
 
                     self.setColumnWidth(col, self.getOldZoom() + 5)
@@ -1403,14 +1514,53 @@ class GalleryView(QTableWidget):
                 text += column.getName() + '=' + str(values[i]) + ' '
         return text
 
+    def _getShownColumns(self):
+        """Return the indexes of the values used by the gallery: the images
+        and the additional info"""
+        indexes = []
+        if self._columnWithImages is not None:
+            indexes.append(self._columnWithImages)
+        if self.tableWithAdditionalInfo and self._tableName == self.tableWithAdditionalInfo[0]:
+            indexes += [i for i, column in enumerate(self._columns)
+                        if column.getName() in self.tableWithAdditionalInfo[1]]
+        return indexes
+
     def _loadImages(self):
-        """Load the gallery images"""
+        """Load the gallery images. Only the shown columns are read"""
         currentValue = self.vScrollBar.value()
         visibleRows = self._calculateVisibleRows()
         seekFirstImage = currentValue * self._columnsCount
         seekLastImage = visibleRows * self._columnsCount
-        rows = self.objectManager.getRows(self._tableName, seekFirstImage, seekLastImage)
-        self._addImages(rows, currentValue, visibleRows, seekFirstImage)
+        self._asyncImages.newGeneration(seekFirstImage, seekLastImage)
+        page = self.objectManager.getRowsColumns(self._tableName, seekFirstImage,
+                                                 seekLastImage, self._getShownColumns())
+        self._addImages(page, currentValue, visibleRows, seekFirstImage)
+        self._prefetchImages(seekFirstImage, seekLastImage)
+
+    def _prefetchImages(self, firstImage, imagesCount):
+        """Render in background the images of the screens before and after
+        the shown one. The scheduler renders the ones in the scroll direction
+        first. Only the rows already cached (e.g. by the pages prefetcher)
+        are used, so the DAO is not read from the GUI thread"""
+        if not self._columnWithImages or not ImageRenderer.getImageLoader().isAsync():
+            return
+        renderer = self.getRenderer()
+        count = imagesCount * IMAGES_PREFETCH_SCREENS
+        for start, size in [(firstImage + imagesCount, count),
+                            (max(firstImage - count, 0), min(count, firstImage))]:
+            size = min(size, self._tableSize - start)
+            if size <= 0:
+                continue
+            rows = self.objectManager.getCachedRows(self._tableName, start, size,
+                                                    self._getShownColumns())
+            for position, row in rows:
+                values = row.getValues()
+                self._asyncImages.prefetch(renderer, values[self._columnWithImages],
+                                           values, position)
+
+    def cancelImagesPrefetch(self):
+        """Drop the images that are rendered in advance"""
+        self._asyncImages.cancelPrefetch()
 
     def _update(self):
         """Method to update the gallery when it is resize
@@ -1461,6 +1611,32 @@ class ImageViewer(QDialog):
         self.label.setPixmap(pixmap.scaledToWidth(600, Qt.SmoothTransformation))
 
 
+class TaskThread(QThread):
+    """Thread that runs a long task (see IGUI.runTask) reporting its
+    progress through a signal"""
+    progressChanged = pyqtSignal(int, int)
+
+    def __init__(self, task):
+        super().__init__()
+        self._task = task
+        self._cancelled = False
+        self.result = None
+        self.error = None
+
+    def cancel(self):
+        self._cancelled = True
+
+    def isCancelled(self):
+        return self._cancelled
+
+    def run(self):
+        try:
+            self.result = self._task(self.progressChanged.emit, self.isCancelled)
+        except Exception as e:
+            logger.error("Error running the task: %s" % e)
+            self.error = e
+
+
 class QTMetadataViewer(QMainWindow, IGUI):
     """Qt Metadata viewer window"""
     def __init__(self, **kwargs):
@@ -1469,6 +1645,7 @@ class QTMetadataViewer(QMainWindow, IGUI):
         self.tableNames = self.objectManager.getTableAliases()
         self.tableName = self.objectManager.getTableFromAlias(self.tableNames[0]).getName()
         self._pageSize = PAGE_SIZE
+        self._tasks = []
         self._triggeredResize = False
         self._triggeredGotoItem = True
         self._rowsCount = self.objectManager.getTableRowCount(self.tableName)
@@ -1714,6 +1891,45 @@ class QTMetadataViewer(QMainWindow, IGUI):
 
         return filepath
 
+    def runTask(self, title, task, background=False):
+        """Run a long task showing a progress dialog that allows to cancel
+        it. If 'background' is True the task is executed in a worker thread,
+        otherwise the events are processed after every progress update"""
+        progressDialog = QProgressDialog(title, CANCEL, 0, 100, self)
+        progressDialog.setWindowTitle(title)
+        progressDialog.setWindowModality(Qt.WindowModal)
+        progressDialog.setMinimumDuration(500)
+
+        def updateProgress(done, total):
+            progressDialog.setMaximum(max(total, 1))
+            progressDialog.setValue(min(done, max(total, 1)))
+            if not background:
+                QCoreApplication.processEvents()
+
+        if not background:
+            try:
+                return task(updateProgress, progressDialog.wasCanceled)
+            except Exception as e:
+                logger.error("Error running the task: %s" % e)
+                QMessageBox.critical(self, title, str(e))
+            finally:
+                progressDialog.close()
+            return None
+
+        thread = TaskThread(task)
+        thread.progressChanged.connect(updateProgress)
+        progressDialog.canceled.connect(thread.cancel)
+
+        def taskFinished():
+            progressDialog.close()
+            if thread.error is not None:
+                QMessageBox.critical(self, title, str(thread.error))
+            self._tasks.remove(thread)
+
+        thread.finished.connect(taskFinished)
+        self._tasks.append(thread)  # Keep a reference while running
+        thread.start()
+
     def getSubsetName(self, typeOfObjects, elementsCount):
         subsetNameDialog = QDialog()
         subsetNameDialog.setWindowTitle("Question")
@@ -1747,6 +1963,24 @@ class QTMetadataViewer(QMainWindow, IGUI):
     def exportToCSV(self):
         self.objectManager.exportToCSV(self.tableName)
 
+    def exportTable(self):
+        """Export the table to any of the registered formats"""
+        exporters = self.objectManager.getExporterRegistry()
+        filters = ['%s (%s)' % (exporter.getFormatName(),
+                                ' '.join('*.%s' % ext for ext in exporter.getCompatibleFileTypes()))
+                   for exporter in exporters]
+        filepath, selectedFilter = QFileDialog.getSaveFileName(self, 'Export table', '',
+                                                               ';;'.join(filters))
+        if not filepath:
+            return
+        if self.objectManager.selectExporter(filepath) is None and selectedFilter in filters:
+            exporter = exporters[filters.index(selectedFilter)]
+            filepath += '.' + exporter.getCompatibleFileTypes()[0]
+        try:
+            self.objectManager.exportTable(self.tableName, filepath)
+        except Exception as e:
+            QMessageBox.critical(self, 'Export table', str(e))
+
     def _createActions(self):
         """Create a set of GUI actions"""
         # File actions
@@ -1756,6 +1990,12 @@ class QTMetadataViewer(QMainWindow, IGUI):
         self.openAction.setIcon(QIcon(getImage(FOLDER)))
         self.openAction.triggered.connect(self.openFile)
 
+        self.exportAction = QAction(self)
+        self.exportAction.setText("&Export...")
+        self.exportAction.setShortcut(QKeySequence("Ctrl+E"))
+        self.exportAction.setIcon(QIcon(getImage(EXPORT_XLSX)))
+        self.exportAction.triggered.connect(self.exportTable)
+
         self.exitAction = QAction(self)
         self.exitAction.setText("E&xit")
         self.exitAction.setShortcut(QKeySequence("Ctrl+X"))
@@ -1841,6 +2081,7 @@ class QTMetadataViewer(QMainWindow, IGUI):
         fileMenu = QMenu("&File", self)
         menu_bar.addMenu(fileMenu)
         fileMenu.addAction(self.openAction)
+        fileMenu.addAction(self.exportAction)
         fileMenu.addSeparator()
         fileMenu.addAction(self.exitAction)
 
@@ -1974,7 +2215,7 @@ class QTMetadataViewer(QMainWindow, IGUI):
 
     def openFile(self):
         filepath, _ = QFileDialog.getOpenFileNames(self, 'Open metadata File',
-                                                   '', '(*.sqlite *.star *.xmd)')
+                                                   '', '(*.sqlite *.star *.xmd *.npy *.npz *.csv *.tsv)')
 
     def enableGalleryOption(self):
         """Preference of gallery mode"""
@@ -2227,10 +2468,7 @@ class QTMetadataViewer(QMainWindow, IGUI):
     def selectInverse(self):
         """Mark as selected the inverse of the provided selection """
         if self.table.hasColumnId():
-            tableName = self.table.getTableName()
-            self.objectManager.getSelectedRangeRowsIds(tableName, 0, self.objectManager.getTableRowCount(tableName),
-                                                       self.table.getColumns()[self.table.getSortedColumn()].getName(),
-                                                       self.table._orderAsc, True)
+            self.objectManager.invertSelection(self.table.getTableName())
             self._updateStatusBarSelectedRows()
             self.table._loadRows()
 
@@ -2284,6 +2522,9 @@ class QTMetadataViewer(QMainWindow, IGUI):
 
     def _gotoItem(self, itemIndex, moveScroll=True):
         """Event that allows locating an item given the index  """
+        # The pages and images around the old position are no longer needed
+        self.objectManager.cancelPrefetch()
+        self.gallery.cancelImagesPrefetch()
         if itemIndex > self._rowsCount:
             itemIndex = self._rowsCount
             self.goToItem.setValue(itemIndex)
@@ -26,4 +26,6 @@
 # **************************************************************************
 
 from .page import *
+from .cache import *
+from .mrc_reader import *
 from .object_manager import *
\ No newline at end of file
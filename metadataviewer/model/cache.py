@@ -0,0 +1,325 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger()
+
+
+class LRUCache:
+    """Least recently used cache bounded by the memory (in bytes) taken by
+    the stored values. The least recently used entries are evicted when the
+    memory budget is exceeded. The cache can be shared between threads"""
+    def __init__(self, maxSize: int, sizeOf=None):
+        """
+        :param maxSize: memory budget in bytes
+        :param sizeOf: function that returns the size in bytes of a value
+        """
+        self._entries = OrderedDict()
+        self._maxSize = maxSize
+        self._sizeOf = sizeOf or (lambda value: 1)
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """Return the value stored for a given key or default"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Store a value. The least recently used values are evicted if
+        the memory budget is exceeded"""
+        size = self._sizeOf(value)
+        with self._lock:
+            self.remove(key)
+            self._entries[key] = (value, size)
+            self._size += size
+            self._evict()
+
+    def remove(self, key):
+        """Remove the value stored for a given key"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry[1]
+
+    def removeIf(self, condition):
+        """Remove the entries whose key fulfills the given condition"""
+        with self._lock:
+            for key in [key for key in self._entries if condition(key)]:
+                self.remove(key)
+
+    def clear(self):
+        """Remove all the entries"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _evict(self):
+        while self._size > self._maxSize and self._entries:
+            _, (value, size) = self._entries.popitem(last=False)
+            self._size -= size
+
+    def getMaxSize(self):
+        """Return the memory budget in bytes"""
+        return self._maxSize
+
+    def setMaxSize(self, maxSize):
+        """Set the memory budget in bytes"""
+        with self._lock:
+            self._maxSize = maxSize
+            self._evict()
+
+    def getSize(self):
+        """Return the memory (in bytes) taken by the stored values"""
+        return self._size
+
+    def getStats(self):
+        """Return a dictionary with the cache statistics"""
+        return {'entries': len(self._entries),
+                'size': self._size,
+                'maxSize': self._maxSize,
+                'hits': self._hits,
+                'misses': self._misses}
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PageCache(LRUCache):
+    """Cache of the pages retrieved from the DAOs. Entries are keyed by
+    (tableName, pageNumber, pageSize, sortingColumn, orderAsc, projection)"""
+    def __init__(self, maxSize: int):
+        super().__init__(maxSize, sizeOf=lambda page: page.getMemorySize())
+
+    def invalidate(self, tableName=None):
+        """Remove the pages of a given table (all the pages if no table is
+        given)"""
+        if tableName is None:
+            self.clear()
+        else:
+            self.removeIf(lambda key: key[0] == tableName)
+
+
+class ThumbnailCache(LRUCache):
+    """Cache of the images rendered by the image renderers. It is shared by
+    all of them and entries are keyed by (path, size, rotation, filters)"""
+    def __init__(self, maxSize: int):
+        super().__init__(maxSize, sizeOf=getImageSize)
+
+    def invalidate(self, path=None):
+        """Remove the thumbnails of a given image (all of them if no path is
+        given)"""
+        if path is None:
+            self.clear()
+        else:
+            self.removeIf(lambda key: key[0] == path)
+
+
+class ThumbnailDiskCache:
+    """Persistent cache of rendered images stored in a directory (one .npy
+    file per image). Entries are keyed by (path, mtime, fileSize, size,
+    transformation), so they are not valid any more when the image file
+    changes. The files read are touched, and the least recently used ones
+    are removed when the disk budget is exceeded"""
+    def __init__(self, path: str = None, maxSize: int = None):
+        """
+        :param path: cache directory (see getDefaultCacheDir)
+        :param maxSize: disk budget in bytes
+        """
+        self._path = path or getDefaultCacheDir()
+        self._maxSize = maxSize
+        self._entries = None  # fileName -> size, the oldest first
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.RLock()
+
+    def getPath(self):
+        return self._path
+
+    def _loadEntries(self):
+        """Read the files already stored, sorted by their last use"""
+        if self._entries is not None:
+            return
+        os.makedirs(self._path, exist_ok=True)
+        files = []
+        for entry in os.scandir(self._path):
+            if entry.name.endswith('.npy') and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(files))
+        self._size = sum(self._entries.values())
+
+    @staticmethod
+    def _getFileName(key):
+        return hashlib.sha1(repr(key).encode()).hexdigest() + '.npy'
+
+    def get(self, key, default=None):
+        """Return the image stored for a given key or default"""
+        fileName = self._getFileName(key)
+        with self._lock:
+            self._loadEntries()
+            if fileName not in self._entries:
+                self._misses += 1
+                return default
+            self._entries.move_to_end(fileName)
+            self._hits += 1
+
+        filePath = os.path.join(self._path, fileName)
+        try:
+            image = Image.fromarray(np.load(filePath))
+            os.utime(filePath)
+            return image
+        except (OSError, ValueError) as e:
+            logger.debug("The thumbnail %s could not be read: %s" % (filePath, e))
+            self.remove(key)
+            return default
+
+    def put(self, key, image):
+        """Store an image. The least recently used images are removed if
+        the disk budget is exceeded"""
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        fileName = self._getFileName(key)
+        with self._lock:
+            self._loadEntries()
+        # Written with another name, so the file is never read half written
+        fd, tmpPath = tempfile.mkstemp(suffix='.tmp', dir=self._path)
+        try:
+            with os.fdopen(fd, 'wb') as tmpFile:
+                np.save(tmpFile, np.asarray(image))
+            os.replace(tmpPath, os.path.join(self._path, fileName))
+        except OSError as e:
+            logger.debug("The thumbnail could not be stored: %s" % e)
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            return
+
+        with self._lock:
+            self._size -= self._entries.pop(fileName, 0)
+            self._entries[fileName] = os.path.getsize(os.path.join(self._path, fileName))
+            self._size += self._entries[fileName]
+            self._prune()
+
+    def remove(self, key):
+        """Remove the image stored for a given key"""
+        with self._lock:
+            self._loadEntries()
+            self._removeFile(self._getFileName(key))
+
+    def _removeFile(self, fileName):
+        size = self._entries.pop(fileName, None)
+        if size is not None:
+            self._size -= size
+            try:
+                os.remove(os.path.join(self._path, fileName))
+            except OSError:
+                pass
+
+    def _prune(self):
+        if self._maxSize is None:
+            return
+        while self._size > self._maxSize and self._entries:
+            self._removeFile(next(iter(self._entries)))
+
+    def clear(self):
+        """Remove all the stored images"""
+        with self._lock:
+            self._loadEntries()
+            for fileName in list(self._entries):
+                self._removeFile(fileName)
+
+    def getMaxSize(self):
+        """Return the disk budget in bytes"""
+        return self._maxSize
+
+    def setMaxSize(self, maxSize):
+        """Set the disk budget in bytes"""
+        with self._lock:
+            self._maxSize = maxSize
+            self._loadEntries()
+            self._prune()
+
+    def getSize(self):
+        """Return the disk space (in bytes) taken by the stored images"""
+        with self._lock:
+            self._loadEntries()
+            return self._size
+
+    def getStats(self):
+        """Return a dictionary with the cache statistics"""
+        with self._lock:
+            self._loadEntries()
+            return {'entries': len(self._entries),
+                    'size': self._size,
+                    'maxSize': self._maxSize,
+                    'hits': self._hits,
+                    'misses': self._misses}
+
+    def __contains__(self, key):
+        with self._lock:
+            self._loadEntries()
+            return self._getFileName(key) in self._entries
+
+    def __len__(self):
+        with self._lock:
+            self._loadEntries()
+            return len(self._entries)
+
+
+def getDefaultCacheDir():
+    """Return the directory of the persistent thumbnails cache in the user
+    cache directory"""
+    cacheHome = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cacheHome, 'metadataviewer', 'thumbnails')
+
+
+def getImageSize(image):
+    """Return the memory (in bytes) taken by the pixels of a PIL image"""
+    bytesPerBand = {'I': 4, 'F': 4, 'I;16': 2, 'I;16B': 2, 'I;16L': 2}
+    return (image.width * image.height * len(image.getbands())
+            * bytesPerBand.get(image.mode, 1))
@@ -28,4 +28,14 @@
 
 IMAGE_DEFAULT_SIZE = 250
 LIMIT_TO_REQUEST = 1500000
-ROWS_TO_GUI_UPDATE = 1000000
\ No newline at end of file
+ROWS_TO_GUI_UPDATE = 1000000
+MMAP_THRESHOLD = 256 * 1024 * 1024  # Size in bytes from which numpy files are memory-mapped
+COLUMN_ID = 'id'
+PAGE_CACHE_SIZE = 256  # Memory budget (in MB) of the pages cache
+PREFETCH_PAGES = 2  # Pages loaded in background before and after the displayed ones
+EXPORT_BLOCK_SIZE = 10000  # Rows read from the DAOs at once when exporting a table
+ROW_INDEX_STEP = 16  # Rows between two offsets recorded by the text file DAOs
+THUMBNAIL_CACHE_SIZE = 256  # Memory budget (in MB) of the thumbnails cache shared by the image renderers
+THUMBNAIL_DISK_CACHE_SIZE = 1024  # Disk budget (in MB) of the persistent thumbnails cache
+IMAGE_LOADER_THREADS = 4  # Threads that render the images in background (0 renders them in the GUI thread)
+MRC_OPEN_STACKS = 32  # MRC stacks kept parsed and memory-mapped by the MRC image reader
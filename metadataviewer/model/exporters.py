@@ -0,0 +1,343 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+import io
+import logging
+import os
+import zipfile
+from abc import abstractmethod
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+logger = logging.getLogger()
+
+BUFFER_SIZE = 4 * 1024 * 1024
+XLSX_MAX_ROWS = 1048576
+
+
+class TableExporter:
+    """Base class of the table exporters. The rows are read from the DAO in
+    blocks (see ObjectManager.iterRowsBlocks) and every block is written at
+    once, so the table is never completely loaded in memory"""
+    _compatibleExtensions = []
+    _formatName = None
+
+    def __init__(self, objectManager, tableName, filepath, ids=None):
+        """
+        :param objectManager: object manager with the file opened
+        :param tableName: name of the table to export
+        :param filepath: path of the file to write
+        :param ids: ids of the rows to export. All the rows if None
+        """
+        self._objectManager = objectManager
+        self._tableName = tableName
+        self._filepath = filepath
+        self._ids = ids
+
+    @classmethod
+    def getCompatibleFileTypes(cls):
+        """Return a list of file extensions written by the exporter"""
+        return cls._compatibleExtensions
+
+    @classmethod
+    def getFormatName(cls):
+        """Return the format description shown in the file dialogs"""
+        return cls._formatName
+
+    def getRowsCount(self):
+        """Return the number of rows that will be exported"""
+        if self._ids is not None:
+            return len(self._ids)
+        return self._objectManager.getTableRowCount(self._tableName)
+
+    def export(self, progress=None, isCancelled=None):
+        """Write the file. Return False if the export was cancelled
+        :param progress: function called with the number of exported rows
+                         and the total number of rows after every block
+        :param isCancelled: function that returns True if the export must
+                            be stopped
+        """
+        table = self._objectManager.getTable(self._tableName)
+        total = self.getRowsCount()
+        exported = 0
+        completed = False
+        logger.info("Exporting %d rows of %s to %s" % (total, self._tableName,
+                                                       self._filepath))
+        try:
+            with self.open() as file:
+                self.writeHeader(file, table)
+                for ids, columns in self._objectManager.iterRowsBlocks(self._tableName,
+                                                                        self._ids):
+                    if isCancelled is not None and isCancelled():
+                        logger.info("Export to %s cancelled" % self._filepath)
+                        return False
+                    self.writeBlock(file, table, ids, columns)
+                    exported += len(ids)
+                    if progress is not None:
+                        progress(exported, total)
+                self.writeFooter(file, table)
+            completed = True
+        finally:
+            # Removing incomplete files
+            if not completed and os.path.exists(self._filepath):
+                os.remove(self._filepath)
+        return True
+
+    def open(self):
+        """Open the output file"""
+        return open(self._filepath, 'w', encoding='utf-8', buffering=BUFFER_SIZE)
+
+    def writeHeader(self, file, table):
+        pass
+
+    @abstractmethod
+    def writeBlock(self, file, table, ids, columns):
+        """Write a block of rows given as a list of columns values"""
+        pass
+
+    def writeFooter(self, file, table):
+        pass
+
+
+class CSVExporter(TableExporter):
+    """Export a table to a .csv file"""
+    _compatibleExtensions = ['csv']
+    _formatName = 'CSV Files'
+
+    def writeHeader(self, file, table):
+        file.write(",".join(col.getName() for col in table.getColumns()) + "\n")
+
+    def writeBlock(self, file, table, ids, columns):
+        formattedColumns = [formatColumn(values) for values in columns]
+        lines = map(",".join, zip(*formattedColumns))
+        file.write("\n".join(lines))
+        file.write("\n")
+
+
+class StarExporter(TableExporter):
+    """Export a table to a STAR file as a single loop block"""
+    _compatibleExtensions = ['star']
+    _formatName = 'STAR Files'
+
+    def writeHeader(self, file, table):
+        file.write("\n# version 30001\n\ndata_%s\n\nloop_\n" % table.getName())
+        for i, col in enumerate(table.getColumns()):
+            label = col.getName()
+            if not label.startswith('_'):
+                label = '_' + label
+            file.write("%s #%d\n" % (label, i + 1))
+
+    def writeBlock(self, file, table, ids, columns):
+        formattedColumns = [formatColumn(values, self.quoteValue)
+                            for values in columns]
+        lines = map(" ".join, zip(*formattedColumns))
+        file.write("\n".join(lines))
+        file.write("\n")
+
+    def writeFooter(self, file, table):
+        file.write("\n")
+
+    @staticmethod
+    def quoteValue(value):
+        """STAR values can't be empty or contain blanks"""
+        value = formatValue(value)
+        if not value or any(c.isspace() for c in value):
+            return '"%s"' % value
+        return value
+
+
+class XLSXExporter(TableExporter):
+    """Export a table to an Excel .xlsx file. The sheet is compressed while
+    it is written with inline strings, so no shared strings table has to
+    be kept in memory"""
+    _compatibleExtensions = ['xlsx']
+    _formatName = 'XLSX Files'
+
+    def open(self):
+        if self.getRowsCount() >= XLSX_MAX_ROWS:
+            raise ValueError("An Excel sheet can't contain more than %d rows"
+                             % (XLSX_MAX_ROWS - 1))
+        self._rowNumber = 0
+        return _XLSXFile(self._filepath, self._tableName)
+
+    def writeHeader(self, file, table):
+        file.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                   '<worksheet xmlns="%s"><sheetData>' % XLSX_MAIN_NS)
+        self._writeRows(file, [[self._stringCell(col.getName())
+                                for col in table.getColumns()]])
+
+    def writeBlock(self, file, table, ids, columns):
+        cells = [self._formatCells(values) for values in columns]
+        self._writeRows(file, zip(*cells))
+
+    def writeFooter(self, file, table):
+        file.write('</sheetData></worksheet>')
+
+    def _writeRows(self, file, rows):
+        lines = []
+        for cells in rows:
+            self._rowNumber += 1
+            lines.append('<row r="%d">%s</row>' % (self._rowNumber, "".join(cells)))
+        file.write("".join(lines))
+
+    @classmethod
+    def _formatCells(cls, values):
+        """Convert the values of a column to cells"""
+        if isinstance(values, np.ndarray) and values.ndim == 1 \
+                and values.dtype.kind in 'iuf' and np.isfinite(values).all():
+            return ['<c><v>%s</v></c>' % value for value in values.astype(str).tolist()]
+        return [cls._formatCell(value) for value in values]
+
+    @classmethod
+    def _formatCell(cls, value):
+        if isinstance(value, (int, float, np.integer, np.floating)) \
+                and not isinstance(value, bool) and np.isfinite(value):
+            return '<c><v>%s</v></c>' % value
+        return cls._stringCell(formatValue(value))
+
+    @staticmethod
+    def _stringCell(value):
+        return '<c t="inlineStr"><is><t>%s</t></is></c>' % escape(str(value))
+
+
+class NpyExporter(TableExporter):
+    """Export a table to a numpy structured array (.npy). The output file is
+    memory-mapped and filled block by block, so selections are copied by
+    chunked fancy indexing. It requires a DAO that knows the table dtype
+    (see IDAO.getTableDtype)"""
+    _compatibleExtensions = ['npy']
+    _formatName = 'Numpy Files'
+
+    def open(self):
+        dtype = self._objectManager.getTableDtype(self._tableName)
+        if dtype is None or dtype.names is None:
+            raise ValueError("The table %s can't be exported to a numpy file"
+                             % self._tableName)
+        return _NpyFile(self._filepath, dtype, self.getRowsCount())
+
+    def writeBlock(self, file, table, ids, columns):
+        file.write(columns)
+
+
+class _NpyFile:
+    """Memory-mapped .npy file that is written by blocks of columns"""
+    def __init__(self, filepath, dtype, size):
+        self._filepath = filepath
+        self._dtype = dtype
+        self._size = size
+        self._array = None
+        self._position = 0
+
+    def __enter__(self):
+        self._array = np.lib.format.open_memmap(self._filepath, mode='w+',
+                                                dtype=self._dtype,
+                                                shape=(self._size,))
+        return self
+
+    def write(self, columns):
+        rows = len(columns[0]) if columns else 0
+        block = self._array[self._position:self._position + rows]
+        for name, values in zip(self._dtype.names, columns):
+            block[name] = values
+        self._position += rows
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._array.flush()
+        self._array = None
+
+
+XLSX_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+XLSX_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+XLSX_PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+XLSX_STATIC_PARTS = {
+    '[Content_Types].xml':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>',
+    '_rels/.rels':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="%s">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>' % XLSX_PKG_REL_NS,
+    'xl/_rels/workbook.xml.rels':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="%s">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>' % XLSX_PKG_REL_NS,
+}
+
+XLSX_WORKBOOK = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                 '<workbook xmlns="%s" xmlns:r="%s"><sheets>'
+                 '<sheet name="%%s" sheetId="1" r:id="rId1"/>'
+                 '</sheets></workbook>' % (XLSX_MAIN_NS, XLSX_REL_NS))
+
+
+class _XLSXFile:
+    """Zip container of a .xlsx file with a single sheet. The sheet is
+    exposed as a text stream"""
+    def __init__(self, filepath, sheetName):
+        self._filepath = filepath
+        self._sheetName = sheetName[:31]  # Excel limit
+        self._zip = None
+        self._sheet = None
+
+    def __enter__(self):
+        self._zip = zipfile.ZipFile(self._filepath, 'w', zipfile.ZIP_DEFLATED)
+        for name, content in XLSX_STATIC_PARTS.items():
+            self._zip.writestr(name, content)
+        self._zip.writestr('xl/workbook.xml',
+                           XLSX_WORKBOOK % escape(self._sheetName, {'"': '&quot;'}))
+        stream = self._zip.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True)
+        self._sheet = io.TextIOWrapper(io.BufferedWriter(stream, BUFFER_SIZE),
+                                       encoding='utf-8')
+        return self._sheet
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._sheet.close()
+        self._zip.close()
+
+
+def formatColumn(values, formatter=None):
+    """Convert the values of a column to a list of strings. Numeric numpy
+    columns are converted at once"""
+    if isinstance(values, np.ndarray) and values.ndim == 1 \
+            and values.dtype.kind in 'iufb':
+        return values.astype(str).tolist()
+    formatter = formatter or formatValue
+    return [formatter(value) for value in values]
+
+
+def formatValue(value):
+    """Convert a value to a string"""
+    if isinstance(value, np.ndarray):
+        return str(value).replace(",", "").replace('\n', '')  # Remove commas but keep brackets
+    return str(value)
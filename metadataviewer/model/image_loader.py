@@ -0,0 +1,218 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+import heapq
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger()
+
+VISIBLE = 0  # Priority of the images shown on screen
+PREFETCH = 1  # Priority of the images loaded in advance
+
+
+class ImageRequest:
+    """Image requested to an ImageLoader. The callback receives the request
+    and the rendered image (None if it could not be rendered). A request can
+    be cancelled until its callback is called"""
+    def __init__(self, renderer, key, callback, data=None, priority=()):
+        self.renderer = renderer
+        self.key = key
+        self.callback = callback
+        self.data = data  # Anything the requester needs in the callback
+        self.priority = priority
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def isCancelled(self):
+        return self._cancelled
+
+
+class ImageLoader:
+    """Pool of threads that render images in background, so the GUI can show
+    a placeholder and replace it when the image is ready. The pending
+    requests are served by priority (the lowest first, in request order for
+    the same priority), skipping the cancelled ones"""
+    def __init__(self, threads: int):
+        """
+        :param threads: number of worker threads. With 0 threads the images
+                        are rendered when they are requested
+        """
+        self._threads = threads
+        self._pending = []  # heap of (priority, order, request)
+        self._order = itertools.count()
+        self._running = {}  # key -> requests waiting for the image
+        self._condition = threading.Condition()
+        self._workers = []
+
+    def getThreads(self):
+        return self._threads
+
+    def setThreads(self, threads: int):
+        """Set the number of worker threads. Running threads are kept"""
+        self._threads = threads
+
+    def isAsync(self):
+        """Return True if the images are rendered in background"""
+        return self._threads > 0
+
+    def request(self, renderer, key, callback, data=None, priority=()) -> ImageRequest:
+        """Schedule the rendering of the image with the given key (see
+        ImageRenderer.getThumbnailKey). 'priority' is any comparable value,
+        usually a tuple"""
+        request = ImageRequest(renderer, key, callback, data, priority)
+        if not self.isAsync():
+            self._serve(request)
+            return request
+
+        with self._condition:
+            heapq.heappush(self._pending, (priority, next(self._order), request))
+            self._startWorkers()
+            self._condition.notify()
+        return request
+
+    def cancel(self, requests):
+        """Cancel the given requests. The pending ones are discarded when
+        they reach the top of the queue"""
+        for request in requests:
+            request.cancel()
+
+    def getPendingCount(self):
+        with self._condition:
+            return sum(1 for _, _, request in self._pending
+                       if not request.isCancelled())
+
+    def _startWorkers(self):
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        while len(self._workers) < self._threads:
+            worker = threading.Thread(target=self._run, daemon=True,
+                                      name='ImageLoader%d' % len(self._workers))
+            worker.start()
+            self._workers.append(worker)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                _, _, request = heapq.heappop(self._pending)
+                if request.isCancelled():
+                    continue
+                if request.key in self._running:
+                    # The image is being rendered by another worker
+                    self._running[request.key].append(request)
+                    continue
+                self._running[request.key] = [request]
+
+            image = self._render(request)
+            with self._condition:
+                requests = self._running.pop(request.key)
+            for waiting in requests:
+                self._notify(waiting, image)
+
+    def _serve(self, request):
+        self._notify(request, self._render(request))
+
+    @staticmethod
+    def _render(request):
+        try:
+            return request.renderer.renderKey(request.key)
+        except Exception as e:
+            logger.debug("Image %s could not be rendered: %s" % (request.key[0], e))
+            return None
+
+    @staticmethod
+    def _notify(request, image):
+        if not request.isCancelled():
+            request.callback(request, image)
+
+
+class ImageScheduler:
+    """Class that sets the priority of the image requests of a view. The
+    items (rows or gallery cells) on screen go first, top to bottom, then
+    the prefetched ones in the predicted scroll direction and finally the
+    ones in the opposite direction, the nearest first. Every time the view
+    moves a new generation starts and the requests of the previous ones
+    that are still pending are dropped, so only the final position of a
+    fast scroll is rendered"""
+    def __init__(self, loader: ImageLoader):
+        self._loader = loader
+        self._requests = []
+        self._generation = 0
+        self._firstItem = 0
+        self._visibleItems = 0
+        self._direction = 1
+
+    def getGeneration(self):
+        return self._generation
+
+    def getDirection(self):
+        """Return the predicted scroll direction (1 down, -1 up)"""
+        return self._direction
+
+    def newGeneration(self, firstItem: int, visibleItems: int):
+        """Start a new generation for the items shown from 'firstItem'. The
+        scroll direction is predicted from the previous position"""
+        self.cancel()
+        if self._generation and firstItem != self._firstItem:
+            self._direction = 1 if firstItem > self._firstItem else -1
+        self._generation += 1
+        self._firstItem = firstItem
+        self._visibleItems = visibleItems
+
+    def getPriority(self, item: int) -> tuple:
+        """Return the priority (visibility, direction, distance) of an
+        item"""
+        lastItem = self._firstItem + self._visibleItems
+        if self._firstItem <= item < lastItem:
+            return VISIBLE, 0, item - self._firstItem
+        if item >= lastItem:
+            distance, ahead = item - lastItem + 1, self._direction > 0
+        else:
+            distance, ahead = self._firstItem - item, self._direction < 0
+        return PREFETCH, 0 if ahead else 1, distance
+
+    def request(self, renderer, value, row, callback, item: int, data=None):
+        """Render in background the value of an item of the current
+        generation"""
+        request = self._loader.request(renderer, renderer.getThumbnailKey(value, row),
+                                       callback, data, self.getPriority(item))
+        self._requests.append(request)
+        return request
+
+    def cancel(self, condition=None):
+        """Drop the requests of the current generation (only the ones that
+        fulfill the condition if it is given)"""
+        if condition is None:
+            requests, self._requests = self._requests, []
+        else:
+            requests = [request for request in self._requests if condition(request)]
+            self._requests = [request for request in self._requests
+                              if not condition(request)]
+        self._loader.cancel(requests)
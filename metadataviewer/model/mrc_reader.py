@@ -0,0 +1,152 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from .constants import MRC_OPEN_STACKS
+from .renderers import ImageReader, ImageRenderer, splitImagePath
+
+logger = logging.getLogger()
+
+MRC_HEADER_SIZE = 1024
+MRC_MODES = {0: np.int8, 1: np.int16, 2: np.float32, 6: np.uint16,
+             12: np.float16}
+
+
+class MRCStack:
+    """MRC file whose header has been parsed and whose data is
+    memory-mapped, so any slice is read without reading the rest of the
+    file"""
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        with open(path, 'rb') as mrcFile:
+            header = mrcFile.read(MRC_HEADER_SIZE)
+        if len(header) < MRC_HEADER_SIZE:
+            raise ValueError("%s is not an MRC file" % path)
+
+        # The machine stamp gives the byte order (little endian by default)
+        byteOrder = '>' if header[212] == 0x11 else '<'
+        words = np.frombuffer(header[:96], dtype=byteOrder + 'i4')
+        self.nx, self.ny, self.nz, mode = (int(word) for word in words[:4])
+        extendedHeaderSize = int(words[23])
+        if mode not in MRC_MODES:
+            raise ValueError("MRC mode %d of %s is not supported" % (mode, path))
+
+        self.dtype = np.dtype(MRC_MODES[mode]).newbyteorder(byteOrder)
+        self.offset = MRC_HEADER_SIZE + extendedHeaderSize
+        self.data = np.memmap(path, dtype=self.dtype, mode='r', offset=self.offset,
+                              shape=(self.nz, self.ny, self.nx))
+
+    def getSize(self):
+        """Return the number of slices"""
+        return self.nz
+
+    def getSlice(self, index: int) -> np.ndarray:
+        """Return the slice with the given index (starting at 0)"""
+        if not 0 <= index < self.nz:
+            raise IndexError("%s has %d slices, %d requested"
+                             % (self.path, self.nz, index + 1))
+        return self.data[index]
+
+
+class MRCImageReader(ImageReader):
+    """Reader of MRC images, volumes and stacks. The images are addressed
+    as 'index@path' (the index starts at 1). Without index the central slice
+    is read. The parsed stacks are kept open, so reading the images of a
+    page from the same stack opens the file once"""
+    _stacks = OrderedDict()  # path -> MRCStack, the least recently used first
+    _maxStacks = MRC_OPEN_STACKS
+    _lock = threading.Lock()
+
+    @classmethod
+    def setMaxStacks(cls, maxStacks: int):
+        """Set the number of stacks that are kept open"""
+        with cls._lock:
+            cls._maxStacks = maxStacks
+            cls._evict()
+
+    @classmethod
+    def getStack(cls, path: str) -> MRCStack:
+        """Return the parsed stack of a file. It is parsed again if the file
+        has been modified"""
+        path = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime_ns
+        with cls._lock:
+            stack = cls._stacks.get(path)
+            if stack is not None and stack.mtime == mtime:
+                cls._stacks.move_to_end(path)
+                return stack
+
+        stack = MRCStack(path)
+        with cls._lock:
+            cls._stacks[path] = stack
+            cls._evict()
+        return stack
+
+    @classmethod
+    def _evict(cls):
+        while len(cls._stacks) > cls._maxStacks:
+            cls._stacks.popitem(last=False)
+
+    @classmethod
+    def clear(cls):
+        """Close all the stacks"""
+        with cls._lock:
+            cls._stacks.clear()
+
+    @classmethod
+    def readSlice(cls, path: str) -> np.ndarray:
+        """Return the values of the slice addressed by 'index@path'"""
+        index, filePath = splitImagePath(path)
+        stack = cls.getStack(filePath)
+        index = stack.getSize() // 2 if index is None else index - 1
+        return stack.getSlice(index)
+
+    @classmethod
+    def open(cls, path):
+        """Return the slice addressed by 'index@path' as an 8 bits image
+        scaled to its range of values"""
+        values = np.asarray(cls.readSlice(path), dtype=np.float32)
+        minValue, maxValue = (float(values.min()), float(values.max())) if values.size else (0, 0)
+        if maxValue > minValue:
+            values = (values - minValue) * (255 / (maxValue - minValue))
+        else:
+            values = np.zeros_like(values)
+        return Image.fromarray(values.astype(np.uint8))
+
+    @classmethod
+    def getCompatibleFileTypes(cls) -> list:
+        return ['mrc', 'mrcs', 'map']
+
+
+ImageRenderer.registerImageReader(MRCImageReader)
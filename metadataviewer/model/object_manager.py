@@ -24,16 +24,20 @@
 # *  e-mail address 'scipion@cnb.csic.es'
 # *
 # **************************************************************************
+import contextlib
 import logging
 import sys
 import os
+import threading
 import numpy as np
-from functools import lru_cache
 from abc import abstractmethod
 
 logger = logging.getLogger()
 
-from metadataviewer.model import Page, ImageRenderer
+from metadataviewer.model import Page, ColumnarPage, ImageRenderer, PageCache
+from .constants import PAGE_CACHE_SIZE, PREFETCH_PAGES, EXPORT_BLOCK_SIZE
+from .prefetcher import PagePrefetcher
+from .exporters import CSVExporter, XLSXExporter, NpyExporter, StarExporter
 
 
 class IGUI:
@@ -61,11 +65,28 @@ class IGUI:
     def show(self):
         pass
 
+    def runTask(self, title, task, background=False):
+        """Run a long task. The task is a function that receives a progress
+        function (called with the done and total amount of work) and a
+        function that returns True if the task must be cancelled. GUIs
+        should show the progress, allow cancelling it and, if 'background'
+        is True, run it in a worker thread"""
+        return task(None, None)
+
+
+class _PageLoading:
+    """Page that is being loaded by a thread. Other threads requesting it
+    wait for the event"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.page = None
+
 
 class ObjectManager:
     """Class that represent the object manager. This class maintains
     communication with the GUIs and the DAOs. """
     _DAORegistry = []
+    _exporterRegistry = [CSVExporter, XLSXExporter, NpyExporter, StarExporter]
 
     def __init__(self):
         self._fileName = None
@@ -74,6 +95,11 @@ class ObjectManager:
         self._tables = {}
         self._pageNumber = 1
         self._pageSize = 50
+        self._pageCache = PageCache(PAGE_CACHE_SIZE * 1024 * 1024)
+        self._prefetcher = PagePrefetcher(self._loadPage, PREFETCH_PAGES)
+        self._daoLock = threading.RLock()
+        self._loadingLock = threading.Lock()
+        self._loadingPages = {}  # key -> _PageLoading of the pages being loaded
 
         self._registeredRenderers = []
         self.__registerOwnDAOs()
@@ -82,6 +108,8 @@ class ObjectManager:
 
     def open(self, args):
         self._fileName = args.fileName
+        self._prefetcher.cancel()
+        self._pageCache.clear()
 
         if not os.path.exists(self._fileName):
             sys.exit("File %s does not exists. Can't continue." % self._fileName)
@@ -139,6 +167,25 @@ class ObjectManager:
         """Register a given DAO"""
         ImageRenderer.registerImageReader(reader)
 
+    @classmethod
+    def getExporterRegistry(cls):
+        """return the registered exporters"""
+        return cls._exporterRegistry
+
+    @classmethod
+    def registerExporter(cls, exporter):
+        """Register a given exporter. It takes precedence over the already
+        registered exporters of the same file types"""
+        cls._exporterRegistry.insert(0, exporter)
+
+    def selectExporter(self, filepath):
+        """Select an exporter taking into account a file extension"""
+        ext = os.path.basename(filepath).split('.')[-1]
+        for exporter in self._exporterRegistry:
+            if ext in exporter.getCompatibleFileTypes():
+                return exporter
+        return None
+
     def selectDAO(self):
         """Select a DAO taking into account a file extension"""
         for dao in self._DAORegistry:
@@ -172,9 +219,39 @@ class ObjectManager:
         table = self.getTable(tableName)
         return table.hasColumnId()
 
-    @lru_cache
+    def getPageCache(self):
+        """Return the cache of pages"""
+        return self._pageCache
+
+    def setPageCacheSize(self, maxSize: int):
+        """Set the memory budget (in MB) of the pages cache"""
+        self._pageCache.setMaxSize(maxSize * 1024 * 1024)
+
+    def invalidatePages(self, tableName=None):
+        """Discard the cached pages of a table (all of them if no table is
+        given). It must be called when the table content changes"""
+        self._pageCache.invalidate(tableName)
+
+    def getProjection(self, tableName: str, columns=None):
+        """Return the sorted indexes of the columns that must be loaded to
+        show the given ones (the columns their renderers need are added) or
+        None if all the columns are needed"""
+        if columns is None:
+            return None
+        tableColumns = self.getTable(tableName).getColumns()
+        projection = set()
+        for index in columns:
+            if 0 <= index < len(tableColumns):
+                projection.add(index)
+                renderer = tableColumns[index].getRenderer()
+                if renderer is not None:
+                    projection.update(renderer.getRequiredColumns())
+        if len(projection) == len(tableColumns):
+            return None
+        return tuple(sorted(projection))
+
     def getPage(self, tableName: str, pageNumber: int, pageSize: int,
-                actualColumn='id',  orderAsc=True):
+                actualColumn='id',  orderAsc=True, columns=None):
         """
         Method to retrieve a specific page from the tableName
         :param tableName: name of the table(block) in the file
@@ -182,12 +259,102 @@ class ObjectManager:
         :param pageSize: page size
         :param actualColumn: this parameter is used by the cache
         :param orderAsc: this parameter is used by the cache
+        :param columns: indexes of the columns to load (all if None). The
+                        values of the other columns are None
         """
+        key = (tableName, pageNumber, pageSize, actualColumn, orderAsc,
+               self.getProjection(tableName, columns))
+        page = self._pageCache.get(key)
+        if page is None:
+            page = self._loadPage(key)
+        self.page = page
+        return page
+
+    def _loadPage(self, key, generation=None):
+        """Fill the page with the given key from the DAO and store it in the
+        cache. A page that is already being loaded (e.g. by the prefetcher)
+        is waited for instead of being read again. The pages loaded by the
+        prefetcher ('generation' given) are not cached if the prefetching
+        was cancelled meanwhile"""
+        with self._loadingLock:
+            page = self._pageCache.get(key)
+            if page is not None:
+                return page
+            loading = self._loadingPages.get(key)
+            isLoader = loading is None
+            if isLoader:
+                loading = self._loadingPages[key] = _PageLoading()
+
+        if not isLoader:
+            loading.event.wait()
+            if loading.page is not None:
+                return loading.page
+            # The page could not be loaded by the other thread
+            return self._loadPage(key, generation)
+
+        try:
+            page = self._fillPage(key)
+            if generation is None or generation == self._prefetcher.getGeneration():
+                self._pageCache.put(key, page)
+            loading.page = page
+        finally:
+            with self._loadingLock:
+                del self._loadingPages[key]
+            loading.event.set()
+        return page
+
+    def _fillPage(self, key):
+        """Create the page with the given key and fill it from the DAO"""
+        tableName, pageNumber, pageSize, actualColumn, orderAsc, columns = key
         table = self.getTable(tableName)
-        self.page = Page(table, pageNumber=pageNumber, pageSize=pageSize)
-        self._dao.fillPage(self.page, actualColumn, orderAsc)
+        page = self._createPage(table, pageNumber, pageSize, columns)
+        with self._getDaoLock():
+            if self._dao.supportsRandomAccess():
+                self._dao.fillRange(page, (pageNumber - 1) * pageSize, pageSize)
+            else:
+                self._dao.fillPage(page, actualColumn, orderAsc)
         table.setSortingChanged(False)
-        return self.page
+        return page
+
+    def _getDaoLock(self):
+        """Return the lock that serializes the DAO accesses. The DAOs that
+        can be accessed from several threads are not locked, so the GUI
+        never waits for a page loaded by another thread"""
+        if self._dao.allowsConcurrentAccess():
+            return contextlib.nullcontext()
+        return self._daoLock
+
+    def setPrefetchPages(self, pages: int):
+        """Set the number of pages that are loaded in background before and
+        after the displayed ones. 0 disables the prefetching"""
+        self._prefetcher.setPages(pages)
+
+    def isPrefetchEnabled(self):
+        """Return True if the neighbouring pages are loaded in background.
+        Only the DAOs that can be accessed from several threads are
+        prefetched"""
+        return (self._dao is not None and self._prefetcher.getPages() > 0
+                and self._dao.allowsConcurrentAccess())
+
+    def cancelPrefetch(self):
+        """Stop loading the pages scheduled by the prefetcher. It should be
+        called when the user jumps to another part of the table"""
+        self._prefetcher.cancel()
+
+    def _prefetch(self, table, firstRow, columns=None):
+        """Schedule the load of the pages around the one containing
+        'firstRow'"""
+        pageNumber = self.getNumberPageFromRow(max(firstRow, 0))
+        key = self._getPageKey(table, pageNumber, columns)
+        rowCount = self.getTableRowCount(table.getName())
+        lastPage = self.getNumberPageFromRow(rowCount - 1)
+        self._prefetcher.request(key, lastPage)
+
+    def _getPageKey(self, table, pageNumber, columns=None):
+        """Return the cache key of a page of the table as it is sorted"""
+        return (table.getName(), pageNumber, self._pageSize,
+                table.getSortingColumn(), table.isSortingAsc(),
+                self.getProjection(table.getName(), columns))
 
     def getNumberPageFromRow(self, row):
         """Return the number of the page on which the row is located"""
@@ -211,21 +378,112 @@ class ObjectManager:
         if rowPosition == page.getSize():
             logger.debug("The final row of the table has been reached.")
             return None
-        row = page.getRows()[rowPosition]
+        row = page.getRow(rowPosition)
         return row
 
-    def getRows(self, tableName, firstRow, visibleRows):
-        """Return a range of rows"""
+    def getRows(self, tableName, firstRow, visibleRows, columns=None):
+        """Return the rows in the range [firstRow, firstRow + visibleRows).
+        Positions before the first row of the table are clamped to it (as
+        getCurrentRow does). If the indexes of the shown columns are given,
+        the values of the other columns are not loaded (they are None). The
+        rows are read by pages, so they are cached and the neighbouring
+        pages are prefetched"""
+        table = self.getTable(tableName)
+        start = max(firstRow, 0)
+        numberOfRows = visibleRows - (start - firstRow)
+        if numberOfRows <= 0:
+            rows = []
+        else:
+            rows = self._getPagesRange(table, start, numberOfRows, columns)
+            if rows and self.isPrefetchEnabled():
+                self._prefetch(table, start, columns)
+
+        if rows and start > firstRow:
+            rows = [rows[0]] * (start - firstRow) + rows
+        return rows
+
+    def getCachedRows(self, tableName, firstRow, numberOfRows, columns=None):
+        """Return the (position, row) of the rows in the range
+        [firstRow, firstRow + numberOfRows) whose pages are already cached
+        (e.g. by the prefetcher). The DAO is never read"""
+        table = self.getTable(tableName)
+        pageSize = self.getPageSize()
+        firstRow = max(firstRow, 0)
+        lastRow = firstRow + numberOfRows
         rows = []
+        if numberOfRows <= 0:
+            return rows
+        for pageNumber in range(self.getNumberPageFromRow(firstRow),
+                                self.getNumberPageFromRow(lastRow - 1) + 1):
+            page = self._pageCache.get(self._getPageKey(table, pageNumber, columns))
+            if page is None:
+                continue
+            pageFirstRow = (pageNumber - 1) * pageSize
+            for position in range(max(firstRow, pageFirstRow),
+                                  min(lastRow, pageFirstRow + page.getSize())):
+                rows.append((position, page.getRow(position - pageFirstRow)))
+        return rows
+
+    def getRowsColumns(self, tableName, firstRow, numberOfRows, columns=None):
+        """Return a ColumnarPage with the rows in the range
+        [firstRow, firstRow + numberOfRows), so their values can be read
+        column by column. Only the given columns are loaded (all if None).
+        The rows are read by pages, as getRows does, and the columns of the
+        columnar pages are sliced without boxing their values"""
         table = self.getTable(tableName)
-        for i in range(visibleRows):
-            row = self.getCurrentRow(table, firstRow)
-            if row:
-                rows.append(row)
-                firstRow += 1
+        firstRow = max(firstRow, 0)
+        rangePage = ColumnarPage(table, pageNumber=1, pageSize=numberOfRows,
+                                 columns=self.getProjection(tableName, columns))
+        if numberOfRows <= 0:
+            return rangePage
+
+        pageSize = self.getPageSize()
+        lastRow = firstRow + numberOfRows
+        for pageNumber in range(self.getNumberPageFromRow(firstRow),
+                                self.getNumberPageFromRow(lastRow - 1) + 1):
+            page = self.getPage(tableName, pageNumber, pageSize,
+                                table.getSortingColumn(), table.isSortingAsc(),
+                                columns)
+            pageFirstRow = (pageNumber - 1) * pageSize
+            start, stop = max(firstRow - pageFirstRow, 0), lastRow - pageFirstRow
+            if isinstance(page, ColumnarPage):
+                rangePage.addColumns(page.getIds()[start:stop],
+                                     [None if values is None else values[start:stop]
+                                      for values in page.getColumnsValues()])
             else:
+                rangePage.addRows((row.getId(), row.getValues())
+                                  for row in page.getRows()[start:stop])
+            if page.getSize() < pageSize:  # The end of the table was reached
+                break
+
+        if rangePage.getSize() and self.isPrefetchEnabled():
+            self._prefetch(table, firstRow, columns)
+        return rangePage
+
+    def _createPage(self, table, pageNumber, pageSize, columns=None):
+        """Create the page to be filled by the DAO. The columnar DAOs fill
+        columnar pages, so the values are not boxed row by row"""
+        pageClass = ColumnarPage if self._dao.isColumnar() else Page
+        return pageClass(table, pageNumber=pageNumber, pageSize=pageSize,
+                         columns=columns)
+
+    def _getPagesRange(self, table, firstRow, numberOfRows, columns=None):
+        """Return the rows in the range [firstRow, firstRow + numberOfRows)
+        fetching all the pages it covers"""
+        pageSize = self.getPageSize()
+        firstPage = self.getNumberPageFromRow(firstRow)
+        lastPage = self.getNumberPageFromRow(firstRow + numberOfRows - 1)
+        rows = []
+        for pageNumber in range(firstPage, lastPage + 1):
+            page = self.getPage(table.getName(), pageNumber, pageSize,
+                                table.getSortingColumn(), table.isSortingAsc(),
+                                columns)
+            rows.extend(page.getRows())
+            if page.getSize() < pageSize:  # The end of the table was reached
                 break
-        return rows
+
+        start = firstRow - (firstPage - 1) * pageSize
+        return rows[start:start + numberOfRows]
 
     def getColumnsValues(self, tableName, selectedColumns, xAxis, selection,
                          limit, useSelection):
@@ -242,8 +500,19 @@ class ObjectManager:
                                                           numberOfRows, column,
                                                           reverse)
         self._gui.writeMessage('Storing selection...')
-        for i, rowId in enumerate(selectedRange):
-            table.getSelection().addRowSelected(rowId, remove=remove)
+        table.getSelection().addRows(selectedRange, remove=remove)
+
+    def invertSelection(self, tableName):
+        """Select the rows that are not selected and unselect the others.
+        The ids are only read if the DAO doesn't know their range"""
+        selection = self.getTable(tableName).getSelection()
+        idsRange = self._dao.getRowIdsRange(tableName)
+        if idsRange is not None:
+            selection.invert(idsRange[1], idsRange[0])
+        else:
+            rowCount = self.getTableRowCount(tableName)
+            ids = self._dao.getSelectedRangeRowsIds(tableName, 1, rowCount, None)
+            selection.addRows(ids, remove=True)
 
     def getTables(self):
         """Return a dictionary with the Tables. The key should be the table name. Tables at least should have the name. Optionally the alias. Table definition  could come later"""
@@ -260,6 +529,12 @@ class ObjectManager:
     def getTableRowCount(self, tableName: str):
         return self._dao.getTableRowCount(tableName)
 
+    def isTableRowCountFinal(self, tableName: str):
+        return self._dao.isRowCountFinal(tableName)
+
+    def getTableDtype(self, tableName: str):
+        return self._dao.getTableDtype(tableName)
+
     def setColumnsIndex(self, table):
         index = 0
         tableName = table.getName()
@@ -310,44 +585,84 @@ class ObjectManager:
         table = self.getTable(tableName)
         table.setSortingColumn(column)
         table.setSortingAsc(reverse)
+        self.cancelPrefetch()
+        self.invalidatePages(tableName)
 
     def getTableWithAdditionalInfo(self):
         return self._dao.getTableWithAdditionalInfo()
 
-    def exportToCSV(self, tableName):
-        """Export the table selection to a .csv file"""
+    def iterRowsBlocks(self, tableName, ids=None, blockSize=EXPORT_BLOCK_SIZE):
+        """Iterate over the rows of a table in blocks of 'blockSize' rows.
+        Every block is a tuple (ids, columns) where columns is a list with
+        the values of every table column. If 'ids' is given only those rows
+        are returned. The pages cache is not used"""
         table = self.getTable(tableName)
-        selection = table.getSelection().getSelection()
-        columns = table.getColumns()
-        filepath = self._gui.getSaveFileName()
+        if self._dao.isColumnar():
+            yield from self._iterColumnarBlocks(table, ids, blockSize)
+            return
+
+        selectedIds = set(ids) if ids is not None else None
+        firstRow = 0
+        while True:
+            page = Page(table, pageNumber=firstRow // blockSize + 1,
+                        pageSize=blockSize)
+            with self._getDaoLock():
+                if self._dao.supportsRandomAccess():
+                    self._dao.fillRange(page, firstRow, blockSize)
+                else:
+                    self._dao.fillPage(page, table.getSortingColumn(),
+                                       table.isSortingAsc())
+            rows = page.getRows()
+            if selectedIds is not None:
+                rows = [row for row in rows if row.getId() in selectedIds]
+            if rows:
+                blockIds = [row.getId() for row in rows]
+                columns = list(zip(*[row.getValues() for row in rows]))
+                yield blockIds, columns
+            if page.getSize() < blockSize:
+                break
+            firstRow += blockSize
+
+    def _iterColumnarBlocks(self, table, ids, blockSize):
+        """Iterate over the blocks of a columnar DAO"""
+        if ids is None:
+            rowCount = self.getTableRowCount(table.getName())
+            for firstRow in range(0, rowCount, blockSize):
+                with self._getDaoLock():
+                    block = self._dao.getColumnsBlock(table, firstRow, blockSize)
+                yield block
+        else:
+            for first in range(0, len(ids), blockSize):
+                with self._getDaoLock():
+                    block = self._dao.getColumnsBlock(table, 0, 0,
+                                                      ids=ids[first:first + blockSize])
+                yield block
+
+    def exportTable(self, tableName, filepath):
+        """Export the table selection (or the whole table if there is no
+        selection) to a file. The exporter is chosen by the file extension"""
+        exporterClass = self.selectExporter(filepath)
+        if exporterClass is None:
+            raise ValueError("There is no exporter for %s" % filepath)
+
+        selection = self.getTable(tableName).getSelection()
+        ids = selection.getIds() if selection.getCount() > 1 else None
+        exporter = exporterClass(self, tableName, filepath, ids)
+        return self._gui.runTask('Exporting to %s' % os.path.basename(filepath),
+                                 exporter.export,
+                                 background=self._dao.allowsConcurrentAccess())
 
+    def exportToCSV(self, tableName):
+        """Export the table selection (or the whole table if there is no
+        selection) to a .csv file"""
+        filepath = self._gui.getSaveFileName()
         if filepath:
-            with open(filepath, 'w', encoding='utf-8') as txtFile:
-                # Write headers
-                header_data = [col.getName() for col in columns]
-                txtFile.write(",".join(header_data) + "\n")
-
-                def formatValue(value):
-                    if isinstance(value, np.ndarray):
-                        return str(value).replace(",", "").replace('\n', '')  # Remove commas but keep brackets
-                    return str(value)
-
-                if selection and len(selection) > 1:  # Export the selected rows
-                    for row, rowId in enumerate(selection):
-                        rowValues = self.getCurrentRow(table, rowId - 1).getValues()
-                        if rowValues is not None:
-                            formattedValues = [formatValue(val) for val in rowValues]
-                            txtFile.write(",".join(formattedValues) + "\n")
-                else:  # Export the entire table
-                    rowCount = self.getTableRowCount(tableName)
-                    for rowId in range(rowCount):
-                        rowValues = self.getCurrentRow(table, rowId).getValues()
-                        if rowValues is not None:
-                            formattedValues = [formatValue(val) for val in rowValues]
-                            txtFile.write(",".join(formattedValues) + "\n")
-
-
-
-
-
+            self.exportTable(tableName, filepath)
 
+    def exportToExcel(self, tableName, filepath):
+        """Export the table selection (or the whole table if there is no
+        selection) to a .xlsx file"""
+        if filepath:
+            if not filepath.endswith('.xlsx'):
+                filepath += '.xlsx'
+            self.exportTable(tableName, filepath)
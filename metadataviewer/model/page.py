@@ -25,15 +25,22 @@
 # *
 # **************************************************************************
 import logging
+import sys
+from collections.abc import MutableMapping
+import numpy as np
 
 logger = logging.getLogger()
 
+from .constants import COLUMN_ID
 from .renderers import (IntRenderer, FloatRenderer, ImageRenderer, BoolRenderer,
                         MatrixRender, StrRenderer)
 
 
 class Column:
     """Class that represent a column"""
+    __slots__ = ('_name', '_alias', '_renderer', '_isSorteable', '_isVisible',
+                 '_index')
+
     def __init__(self, name, renderer=None):
         self._name = name
         self._alias = None
@@ -98,8 +105,24 @@ class Column:
         return self.__cmp__(other)
 
 
-class Row:
-    """Class that represent a row"""
+class IRow:
+    """Interface of the page rows"""
+    __slots__ = ()
+
+    def getId(self):
+        """Return the row id"""
+        raise NotImplementedError()
+
+    def getValues(self):
+        """Return the row values"""
+        raise NotImplementedError()
+
+
+class Row(IRow):
+    """Class that represent a row. Pages create one per record, so it has
+    no instance dictionary"""
+    __slots__ = ('_id', '_values')
+
     def __init__(self, id, values):
         self._id = id
         self._values = values
@@ -145,9 +168,44 @@ class Selection:
             self._selection.pop(rowId)
             self._count -= 1
 
+    def addRows(self, rowsIds, remove=True):
+        """Add a list of rows at once. If remove is True the rows that were
+        already selected are unselected"""
+        if hasattr(rowsIds, 'tolist'):  # numpy arrays
+            rowsIds = rowsIds.tolist()
+        rowsIds = set(rowsIds)
+        if remove:
+            selectedRows = self._selection.keys() & rowsIds
+            for rowId in selectedRows:
+                del self._selection[rowId]
+            rowsIds -= selectedRows
+        self._selection.update(dict.fromkeys(rowsIds, True))
+        self._count = len(self._selection)
+
     def isRowSelected(self, rowId):
         return rowId in self._selection
 
+    def getIds(self):
+        """Return the sorted list of the selected rows ids"""
+        return sorted(self._selection)
+
+    def union(self, other):
+        """Add the rows selected in other selection"""
+        self.addRows(other.getIds(), remove=False)
+
+    def intersect(self, other):
+        """Keep only the rows that are also selected in other selection"""
+        self._selection = {rowId: True for rowId in self._selection
+                           if other.isRowSelected(rowId)}
+        self._count = len(self._selection)
+
+    def invert(self, stop, start=0):
+        """Invert the selection of the rows with ids in the range
+        [start, stop). The rows outside it are unselected"""
+        self._selection = {rowId: True for rowId in range(start, stop)
+                           if rowId not in self._selection}
+        self._count = len(self._selection)
+
     def clear(self):
         self._selection.clear()
         self._count = 0
@@ -159,8 +217,156 @@ class Selection:
         return newSelection
 
 
+class BitmapSelection(Selection):
+    """Selection stored as a boolean array indexed by the row id. It takes
+    one byte per row of the table (instead of a dictionary entry per
+    selected row) and supports vectorized operations. Rows ids must be
+    non-negative integers"""
+    def __init__(self, size=0):
+        self._bitmap = np.zeros(size, dtype=bool)
+        self._count = 0
+
+    def _resize(self, size):
+        """Grow the bitmap to hold at least 'size' rows"""
+        if size > len(self._bitmap):
+            bitmap = np.zeros(max(size, 2 * len(self._bitmap)), dtype=bool)
+            bitmap[:len(self._bitmap)] = self._bitmap
+            self._bitmap = bitmap
+
+    def _updateCount(self):
+        self._count = int(np.count_nonzero(self._bitmap))
+
+    def getSelection(self):
+        """Return a read only view of the selected ids that can be used as
+        the dictionary returned by the Selection class"""
+        return _BitmapSelectionView(self)
+
+    def getBitmap(self):
+        return self._bitmap
+
+    def addRowSelected(self, rowId, remove=True):
+        rowId = int(rowId)
+        if not self.isRowSelected(rowId):
+            self._resize(rowId + 1)
+            self._bitmap[rowId] = True
+            self._count += 1
+        elif remove:
+            self._bitmap[rowId] = False
+            self._count -= 1
+
+    def addRows(self, rowsIds, remove=True):
+        rowsIds = np.asarray(rowsIds, dtype=np.int64)
+        if not rowsIds.size:
+            return
+        self._resize(int(rowsIds.max()) + 1)
+        if remove:
+            self._bitmap[rowsIds] = ~self._bitmap[rowsIds]
+        else:
+            self._bitmap[rowsIds] = True
+        self._updateCount()
+
+    def addRange(self, start, stop, remove=False):
+        """Select the rows with ids in the range [start, stop)"""
+        self._resize(stop)
+        if remove:
+            np.logical_not(self._bitmap[start:stop], out=self._bitmap[start:stop])
+        else:
+            self._bitmap[start:stop] = True
+        self._updateCount()
+
+    def isRowSelected(self, rowId):
+        try:
+            return 0 <= rowId < len(self._bitmap) and bool(self._bitmap[rowId])
+        except (TypeError, IndexError):
+            return False
+
+    def getIds(self):
+        return np.flatnonzero(self._bitmap)
+
+    def union(self, other):
+        if isinstance(other, BitmapSelection):
+            self._resize(len(other._bitmap))
+            self._bitmap[:len(other._bitmap)] |= other._bitmap
+            self._updateCount()
+        else:
+            super().union(other)
+
+    def intersect(self, other):
+        if isinstance(other, BitmapSelection):
+            size = min(len(self._bitmap), len(other._bitmap))
+            self._bitmap[size:] = False
+            self._bitmap[:size] &= other._bitmap[:size]
+        else:
+            mask = np.zeros(len(self._bitmap), dtype=bool)
+            for rowId in self.getIds():
+                mask[rowId] = other.isRowSelected(int(rowId))
+            self._bitmap &= mask
+        self._updateCount()
+
+    def invert(self, stop, start=0):
+        """Invert the selection of the rows with ids in the range
+        [start, stop). The rows outside it are unselected"""
+        self._resize(stop)
+        self._bitmap[:start] = False
+        self._bitmap[stop:] = False
+        np.logical_not(self._bitmap[start:stop], out=self._bitmap[start:stop])
+        self._updateCount()
+
+    def clear(self):
+        self._bitmap[:] = False
+        self._count = 0
+
+    def clone(self):
+        newSelection = BitmapSelection()
+        newSelection._count = self._count
+        newSelection._bitmap = self._bitmap.copy()
+        return newSelection
+
+
+class _BitmapSelectionView(MutableMapping):
+    """Dictionary like view of a BitmapSelection ({rowId: True} for every
+    selected row), so it can be used as the dictionary returned by the
+    Selection class. Changes are applied to the selection"""
+    def __init__(self, selection):
+        self._selection = selection
+
+    def __getitem__(self, rowId):
+        if not self._selection.isRowSelected(rowId):
+            raise KeyError(rowId)
+        return True
+
+    def __setitem__(self, rowId, selected):
+        if selected:
+            self._selection.addRowSelected(rowId, remove=False)
+        else:
+            self.pop(rowId, None)
+
+    def __delitem__(self, rowId):
+        if not self._selection.isRowSelected(rowId):
+            raise KeyError(rowId)
+        self._selection.addRowSelected(rowId)
+
+    def __contains__(self, rowId):
+        return self._selection.isRowSelected(rowId)
+
+    def __len__(self):
+        return self._selection.getCount()
+
+    def __bool__(self):
+        return not self._selection.isEmpty()
+
+    def __iter__(self):
+        return iter(self._selection.getIds().tolist())
+
+    def clear(self):
+        self._selection.clear()
+
+
 class Table:
     """Class that represent a table"""
+    __slots__ = ('_name', '_alias', '_columns', '_sortingColumn', '_sortingAsc',
+                 '_sortingChanged', '_actions', '_selection', '_hasColumnId')
+
     def __init__(self, name, columns=None):
         self._name = name
         self._alias = None
@@ -169,7 +375,7 @@ class Table:
         self._sortingAsc = True
         self._sortingChanged = False
         self._actions = []
-        self._selection = Selection()
+        self._selection = BitmapSelection()
         self._hasColumnId = True
 
     def hasColumnId(self):
@@ -279,29 +485,78 @@ class Table:
 
 
 class Page:
-    """Class that represent a Page"""
-    def __init__(self, table: Table, pageNumber=1, pageSize=10):
+    """Class that represent a Page. A page can be restricted to some columns
+    (its projection): the rows keep a value per table column, but the ones
+    outside the projection are None"""
+    def __init__(self, table: Table, pageNumber=1, pageSize=10, columns=None):
         self._table = table
         self._rows = list()
         self._pageNumber = pageNumber
         self._pageSize = pageSize
+        self._columns = None if columns is None else tuple(sorted(set(columns)))
 
     def getTable(self):
         """Return the page table"""
         return self._table
 
+    def getProjection(self):
+        """Return the sorted indexes of the columns that must be filled or
+        None if the page has all the columns"""
+        return self._columns
+
+    def isProjected(self):
+        """Return True if the page only has some of the columns"""
+        return self._columns is not None
+
+    def projectValues(self, values, columnsCount):
+        """Place the values of the projected columns in a row of
+        'columnsCount' values"""
+        if self._columns is None:
+            return values
+        rowValues = [None] * columnsCount
+        indexes = [index for index in self._columns if index < columnsCount]
+        for index, value in zip(indexes, values):
+            rowValues[index] = value
+        return rowValues
+
     def getRows(self):
         """Return the page rows"""
         return self._rows
 
+    def getRow(self, position):
+        """Return the row in the given position of the page"""
+        return self._rows[position]
+
     def addRow(self, row):
         """Add a given row"""
         self._rows.append(Row(row[0], row[1]))
 
+    def addRows(self, rows):
+        """Add a list of rows. Every row is a tuple (id, values)"""
+        self._rows.extend([Row(id, values) for id, values in rows])
+
+    def addColumns(self, ids, columns):
+        """Add the rows given column by column: the row ids and a sequence
+        (usually a numpy array) with the values of every table column. The
+        columns out of the projection may be None"""
+        size = len(ids)
+        columns = [_columnToList(values, size) for values in columns]
+        rowsValues = zip(*columns) if columns else ([] for _ in range(size))
+        self.addRows(zip(_columnToList(ids, size), map(list, rowsValues)))
+
     def getSize(self):
         """Return the number of rows that the page has"""
         return len(self._rows)
 
+    def getMemorySize(self):
+        """Return an estimation of the memory (in bytes) taken by the page"""
+        size = sys.getsizeof(self._rows)
+        for row in self._rows:
+            values = row.getValues()
+            size += sys.getsizeof(row) + sys.getsizeof(values)
+            size += sum(map(sys.getsizeof, values))
+        return size
+
     def getPageSize(self):
         """Return the page size"""
         return self._pageSize
@@ -334,8 +589,144 @@ class Page:
             yield row
 
 
+class ColumnarRow(IRow):
+    """Row of a columnar page. Its values are read from the page columns
+    when they are requested"""
+    __slots__ = ('_page', '_position')
+
+    def __init__(self, page, position):
+        self._page = page
+        self._position = position
+
+    def getId(self):
+        """Return the row id"""
+        return self._page.getValue(COLUMN_ID, self._position)
+
+    def getValues(self):
+        """Return the row values"""
+        return self._page.getRowValues(self._position)
+
+
+class ColumnarPage(Page):
+    """Page that keeps the values by columns: an array with the rows ids and
+    an array (or any sequence) per table column, None for the columns out
+    of the projection. The rows are views created on demand, so the values
+    are only boxed for the rows that are used"""
+    def __init__(self, table: Table, pageNumber=1, pageSize=10, columns=None):
+        super().__init__(table, pageNumber, pageSize, columns)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._columnsValues = []
+        self._rows = None  # Row views, created the first time they are used
+
+    def getIds(self):
+        """Return the array with the rows ids"""
+        return self._ids
+
+    def getColumnsValues(self):
+        """Return the values of every table column"""
+        return self._columnsValues
+
+    def getColumnValues(self, index):
+        """Return the values of the column with the given index (None if it
+        is out of the projection)"""
+        return self._columnsValues[index]
+
+    def getValue(self, index, position):
+        """Return the value of a column (or the id if the index is
+        COLUMN_ID) in a row position as a python object"""
+        values = self._ids if index == COLUMN_ID else self._columnsValues[index]
+        if values is None:
+            return None
+        value = values[position]
+        # Sub-arrays are kept as numpy arrays
+        return value.item() if isinstance(value, np.generic) else value
+
+    def getRowValues(self, position):
+        """Return the values of the row in the given position"""
+        return [self.getValue(index, position)
+                for index in range(len(self._columnsValues))]
+
+    def getRows(self):
+        """Return views of the page rows"""
+        if self._rows is None:
+            self._rows = [ColumnarRow(self, position) for position in range(self.getSize())]
+        return self._rows
+
+    def getRow(self, position):
+        if self._rows is not None:
+            return self._rows[position]
+        if not -self.getSize() <= position < self.getSize():
+            raise IndexError("Page row %d out of range" % position)
+        return ColumnarRow(self, position % self.getSize())
+
+    def addRow(self, row):
+        self.addRows([row])
+
+    def addRows(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        ids, rowsValues = zip(*rows)
+        projection = self.getProjection()
+        columns = [list(values) if projection is None or index in projection else None
+                   for index, values in enumerate(zip(*rowsValues))]
+        self.addColumns(ids, columns or [[] for _ in self._columnsValues])
+
+    def addColumns(self, ids, columns):
+        ids = np.asarray(ids, dtype=np.int64)
+        self._rows = None
+        if not len(self._ids):
+            self._ids, self._columnsValues = ids, list(columns)
+            return
+        size, newSize = len(self._ids), len(ids)
+        self._ids = np.concatenate((self._ids, ids))
+        self._columnsValues = [_concatenateColumns(oldValues, size, newValues, newSize)
+                               for oldValues, newValues in zip(self._columnsValues, columns)]
+
+    def getSize(self):
+        return len(self._ids)
+
+    def getMemorySize(self):
+        # The row views may be created later
+        size = sys.getsizeof(self._columnsValues) + self._ids.nbytes
+        size += self.getSize() * (sys.getsizeof(ColumnarRow(self, 0)) + 8)
+        for values in self._columnsValues:
+            if isinstance(values, np.ndarray):
+                size += values.nbytes
+            elif values is not None:
+                size += sys.getsizeof(values) + sum(map(sys.getsizeof, values))
+        return size
+
+    def clear(self):
+        self._ids = np.empty(0, dtype=np.int64)
+        self._columnsValues = []
+        self._rows = None
+
+    def __iter__(self):
+        yield from self.getRows()
+
+
 # --------- Helper functions  ------------------------
 
+def _columnToList(values, size):
+    """Return the values of a column as a list of python objects"""
+    if values is None:
+        return [None] * size
+    if isinstance(values, np.ndarray):
+        # Sub-arrays are kept as numpy arrays
+        return values.tolist() if values.ndim == 1 else list(values)
+    return list(values)
+
+
+def _concatenateColumns(values, size, newValues, newSize):
+    """Append the values of a column to the values already in a page"""
+    if values is None and newValues is None:
+        return None
+    if isinstance(values, np.ndarray) and isinstance(newValues, np.ndarray):
+        return np.concatenate((values, newValues))
+    return _columnToList(values, size) + _columnToList(newValues, newSize)
+
+
 def _guessRenderer(strValue):
     """Return a render for a given value. This render is assigned to a column"""
     if strValue is None:
@@ -385,6 +776,18 @@ def _guessType(strValue):
             return str
 
 
+def _convertValue(strValue, valueType):
+    """Convert a value to a type guessed with _guessType. Values of integer
+    columns may be floats and any value may be a string"""
+    try:
+        return valueType(strValue)
+    except ValueError:
+        try:
+            return float(strValue)
+        except ValueError:
+            return strValue
+
+
 def _guessTypesFromLine(line):
     return [_guessType(v) for v in line.split()]
 
@@ -0,0 +1,113 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+import logging
+import threading
+
+logger = logging.getLogger()
+
+
+class PagePrefetcher:
+    """Class that loads, in a worker thread, the pages around the last page
+    requested by the GUI and stores them in the pages cache. The scroll
+    direction is predicted from the last requests, so the pages in that
+    direction are loaded first"""
+    def __init__(self, loadPage, pages: int):
+        """
+        :param loadPage: function that receives a page key (tableName,
+                         pageNumber, pageSize, sortingColumn, orderAsc) and
+                         loads the page into the cache
+        :param pages: number of pages to load in each direction
+        """
+        self._loadPage = loadPage
+        self._pages = pages
+        self._pending = []
+        self._lastKey = None
+        self._direction = 1
+        self._generation = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def getPages(self):
+        return self._pages
+
+    def setPages(self, pages: int):
+        """Set the number of pages to load in each direction"""
+        self._pages = pages
+
+    def request(self, key, lastPage: int):
+        """Schedule the neighbouring pages of the page with the given key.
+        Pages beyond 'lastPage' are not loaded"""
+        if self._pages <= 0:
+            return
+
+        tableName, pageNumber = key[0], key[1]
+        if self._lastKey is not None and self._lastKey[0] == tableName \
+                and self._lastKey[1] != pageNumber:
+            self._direction = 1 if pageNumber > self._lastKey[1] else -1
+        self._lastKey = key
+
+        pending = []
+        for direction in (self._direction, -self._direction):
+            for distance in range(1, self._pages + 1):
+                neighbour = pageNumber + direction * distance
+                if 1 <= neighbour <= lastPage:
+                    pending.append((tableName, neighbour) + tuple(key[2:]))
+
+        with self._condition:
+            self._pending = pending
+            self._startThread()
+            self._condition.notify()
+
+    def cancel(self):
+        """Discard the pending pages and the page that is being loaded"""
+        with self._condition:
+            self._generation += 1
+            self._pending = []
+            self._lastKey = None
+
+    def getGeneration(self):
+        """Return a number that changes every time the prefetching is
+        cancelled"""
+        return self._generation
+
+    def _startThread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='PagePrefetcher')
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                key = self._pending.pop(0)
+                generation = self._generation
+            try:
+                self._loadPage(key, generation)
+            except Exception as e:
+                logger.debug("Page %s could not be prefetched: %s" % (key, e))
@@ -29,12 +29,38 @@ logger = logging.getLogger()
 
 import numpy as np
 import os.path
-from functools import lru_cache
 
-from PIL import Image
+from PIL import Image, ImageOps, ImageFilter
 from abc import abstractmethod
 
-from .constants import IMAGE_DEFAULT_SIZE
+from .cache import ThumbnailCache
+from .constants import IMAGE_DEFAULT_SIZE, THUMBNAIL_CACHE_SIZE, IMAGE_LOADER_THREADS
+from .image_loader import ImageLoader
+
+AUTOCONTRAST = 'autocontrast'
+GAUSSIAN_BLUR = 'gaussianBlur'
+IMAGE_FILTERS = {AUTOCONTRAST: ImageOps.autocontrast,
+                 GAUSSIAN_BLUR: lambda image: image.filter(ImageFilter.GaussianBlur(radius=0.5))}
+
+
+def getImageFilters(autocontrast: bool, gaussianBlur: bool) -> list:
+    """Return the names of the filters (see IMAGE_FILTERS) enabled by the
+    views options"""
+    filters = []
+    if autocontrast:
+        filters.append(AUTOCONTRAST)
+    if gaussianBlur:
+        filters.append(GAUSSIAN_BLUR)
+    return filters
+
+
+def splitImagePath(path: str):
+    """Split an image path addressed as 'index@path' (the index of an image
+    in a stack, starting at 1). The index is None if the path has none"""
+    index, separator, filePath = str(path).partition('@')
+    if separator and index.isdigit():
+        return int(index), filePath
+    return None, path
 
 
 class Action:
@@ -59,6 +85,11 @@ class IRenderer:
     def getActions(self):
         return self._extraActions
 
+    def getRequiredColumns(self):
+        """Return the indexes of the other row values used to render a value.
+        They are loaded together with the rendered column"""
+        return []
+
     @abstractmethod
     def _render(self, value, row):
         pass
@@ -172,12 +203,16 @@ class PILImageReader(ImageReader):
 
 class ImageRenderer(IRenderer):
     _imageReaders = []
+    _thumbnailCache = ThumbnailCache(THUMBNAIL_CACHE_SIZE * 1024 * 1024)
+    _diskCache = None
+    _imageLoader = None
 
     def __init__(self, size=IMAGE_DEFAULT_SIZE, rotColumnIndex=None):
         super().__init__()
         self._size = size
         self._rotColumnIndex = rotColumnIndex  # index in the row values where rotation can be found
         self._applyTransformation = False
+        self._filters = ()
 
     def getSize(self):
         return self._size
@@ -191,6 +226,9 @@ class ImageRenderer(IRenderer):
     def hasTransformation(self):
         return self._rotColumnIndex is not None
 
+    def getRequiredColumns(self):
+        return [] if self._rotColumnIndex is None else [self._rotColumnIndex]
+
     @classmethod
     def registerImageReader(cls, imageReader):
         cls._imageReaders.append(imageReader)
@@ -206,20 +244,109 @@ class ImageRenderer(IRenderer):
     def setSize(self, size):
         self._size = size
 
-    def _render(self, value, row):
+    def getFilters(self):
+        return self._filters
+
+    def setFilters(self, filters):
+        """Set the names of the filters (see IMAGE_FILTERS) applied to the
+        rendered images"""
+        self._filters = tuple(filters)
+
+    @classmethod
+    def getThumbnailCache(cls):
+        """Return the cache of rendered images shared by all the renderers"""
+        return cls._thumbnailCache
+
+    @classmethod
+    def setThumbnailCacheSize(cls, maxSize: int):
+        """Set the memory budget (in MB) of the thumbnails cache"""
+        cls._thumbnailCache.setMaxSize(maxSize * 1024 * 1024)
+
+    @classmethod
+    def getDiskCache(cls):
+        """Return the persistent thumbnails cache (None if it is disabled)"""
+        return cls._diskCache
+
+    @classmethod
+    def setDiskCache(cls, diskCache):
+        """Set the persistent thumbnails cache (a ThumbnailDiskCache) or
+        disable it (None)"""
+        cls._diskCache = diskCache
+
+    @staticmethod
+    def getFileIdentity(path):
+        """Return the (mtime, size) of an image file (the stack file of an
+        'index@path' image) or None if it can not be read"""
+        try:
+            stat = os.stat(splitImagePath(path)[1])
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @classmethod
+    def getImageLoader(cls):
+        """Return the pool of threads that renders the images in background
+        (shared by all the renderers)"""
+        if cls._imageLoader is None:
+            cls._imageLoader = ImageLoader(IMAGE_LOADER_THREADS)
+        return cls._imageLoader
+
+    def getThumbnailKey(self, value, row):
+        """Return the key (path, size, rotation, filters) of the image that
+        renders a value"""
         rotationAngle = 0
         if row and self._rotColumnIndex and self._applyTransformation:
             rotationAngle = row[self._rotColumnIndex]
-        return self._renderWithSize(value, self._size, rotationAngle)
+        return value, self._size, rotationAngle, self._filters
+
+    def getCachedImage(self, value, row):
+        """Return the rendered image if it is in the thumbnails cache or
+        None"""
+        return self._thumbnailCache.get(self.getThumbnailKey(value, row))
+
+    def renderAsync(self, value, row, callback, data=None, priority=()):
+        """Render a value in background. The callback (called from a worker
+        thread) receives the ImageRequest and the image"""
+        return self.getImageLoader().request(self, self.getThumbnailKey(value, row),
+                                             callback, data, priority)
+
+    def _render(self, value, row):
+        return self.renderKey(self.getThumbnailKey(value, row))
+
+    def renderKey(self, key):
+        """Return the image with the given thumbnail key. It is read from
+        the caches or rendered"""
+        image = self._thumbnailCache.get(key)
+        if image is None:
+            image = self._renderCached(*key)
+            self._thumbnailCache.put(key, image)
+        return image
+
+    def _renderCached(self, value, size, rotationAngle, filters):
+        """Read the image from the disk cache or render it (and store it
+        there)"""
+        diskCache = self._diskCache
+        identity = self.getFileIdentity(value) if diskCache is not None else None
+        if identity is None:
+            return self._renderWithSize(value, size, rotationAngle, filters)
+
+        index, path = splitImagePath(value)
+        diskKey = (os.path.abspath(path), index) + identity + (size, (rotationAngle, filters))
+        image = diskCache.get(diskKey)
+        if image is None:
+            image = self._renderWithSize(value, size, rotationAngle, filters)
+            diskCache.put(diskKey, image)
+        return image
 
-    @lru_cache
-    def _renderWithSize(self, value, size, rotationAngle):
+    def _renderWithSize(self, value, size, rotationAngle, filters=()):
         imageReader = self.getImageReader(value)
         image = imageReader.open(value)
         sizeX, sizeY = image.size
         imageR = image.resize((size, int(size*sizeY/sizeX)))
         imageR.thumbnail((size, size))
         imageR = imageR.rotate(rotationAngle, fillcolor='gray')
+        for name in filters:
+            imageR = IMAGE_FILTERS[name](imageR)
         return imageR
 
     def renderType(self):
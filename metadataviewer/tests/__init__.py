@@ -27,3 +27,11 @@
 
 from .test_metadataviewer_page import *
 from .test_metadataviewer_object_manager import *
+from .test_metadataviewer_numpy_dao import *
+from .test_metadataviewer_cache import *
+from .test_metadataviewer_star_dao import *
+from .test_metadataviewer_sqlite_dao import *
+from .test_metadataviewer_xmd_dao import *
+from .test_metadataviewer_csv_dao import *
+from .test_metadataviewer_image_loader import *
+from .test_metadataviewer_mrc_reader import *
@@ -0,0 +1,125 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *          Pablo Conesa Mingo         (pconesa@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from metadataviewer.model import (Table, Page, LRUCache, PageCache, ThumbnailCache,
+                                  ThumbnailDiskCache)
+from metadataviewer.model.constants import THUMBNAIL_CACHE_SIZE
+from metadataviewer.model.renderers import ImageRenderer, AUTOCONTRAST, getImageFilters
+
+
+class TestCache(unittest.TestCase):
+
+    def testLRUCache(self):
+        cache = LRUCache(10, sizeOf=len)
+        cache.put('a', 'aaaa')
+        cache.put('b', 'bbbb')
+        self.assertEqual(cache.get('a'), 'aaaa')
+        cache.put('c', 'cccc')  # 'b' is the least recently used
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.getSize(), 8)
+        self.assertIsNone(cache.get('b'))
+        stats = cache.getStats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def testPageCache(self):
+        cache = PageCache(1024 * 1024)
+        for tableName in ['particles', 'classes']:
+            page = Page(Table(tableName), pageNumber=1, pageSize=2)
+            page.addRows([(1, ['a', 1.0]), (2, ['b', 2.0])])
+            cache.put((tableName, 1, 2, 'id', True), page)
+        self.assertGreater(cache.getSize(), 0)
+        cache.invalidate('particles')
+        self.assertEqual(len(cache), 1)
+        self.assertIn(('classes', 1, 2, 'id', True), cache)
+
+    def testThumbnailCache(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, 'particle.png')
+            Image.new('L', (100, 50)).save(path)
+            cache = ImageRenderer.getThumbnailCache()
+            cache.clear()
+
+            # The renderers share the thumbnails
+            image = ImageRenderer(size=40).render(path, None)
+            self.assertIs(ImageRenderer(size=40).render(path, None), image)
+            self.assertEqual(image.size, (40, 20))
+            self.assertEqual(cache.getSize(), 40 * 20)
+            self.assertEqual(cache.getStats()['hits'], 1)
+
+            renderer = ImageRenderer(size=40)
+            renderer.setFilters(getImageFilters(True, False))
+            self.assertEqual(renderer.getFilters(), (AUTOCONTRAST,))
+            self.assertIsNot(renderer.render(path, None), image)
+            self.assertEqual(len(cache), 2)
+
+            cache.setMaxSize(1000)  # Only one thumbnail fits
+            self.assertEqual(len(cache), 1)
+            cache.invalidate(path)
+            self.assertEqual(len(cache), 0)
+            ImageRenderer.setThumbnailCacheSize(THUMBNAIL_CACHE_SIZE)
+            self.assertIsInstance(cache, ThumbnailCache)
+
+    def testThumbnailDiskCache(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            cacheDir = os.path.join(tmpDir, 'thumbnails')
+            path = os.path.join(tmpDir, 'particle.png')
+            Image.new('L', (100, 50), color=7).save(path)
+            ImageRenderer.setDiskCache(ThumbnailDiskCache(cacheDir, 10000))
+            try:
+                ImageRenderer.getThumbnailCache().clear()
+                ImageRenderer(size=40).render(path, None)
+                self.assertEqual(len(ImageRenderer.getDiskCache()), 1)
+
+                # A new session reads the stored thumbnail
+                diskCache = ThumbnailDiskCache(cacheDir, 10000)
+                ImageRenderer.setDiskCache(diskCache)
+                ImageRenderer.getThumbnailCache().clear()
+                image = ImageRenderer(size=40).render(path, None)
+                self.assertEqual(diskCache.getStats()['hits'], 1)
+                self.assertEqual((image.size, image.getpixel((0, 0))), ((40, 20), 7))
+
+                # Modified images are rendered again
+                os.utime(path, ns=(0, 0))
+                ImageRenderer.getThumbnailCache().clear()
+                ImageRenderer(size=40).render(path, None)
+                self.assertEqual(diskCache.getStats()['misses'], 1)
+
+                # The least recently used thumbnails are removed
+                ImageRenderer(size=60).render(path, None)
+                self.assertLessEqual(diskCache.getSize(), 10000)
+                self.assertEqual(len(diskCache), len(os.listdir(cacheDir)))
+                diskCache.setMaxSize(0)
+                self.assertEqual(os.listdir(cacheDir), [])
+            finally:
+                ImageRenderer.setDiskCache(None)
+                ImageRenderer.getThumbnailCache().clear()
@@ -0,0 +1,131 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *          Pablo Conesa Mingo         (pconesa@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+
+import os
+import tempfile
+import unittest
+
+from metadataviewer.dao import csv_dao
+from metadataviewer.dao.csv_dao import CsvDao
+from metadataviewer.model import Page, IntRenderer, FloatRenderer, StrRenderer
+
+
+class TestCsvDao(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tmpDir.name, 'particles.csv')
+        with open(self.fileName, 'w') as csvFile:
+            csvFile.write('index,defocus,name\n')
+            for i in range(1000):
+                csvFile.write('%d,%s,"part, %03d"\n' % (i, (1000 - i) * 0.5, i))
+        self.chunkSize = csv_dao.INDEX_CHUNK_SIZE
+        # Many small chunks
+        csv_dao.INDEX_CHUNK_SIZE = 1000
+
+    def tearDown(self):
+        csv_dao.INDEX_CHUNK_SIZE = self.chunkSize
+        self.tmpDir.cleanup()
+
+    def _createDao(self):
+        dao = CsvDao(self.fileName)
+        table = dao.getTables()['data']
+        dao.fillTable(table, None)
+        return dao, table
+
+    def testColumns(self):
+        dao, table = self._createDao()
+        self.assertEqual([(col.getName(), type(col.getRenderer())) for col in table.getColumns()],
+                         [('index', IntRenderer), ('defocus', FloatRenderer),
+                          ('name', StrRenderer)])
+        page = Page(table, pageNumber=1, pageSize=10)
+        dao.fillPage(page, None, True)
+        self.assertEqual(page.getRows()[0].getValues(), [0, 500.0, 'part, 000'])
+
+        dao.waitForIndex()
+        self.assertTrue(dao.isRowCountFinal('data'))
+        self.assertEqual(dao.getTableRowCount('data'), 1000)
+
+    def testRowsIndex(self):
+        dao, table = self._createDao()
+        for pageNumber in [100, 3, 57]:
+            page = Page(table, pageNumber=pageNumber, pageSize=10)
+            dao.fillPage(page, None, True)
+            firstRow = (pageNumber - 1) * 10
+            self.assertEqual([row.getValues()[0] for row in page.getRows()],
+                             list(range(firstRow, firstRow + 10)))
+
+    def testSorting(self):
+        dao, table = self._createDao()
+        table.setSortingColumn('defocus')
+        page = Page(table, pageNumber=1, pageSize=5)
+        dao.fillPage(page, 'defocus', True)
+        self.assertEqual([row.getId() for row in page.getRows()],
+                         [999, 998, 997, 996, 995])
+
+        values = dao.getColumnsValues('data', ['defocus'], 'index', None, 100, False)
+        self.assertEqual(len(values['defocus']), 100)
+        self.assertEqual(values['index'][99], 99)
+
+    def testTruncatedFile(self):
+        dao, table = self._createDao()
+        dao.getSortedIndexes('index', False)
+        with open(self.fileName, 'r+') as csvFile:
+            csvFile.truncate(os.path.getsize(self.fileName) - 100)
+
+        # The rows lost are not returned (or returned empty if sorted)
+        page = Page(table, pageNumber=100, pageSize=10)
+        dao.fillPage(page, None, True)
+        self.assertLess(page.getSize(), 10)
+        table.setSortingColumn('index')
+        table.setSortingAsc(False)
+        page = Page(table, pageNumber=1, pageSize=10)
+        dao.fillPage(page, 'index', False)
+        self.assertEqual(page.getRows()[0].getValues(), ['', '', ''])
+        self.assertEqual(page.getRows()[9].getValues()[0], 990)
+
+    def testEncoding(self):
+        with open(self.fileName, 'w', encoding='utf-8') as csvFile:
+            csvFile.write('name,size\nmicrógrafo,1\nÅngström,2\n')
+        dao, table = self._createDao()
+        page = Page(table, pageNumber=1, pageSize=10)
+        dao.fillPage(page, None, True)
+        values = dao.getColumnsValues('data', ['name'], None, None, None, False)
+        self.assertEqual([row.getValues()[0] for row in page.getRows()],
+                         values['name'].tolist())
+        self.assertEqual(values['name'].tolist(), ['micrógrafo', 'Ångström'])
+
+        # Files that are not UTF-8 are read as Latin-1
+        with open(self.fileName, 'w', encoding='latin-1') as csvFile:
+            csvFile.write('name,size\nmicrógrafo,1\nÅngström,2\n')
+        dao, table = self._createDao()
+        page = Page(table, pageNumber=1, pageSize=10)
+        dao.fillPage(page, None, True)
+        values = dao.getColumnsValues('data', ['name'], None, None, None, False)
+        self.assertEqual([row.getValues()[0] for row in page.getRows()],
+                         ['micrógrafo', 'Ångström'])
+        self.assertEqual(values['name'].tolist(), ['micrógrafo', 'Ångström'])
@@ -0,0 +1,138 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *          Pablo Conesa Mingo         (pconesa@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+
+import os
+import tempfile
+import threading
+import unittest
+
+from PIL import Image
+
+from metadataviewer.model.image_loader import (ImageLoader, ImageScheduler,
+                                               VISIBLE, PREFETCH)
+from metadataviewer.model.renderers import ImageRenderer
+
+
+class BlockedRenderer(ImageRenderer):
+    """Image renderer that waits for an event before rendering"""
+    def __init__(self, size):
+        super().__init__(size=size)
+        self.event = threading.Event()
+        self.rendered = []
+
+    def renderKey(self, key):
+        self.event.wait(5)
+        self.rendered.append(key[0])
+        return super().renderKey(key)
+
+
+class TestImageLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i in range(5):
+            path = os.path.join(self.tmpDir.name, 'particle%d.png' % i)
+            Image.new('L', (64, 64), color=i).save(path)
+            self.paths.append(path)
+        ImageRenderer.getThumbnailCache().clear()
+
+    def tearDown(self):
+        ImageRenderer.getThumbnailCache().clear()
+        self.tmpDir.cleanup()
+
+    def _request(self, loader, renderer, path, results):
+        done = threading.Event()
+
+        def callback(request, image):
+            results[path] = image
+            done.set()
+
+        request = loader.request(renderer, renderer.getThumbnailKey(path, None),
+                                 callback)
+        return request, done
+
+    def testAsyncRendering(self):
+        loader = ImageLoader(threads=1)
+        renderer = BlockedRenderer(size=32)
+        results = {}
+        requests = [self._request(loader, renderer, path, results)
+                    for path in self.paths]
+
+        # The cells that are not shown any more are cancelled
+        loader.cancel([request for request, _ in requests[1:3]])
+        renderer.event.set()
+        for _, done in requests[3:]:
+            self.assertTrue(done.wait(5))
+        self.assertNotIn(self.paths[1], renderer.rendered)
+        self.assertNotIn(self.paths[2], results)
+        self.assertEqual(results[self.paths[4]].getpixel((0, 0)), 4)
+        self.assertIsNotNone(renderer.getCachedImage(self.paths[4], None))
+
+    def testSyncRendering(self):
+        loader = ImageLoader(threads=0)
+        renderer = ImageRenderer(size=32)
+        results = {}
+        _, done = self._request(loader, renderer, self.paths[0], results)
+        self.assertTrue(done.is_set())
+        self.assertEqual(results[self.paths[0]].size, (32, 32))
+
+        # Images that can not be rendered are given as None
+        self._request(loader, renderer, 'missing.png', results)
+        self.assertIsNone(results['missing.png'])
+
+    def testScheduler(self):
+        loader = ImageLoader(threads=1)
+        scheduler = ImageScheduler(loader)
+        scheduler.newGeneration(firstItem=100, visibleItems=10)
+        self.assertEqual(scheduler.getPriority(105), (VISIBLE, 0, 5))
+        self.assertEqual(scheduler.getPriority(111), (PREFETCH, 0, 2))
+        self.assertEqual(scheduler.getPriority(98), (PREFETCH, 1, 2))
+
+        # Scrolling up, the items above go first
+        scheduler.newGeneration(firstItem=50, visibleItems=10)
+        self.assertEqual(scheduler.getDirection(), -1)
+        self.assertLess(scheduler.getPriority(45), scheduler.getPriority(61))
+        self.assertLess(scheduler.getPriority(59), scheduler.getPriority(45))
+
+        # The images are served by priority and the stale ones are dropped
+        renderer = BlockedRenderer(size=32)
+        served = []
+        callback = lambda request, image: served.append(request.key[0])
+        scheduler.request(renderer, 'blocking.png', None, callback, item=50)
+        for item in [44, 62]:
+            scheduler.request(renderer, self.paths[0], None, callback, item=item)
+        scheduler.newGeneration(firstItem=0, visibleItems=5)
+        done = threading.Event()
+        for item, path in zip([8, 3, 1], self.paths[2:]):
+            scheduler.request(renderer, path, None, callback, item=item)
+        scheduler.request(renderer, 'last.png', None, lambda *args: done.set(),
+                          item=20)
+        renderer.event.set()
+        self.assertTrue(done.wait(5))
+        self.assertEqual(served, [self.paths[4], self.paths[3], self.paths[2]])
+        self.assertEqual(loader.getPendingCount(), 0)
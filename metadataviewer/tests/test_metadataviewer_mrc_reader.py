@@ -0,0 +1,109 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy
+
+from metadataviewer.model.mrc_reader import MRCImageReader, MRCStack
+from metadataviewer.model.renderers import ImageRenderer, splitImagePath
+
+
+def writeMrc(fileName, data, mode=2):
+    """Write a stack with a minimal MRC header"""
+    header = numpy.zeros(256, dtype='<i4')
+    header[:3] = data.shape[2], data.shape[1], data.shape[0]
+    header[3] = mode
+    header = bytearray(header.tobytes())
+    header[208:212] = b'MAP '
+    header[212:214] = b'\x44\x44'  # little endian
+    with open(fileName, 'wb') as mrcFile:
+        mrcFile.write(header)
+        mrcFile.write(data.astype('<f4' if mode == 2 else '<i2').tobytes())
+
+
+class TestMRCImageReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tmpDir.name, 'particles.mrcs')
+        self.data = numpy.arange(5 * 4 * 6, dtype=numpy.float32).reshape((5, 4, 6))
+        writeMrc(self.fileName, self.data)
+        MRCImageReader.clear()
+
+    def tearDown(self):
+        MRCImageReader.clear()
+        self.tmpDir.cleanup()
+
+    def testSplitImagePath(self):
+        self.assertEqual(splitImagePath('000012@Extract/particles.mrcs'),
+                         (12, 'Extract/particles.mrcs'))
+        self.assertEqual(splitImagePath('particles.mrcs'), (None, 'particles.mrcs'))
+        self.assertEqual(splitImagePath('user@host.png'), (None, 'user@host.png'))
+
+    def testReadSlices(self):
+        self.assertIs(ImageRenderer.getImageReader('3@' + self.fileName), MRCImageReader)
+        for index in range(1, 6):
+            values = MRCImageReader.readSlice('%06d@%s' % (index, self.fileName))
+            self.assertTrue(numpy.array_equal(values, self.data[index - 1]))
+        # Without index the central slice is read
+        self.assertTrue(numpy.array_equal(MRCImageReader.readSlice(self.fileName),
+                                          self.data[2]))
+        with self.assertRaises(IndexError):
+            MRCImageReader.readSlice('6@' + self.fileName)
+
+        image = MRCImageReader.open('2@' + self.fileName)
+        self.assertEqual(image.size, (6, 4))
+        self.assertEqual(image.mode, 'L')
+        self.assertEqual(numpy.asarray(image).min(), 0)
+        self.assertEqual(numpy.asarray(image).max(), 255)
+
+        int16Name = os.path.join(self.tmpDir.name, 'volume.mrc')
+        writeMrc(int16Name, self.data, mode=1)
+        self.assertTrue(numpy.array_equal(MRCImageReader.readSlice('5@' + int16Name),
+                                          self.data[4]))
+
+    def testStackIsOpenedOnce(self):
+        with mock.patch('metadataviewer.model.mrc_reader.MRCStack',
+                        wraps=MRCStack) as stackClass:
+            renderer = ImageRenderer(size=32)
+            for index in range(1, 6):
+                image = renderer.render('%d@%s' % (index, self.fileName), None)
+                self.assertEqual(image.size, (32, 21))
+            self.assertEqual(stackClass.call_count, 1)
+
+            # Modified stacks are parsed again
+            os.utime(self.fileName, ns=(0, 0))
+            MRCImageReader.readSlice('1@' + self.fileName)
+            self.assertEqual(stackClass.call_count, 2)
+
+        MRCImageReader.setMaxStacks(0)
+        self.assertEqual(len(MRCImageReader._stacks), 0)
+        MRCImageReader.setMaxStacks(32)
@@ -0,0 +1,174 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *          Pablo Conesa Mingo         (pconesa@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+
+import os
+import tempfile
+import unittest
+
+import numpy
+
+from metadataviewer.dao.numpy_dao import NumpyDao
+from metadataviewer.model import Page, Selection
+
+
+class TestNumpyDao(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tmpDir.name, 'particles.npy')
+        data = numpy.zeros(100, dtype=[('index', '<u4'), ('defocus', '<f4'),
+                                       ('name', 'S10')])
+        data['index'] = numpy.arange(100)
+        data['defocus'] = numpy.arange(100)[::-1] * 10
+        data['name'] = [b'part%03d' % i for i in range(100)]
+        numpy.save(self.fileName, data)
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def _createDao(self):
+        dao = NumpyDao(self.fileName)
+        table = dao.getTables()['data']
+        dao.fillTable(table, None)
+        return dao, table
+
+    def testHeader(self):
+        dao, table = self._createDao()
+        self.assertEqual([col.getName() for col in table.getColumns()],
+                         ['index', 'defocus', 'name'])
+        self.assertEqual(dao.getTableRowCount('data'), 100)
+        # The data is not loaded to discover the table
+        self.assertEqual(dao._data, {})
+
+        numpy.save(self.fileName, numpy.zeros(10, dtype=[('x', object)]),
+                   allow_pickle=True)
+        dao = NumpyDao(self.fileName)
+        self.assertEqual(dao.getTableRowCount('data'), 10)
+
+    def testArchive(self):
+        npzFile = os.path.join(self.tmpDir.name, 'project.npz')
+        particles = numpy.load(self.fileName)
+        classes = numpy.zeros(5, dtype=[('size', '<u4')])
+        threshold = NumpyDao._mmapThreshold
+        NumpyDao.setMmapThreshold(0)
+        try:
+            for save in [numpy.savez, numpy.savez_compressed]:
+                save(npzFile, particles=particles, classes=classes)
+                dao = NumpyDao(npzFile)
+                tables = dao.getTables()
+                self.assertEqual(list(tables), ['particles', 'classes'])
+                self.assertEqual(dao.getTableRowCount('classes'), 5)
+                dao.fillTable(tables['particles'], None)
+                self.assertEqual(len(tables['particles'].getColumns()), 3)
+                # Members are only loaded when their rows are requested
+                self.assertEqual(dao._data, {})
+
+                page = Page(tables['particles'], pageNumber=2, pageSize=10)
+                dao.fillPage(page, None, True)
+                self.assertEqual(page.getRows()[0].getValues()[2], b'part010')
+                self.assertEqual(list(dao._data), ['particles'])
+                self.assertEqual(isinstance(dao.getData('particles'), numpy.memmap),
+                                 save is numpy.savez)
+        finally:
+            NumpyDao.setMmapThreshold(threshold)
+
+    def testMemoryMapping(self):
+        threshold = NumpyDao._mmapThreshold
+        NumpyDao.setMmapThreshold(0)
+        try:
+            dao, table = self._createDao()
+            self.assertIsInstance(dao.getData(), numpy.memmap)
+            self.assertEqual(dao.getTableRowCount('data'), 100)
+            page = Page(table, pageNumber=2, pageSize=10)
+            dao.fillPage(page, 'id', True)
+            self.assertEqual(page.getSize(), 10)
+            self.assertEqual(page.getRows()[0].getId(), 10)
+        finally:
+            NumpyDao.setMmapThreshold(threshold)
+
+    def testSorting(self):
+        dao, table = self._createDao()
+        table.setSortingColumn('defocus')
+        table.setSortingAsc(True)
+        page = Page(table, pageNumber=1, pageSize=10)
+        dao.fillPage(page, 'defocus', True)
+        self.assertEqual(page.getRows()[0].getId(), 99)
+        self.assertEqual(dao.getData()['index'][0], 0)
+
+        self.assertEqual([row.getValues()[1] for row in page.getRows()],
+                         list(range(0, 100, 10)))
+
+        # Descending order is the reversed ascending permutation
+        table.setSortingAsc(False)
+        page = Page(table, pageNumber=1, pageSize=10)
+        dao.fillPage(page, 'defocus', False)
+        self.assertEqual([row.getId() for row in page.getRows()], list(range(10)))
+        self.assertEqual([row.getValues()[1] for row in page.getRows()],
+                         list(range(990, 890, -10)))
+        ascending = dao.getSortedIndexes('defocus', True, 'data')
+        descending = dao.getSortedIndexes('defocus', False, 'data')
+        self.assertEqual(descending.tolist(), ascending.tolist()[::-1])
+        self.assertTrue(numpy.shares_memory(ascending, descending))
+
+        # Unknown columns (e.g. the id) keep the original order
+        table.setSortingColumn('id')
+        page = Page(table, pageNumber=1, pageSize=10)
+        dao.fillPage(page, 'id', False)
+        self.assertEqual(page.getRows()[0].getId(), 0)
+
+    def testColumnsValues(self):
+        dao, table = self._createDao()
+        values = dao.getColumnsValues('data', ['defocus'], 'index', None, 10,
+                                      False)
+        self.assertEqual(sorted(values), ['defocus', 'id', 'index'])
+        self.assertEqual(len(values['defocus']), 10)
+        self.assertTrue(numpy.shares_memory(values['defocus'], dao.getData()))
+
+        selection = Selection()
+        for rowId in [50, 5, 20]:
+            selection.addRowSelected(rowId)
+        values = dao.getColumnsValues('data', ['index'], None, selection, 2,
+                                      True)
+        self.assertEqual(values['id'].tolist(), [5, 20])
+        self.assertEqual(values['index'].tolist(), [5, 20])
+
+    def testSelectedRangeRowsIds(self):
+        dao, table = self._createDao()
+        ids = dao.getSelectedRangeRowsIds('data', 1, 4, 'id')
+        self.assertEqual(ids.tolist(), [0, 1, 2, 3, 4])
+        ids = dao.getSelectedRangeRowsIds('data', 1, 2, 'defocus', True)
+        self.assertEqual(ids.tolist(), [99, 98, 97])
+        ids = dao.getSelectedRangeRowsIds('data', 0, 100, 'defocus')
+        self.assertEqual(len(ids), 100)
+
+        selection = Selection()
+        selection.addRows(dao.getSelectedRangeRowsIds('data', 1, 99, 'id'),
+                          remove=False)
+        self.assertEqual(selection.getCount(), 100)
+        selection.addRows(ids[:10], remove=True)
+        self.assertEqual(selection.getCount(), 90)
+        self.assertFalse(selection.isRowSelected(99))
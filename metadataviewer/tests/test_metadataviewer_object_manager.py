@@ -25,12 +25,258 @@
 # *
 # **************************************************************************
 
+import argparse
+import os
+import tempfile
+import threading
+import time
 import unittest
-from metadataviewer.model.object_manager import ObjectManager
+import zipfile
+
+import numpy
+
+from metadataviewer.dao.numpy_dao import NumpyDao
+from metadataviewer.model.exporters import (CSVExporter, XLSXExporter,
+                                            NpyExporter, StarExporter)
+from metadataviewer.model.object_manager import ObjectManager, IGUI
+
+
+def createObjectManager(fileName):
+    """Create an object manager that has the given file opened"""
+    if NumpyDao not in ObjectManager.getDAORegistry():
+        ObjectManager.registerDAO(NumpyDao)
+    objectManager = ObjectManager()
+    objectManager.setGui(IGUI())
+    objectManager.open(argparse.Namespace(fileName=fileName))
+    return objectManager
+
+
+class PagedNumpyDao(NumpyDao):
+    """Numpy DAO that is only read by pages"""
+    def supportsRandomAccess(self) -> bool:
+        return False
+
+
+class RowsNumpyDao(PagedNumpyDao):
+    """Numpy DAO that fills row pages"""
+    def isColumnar(self) -> bool:
+        return False
+
+
+class BlockedNumpyDao(NumpyDao):
+    """Numpy DAO whose second page is not filled until it is released"""
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.release = threading.Event()
+        self.filledPages = []
+
+    def fillRange(self, page, firstRow, numberOfRows):
+        if page.getPageNumber() == 2:
+            self.release.wait(5)
+        super().fillRange(page, firstRow, numberOfRows)
+        self.filledPages.append(page.getPageNumber())
 
 
 class TestObjectManager(unittest.TestCase):
 
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tmpDir.name, 'particles.npy')
+        data = numpy.zeros(1000, dtype=[('index', '<u4'), ('defocus', '<f4')])
+        data['index'] = numpy.arange(1000)
+        numpy.save(self.fileName, data)
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def testGetRows(self):
+        objectManager = createObjectManager(self.fileName)
+        objectManager.getTables()
+        pagedObjectManager = createObjectManager(self.fileName)
+        pagedObjectManager._dao = PagedNumpyDao(self.fileName)
+        pagedObjectManager.setPrefetchPages(0)
+        pagedObjectManager.getTables()
+
+        for firstRow, visibleRows in [(-1, 10), (0, 10), (45, 120), (990, 20)]:
+            rows = objectManager.getRows('data', firstRow, visibleRows)
+            pagedRows = pagedObjectManager.getRows('data', firstRow, visibleRows)
+            self.assertEqual([row.getId() for row in rows],
+                             [row.getId() for row in pagedRows])
+        self.assertEqual(len(rows), 10)
+        rows = objectManager.getRows('data', -1, 3)
+        self.assertEqual([row.getId() for row in rows], [0, 0, 1])
+
+    def testPrefetch(self):
+        objectManager = createObjectManager(self.fileName)
+        objectManager.getTables()
+        pageSize = objectManager.getPageSize()
+        rows = objectManager.getRows('data', 0, 10)
+        self.assertEqual(len(rows), 10)
+
+        # The next pages are loaded in background
+        key = ('data', 2, pageSize, None, True, None)
+        for i in range(50):
+            if key in objectManager.getPageCache():
+                break
+            time.sleep(0.05)
+        self.assertIn(key, objectManager.getPageCache())
+
+        # The rows of the prefetched pages are not read again
+        cachedRows = objectManager.getCachedRows('data', pageSize - 5, 10)
+        self.assertEqual([position for position, row in cachedRows],
+                         list(range(pageSize - 5, pageSize + 5)))
+        self.assertEqual(cachedRows[-1][1].getId(), pageSize + 4)
+        self.assertEqual(objectManager.getCachedRows('data', 10 * pageSize, 10), [])
+        hits = objectManager.getPageCache().getStats()['hits']
+        rows = objectManager.getRows('data', pageSize + 5, 10)
+        self.assertEqual(rows[0].getId(), pageSize + 5)
+        self.assertEqual(objectManager.getPageCache().getStats()['hits'], hits + 1)
+
+        objectManager.cancelPrefetch()
+        objectManager.setPrefetchPages(0)
+        self.assertFalse(objectManager.isPrefetchEnabled())
+
+    def testConcurrentLoads(self):
+        objectManager = createObjectManager(self.fileName)
+        dao = objectManager._dao = BlockedNumpyDao(self.fileName)
+        objectManager.setPrefetchPages(0)
+        objectManager.getTables()
+        pageSize = objectManager.getPageSize()
+        key = ('data', 2, pageSize, None, True, None)
+        loader = threading.Thread(target=objectManager._loadPage, args=(key, 0))
+        loader.start()
+        time.sleep(0.1)
+
+        # Other pages are not blocked by the page being loaded
+        page = objectManager.getPage('data', 1, pageSize, None, True)
+        self.assertEqual(page.getRows()[0].getId(), 0)
+
+        # The page being loaded is waited for instead of read again
+        threading.Timer(0.1, dao.release.set).start()
+        page = objectManager.getPage('data', 2, pageSize, None, True)
+        loader.join()
+        self.assertEqual(page.getRows()[0].getId(), pageSize)
+        self.assertEqual(dao.filledPages, [1, 2])
+
+    def testColumnProjection(self):
+        objectManager = createObjectManager(self.fileName)
+        pagedObjectManager = createObjectManager(self.fileName)
+        pagedObjectManager._dao = PagedNumpyDao(self.fileName)
+        pagedObjectManager.setPrefetchPages(0)
+
+        for manager in [objectManager, pagedObjectManager]:
+            manager.getTables()
+            rows = manager.getRows('data', 10, 5, columns=[1])
+            self.assertEqual(len(rows), 5)
+            self.assertEqual(rows[0].getValues(), [None, 0.0])
+            # Projecting all the columns is the same as not projecting
+            self.assertIsNone(manager.getProjection('data', [1, 0]))
+            rows = manager.getRows('data', 10, 5, columns=[0, 1])
+            self.assertEqual(rows[0].getValues(), [10, 0.0])
+
+        # Projected pages are cached apart
+        pageSize = pagedObjectManager.getPageSize()
+        for manager in [objectManager, pagedObjectManager]:
+            self.assertIn(('data', 1, pageSize, None, True, (1,)),
+                          manager.getPageCache())
+
+    def testInvertSelection(self):
+        objectManager = createObjectManager(self.fileName)
+        objectManager.getTables()
+        selection = objectManager.getTable('data').getSelection()
+        selection.addRows([1, 500], remove=False)
+        objectManager.invertSelection('data')
+        self.assertEqual(selection.getCount(), 998)
+        self.assertFalse(selection.isRowSelected(500))
+        self.assertTrue(selection.isRowSelected(999))
+        self.assertFalse(selection.isRowSelected(1000))
+
+    def testRowsColumns(self):
+        objectManager = createObjectManager(self.fileName)
+        rowsObjectManager = createObjectManager(self.fileName)
+        rowsObjectManager._dao = RowsNumpyDao(self.fileName)
+        rowsObjectManager.setPrefetchPages(0)
+
+        for manager in [objectManager, rowsObjectManager]:
+            manager.getTables()
+            pageSize = manager.getPageSize()
+            # A range covering three pages
+            page = manager.getRowsColumns('data', pageSize - 5, pageSize + 10, columns=[0])
+            self.assertEqual(page.getSize(), pageSize + 10)
+            self.assertEqual(page.getIds().tolist(),
+                             list(range(pageSize - 5, 2 * pageSize + 5)))
+            self.assertEqual(list(page.getColumnValues(0)),
+                             list(range(pageSize - 5, 2 * pageSize + 5)))
+            self.assertIsNone(page.getColumnValues(1))
+            self.assertEqual(page.getValue(0, 5), pageSize)
+
+            page = manager.getRowsColumns('data', 995, 10)
+            self.assertEqual(page.getIds().tolist(), list(range(995, 1000)))
+            self.assertEqual(page.getRow(4).getValues(), [999, 0.0])
+            self.assertEqual(manager.getRowsColumns('data', 0, 0).getSize(), 0)
+
+        # The columnar pages are sliced, not boxed row by row
+        page = objectManager.getRowsColumns('data', 995, 10)
+        self.assertIsInstance(page.getColumnValues(0), numpy.ndarray)
+
+    def testExportToCSV(self):
+        objectManager = createObjectManager(self.fileName)
+        pagedObjectManager = createObjectManager(self.fileName)
+        pagedObjectManager._dao = PagedNumpyDao(self.fileName)
+        pagedObjectManager.setPrefetchPages(0)
+        csvFile = os.path.join(self.tmpDir.name, 'particles.csv')
+
+        for manager in [objectManager, pagedObjectManager]:
+            manager.getTables()
+            for ids in [None, [3, 1, 997]]:
+                progress = []
+                exporter = CSVExporter(manager, 'data', csvFile, ids)
+                result = exporter.export(lambda done, total: progress.append(done))
+                self.assertTrue(result)
+                with open(csvFile) as file:
+                    lines = file.read().splitlines()
+                self.assertEqual(lines[0], 'index,defocus')
+                if ids is None:
+                    self.assertEqual(len(lines), 1001)
+                    self.assertEqual(lines[1], '0,0.0')
+                    self.assertEqual(progress[-1], 1000)
+                else:
+                    indexes = [int(line.split(',')[0]) for line in lines[1:]]
+                    self.assertEqual(sorted(indexes), sorted(ids))
+
+        # Cancelled exports don't leave incomplete files
+        exporter = CSVExporter(objectManager, 'data', csvFile)
+        self.assertFalse(exporter.export(isCancelled=lambda: True))
+        self.assertFalse(os.path.exists(csvFile))
+
+    def testExportFormats(self):
+        objectManager = createObjectManager(self.fileName)
+        objectManager.getTables()
+        self.assertIs(objectManager.selectExporter('subset.xlsx'), XLSXExporter)
+        self.assertIsNone(objectManager.selectExporter('subset.txt'))
+        ids = [5, 7, 500, 999]
+
+        npyFile = os.path.join(self.tmpDir.name, 'subset.npy')
+        self.assertTrue(NpyExporter(objectManager, 'data', npyFile, ids).export())
+        subset = numpy.load(npyFile)
+        self.assertTrue(numpy.array_equal(subset, numpy.load(self.fileName)[ids]))
+
+        starFile = os.path.join(self.tmpDir.name, 'subset.star')
+        self.assertTrue(StarExporter(objectManager, 'data', starFile, ids).export())
+        with open(starFile) as file:
+            lines = file.read().split()
+        self.assertIn('data_data', lines)
+        self.assertEqual(lines[-8:], ['5', '0.0', '7', '0.0', '500', '0.0', '999', '0.0'])
+
+        xlsxFile = os.path.join(self.tmpDir.name, 'subset.xlsx')
+        objectManager.getTable('data').getSelection().addRows(ids, remove=False)
+        objectManager.exportToExcel('data', xlsxFile)
+        with zipfile.ZipFile(xlsxFile) as xlsx:
+            sheet = xlsx.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row '), len(ids) + 1)
+        self.assertIn('<t>defocus</t>', sheet)
+        self.assertIn('<c><v>500</v></c>', sheet)
+
     # def testObjectManager(self):
     #     objectManager = ObjectManager()
     #
@@ -25,9 +25,38 @@
 # *
 # **************************************************************************
 
+import logging
+import sys
+import tracemalloc
 import unittest
 
-from metadataviewer.model import Column, Table, Page
+import numpy
+
+from metadataviewer.model import (Column, Row, Table, Page, ColumnarPage,
+                                  Selection, BitmapSelection)
+
+logger = logging.getLogger(__name__)
+
+
+class DictRow:
+    """Row with an instance dictionary, as it was before using slots"""
+    def __init__(self, id, values):
+        self._id = id
+        self._values = values
+
+
+def getBytesPerRow(rowClass, rowsCount=50 * 256):
+    """Memory benchmark: bytes taken by every row object of the cached
+    pages (256 pages of 50 rows). The values are shared, so only the row
+    objects are measured"""
+    values = [1, 1.5, 'a']
+    tracemalloc.start()
+    try:
+        rows = [rowClass(i, values) for i in range(rowsCount)]
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return size / len(rows)
 
 
 class TestPage(unittest.TestCase):
@@ -54,5 +83,95 @@ class TestPage(unittest.TestCase):
         page.addRow(row2)
         self.assertEqual(page.getSize(), 2)
 
+    def testAddRows(self):
+        table = Table('particles')
+        page = Page(table)
+        page.addRows(zip([1, 2], [['a', 1.0], ['b', 2.0]]))
+        self.assertEqual(page.getSize(), 2)
+        self.assertEqual(page.getRows()[1].getId(), 2)
+        self.assertEqual(page.getRows()[1].getValues(), ['b', 2.0])
+
+    def testColumnarPage(self):
+        table = Table('particles')
+        page = ColumnarPage(table, columns=[1, 2])
+        page.addColumns(numpy.array([5, 6]),
+                        [None, numpy.array([1.5, 2.5]), numpy.array(['a', 'b'])])
+        page.addRows([(7, [None, 3.5, 'c'])])
+        self.assertEqual(page.getSize(), 3)
+        self.assertEqual(page.getIds().tolist(), [5, 6, 7])
+        self.assertEqual(page.getColumnValues(1), [1.5, 2.5, 3.5])
+        self.assertIsNone(page.getColumnValues(0))
+
+        rows = page.getRows()
+        self.assertEqual(rows[2].getId(), 7)
+        self.assertEqual(rows[0].getValues(), [None, 1.5, 'a'])
+        self.assertIsInstance(rows[0].getValues()[1], float)
+        # The row views are created once and have no unused slots
+        self.assertIs(page.getRows(), rows)
+        self.assertIs(page.getRow(2), rows[2])
+        self.assertNotIsInstance(rows[0], Row)
+        self.assertFalse(hasattr(rows[0], '__dict__'))
+        self.assertEqual(sys.getsizeof(rows[0]), sys.getsizeof(Row(7, [])))
+        page.addRows([(8, [None, 4.5, 'd'])])
+        self.assertEqual(page.getRow(3).getId(), 8)
+        page = ColumnarPage(table)
+        page.addRows([(1, [2.5]), (2, [3.5])])
+        self.assertEqual(page.getRow(-1).getValues(), [3.5])
+
+        # Row pages can be filled by columns too
+        page = Page(table)
+        page.addColumns(numpy.array([1, 2]), [numpy.array([10, 20]), ['x', 'y']])
+        self.assertEqual(page.getRows()[1].getValues(), [20, 'y'])
+
+    def testRowMemory(self):
+        rowBytes, dictRowBytes = getBytesPerRow(Row), getBytesPerRow(DictRow)
+        logger.info("Bytes per cached row: %.1f with slots, %.1f without them"
+                    % (rowBytes, dictRowBytes))
+        self.assertLess(rowBytes, dictRowBytes)
+        for obj in [Row(1, []), Column('x'), Table('t')]:
+            self.assertFalse(hasattr(obj, '__dict__'))
+
+    def testBitmapSelection(self):
+        selection = BitmapSelection()
+        selection.addRowSelected(3)
+        selection.addRange(10, 20)
+        self.assertEqual(selection.getCount(), 11)
+        self.assertTrue(selection.isRowSelected(3))
+        self.assertIn(15, selection.getSelection())
+        self.assertNotIn(100, selection.getSelection())
+
+        selection.addRows([3, 4], remove=True)
+        self.assertFalse(selection.isRowSelected(3))
+        self.assertTrue(selection.isRowSelected(4))
+
+        other = selection.clone()
+        selection.invert(30)
+        self.assertEqual(selection.getCount(), 30 - 11)
+        selection.intersect(other)
+        self.assertTrue(selection.isEmpty())
+        selection.union(other)
+        self.assertEqual(list(selection.getSelection()), list(other.getIds()))
+
+        dictSelection = Selection()
+        dictSelection.addRows([4, 50], remove=False)
+        selection.intersect(dictSelection)
+        self.assertEqual(list(selection.getIds()), [4])
 
+        # Inverting a range of ids
+        selection.invert(8, 2)
+        self.assertEqual(list(selection.getIds()), [2, 3, 5, 6, 7])
+        dictSelection.invert(52, 48)
+        self.assertEqual(dictSelection.getIds(), [48, 49, 51])
 
+        # The bitmap can be used through the dictionary API
+        selectionDict = selection.getSelection()
+        self.assertEqual(list(selectionDict.keys() & {3, 4, 5}), [3, 5])
+        self.assertEqual(dict(selectionDict.items())[2], True)
+        self.assertTrue(selectionDict.pop(2))
+        self.assertIsNone(selectionDict.pop(2, None))
+        selectionDict[40] = True
+        del selectionDict[3]
+        self.assertEqual(list(selectionDict), [5, 6, 7, 40])
+        self.assertEqual(selection.getCount(), 4)
+        with self.assertRaises(KeyError):
+            selectionDict[3]
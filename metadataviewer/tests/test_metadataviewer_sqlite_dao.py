@@ -0,0 +1,127 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *          Pablo Conesa Mingo         (pconesa@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from metadataviewer.dao.sqlite_dao import SqliteDao
+from metadataviewer.model import Page, Selection
+
+DATASETS = os.path.join(os.path.dirname(__file__), 'datasets')
+
+
+class TestSqliteDao(unittest.TestCase):
+
+    def _createDao(self, fileName):
+        dao = SqliteDao(os.path.join(DATASETS, fileName))
+        tables = dao.getTables()
+        for table in tables.values():
+            dao.fillTable(table, None)
+        return dao, tables
+
+    def _getRows(self, dao, table, column=None, orderAsc=True, pageSize=400):
+        table.setSortingColumn(column)
+        table.setSortingAsc(orderAsc)
+        page = Page(table, pageNumber=1, pageSize=pageSize)
+        dao.fillPage(page, column, orderAsc)
+        return page.getRows()
+
+    def testTables(self):
+        dao, tables = self._createDao('classes2D.sqlite')
+        self.assertEqual(list(tables)[:2], ['objects', 'Class001'])
+        self.assertIn('properties', tables)
+        self.assertEqual(dao.getTableRowCount('objects'), 5)
+        columns = [col.getName() for col in tables['objects'].getColumns()]
+        self.assertEqual(columns[:3], ['id', 'enabled', '_size'])
+        self.assertEqual(dao.getRowIdsRange('objects'), (1, 6))
+
+        rows = self._getRows(dao, tables['properties'])
+        self.assertEqual(rows[0].getValues(), ['self', 'SetOfClasses2D'])
+
+    def testSorting(self):
+        dao, tables = self._createDao('particles.sqlite')
+        table = tables['objects']
+        allRows = self._getRows(dao, table)
+        self.assertEqual(len(allRows), 373)
+        index = table.getColumnIndexFromLabel('_ctfModel._defocusU')
+        for orderAsc in [True, False]:
+            rows = self._getRows(dao, table, '_ctfModel._defocusU', orderAsc)
+            expected = sorted(allRows, key=lambda row: (row.getValues()[index], row.getId()))
+            if not orderAsc:
+                expected.reverse()
+            self.assertEqual([row.getId() for row in rows],
+                             [row.getId() for row in expected])
+
+            # Any page is read by its key range
+            page = Page(table, pageNumber=3, pageSize=50)
+            dao.fillPage(page, '_ctfModel._defocusU', orderAsc)
+            self.assertEqual([row.getId() for row in page.getRows()],
+                             [row.getId() for row in expected[100:150]])
+
+            ids = dao.getSelectedRangeRowsIds('objects', 11, 9, '_ctfModel._defocusU', orderAsc)
+            self.assertEqual(list(ids), [row.getId() for row in expected[10:20]])
+
+    def testColumnsValues(self):
+        dao, tables = self._createDao('particles.sqlite')
+        values = dao.getColumnsValues('objects', ['_ctfModel._defocusU'], '_index',
+                                      None, None, False)
+        self.assertEqual(len(values['id']), 373)
+        self.assertEqual(len(values['_index']), 373)
+
+        selection = Selection()
+        selection.addRows([3, 7, 100], remove=False)
+        values = dao.getColumnsValues('objects', ['_ctfModel._defocusU'], None,
+                                      selection, None, True)
+        self.assertEqual(list(values['id']), [3, 7, 100])
+
+    def testReadOnly(self):
+        dao, tables = self._createDao('particles.sqlite')
+        self._getRows(dao, tables['objects'], '_ctfModel._defocusU')
+        with self.assertRaises(sqlite3.OperationalError):
+            dao.getConnection().execute('DELETE FROM Objects')
+
+    def testSchema(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            fileName = os.path.join(tmpDir, 'micrographs.sqlite')
+            connection = sqlite3.connect(fileName)
+            connection.execute('CREATE TABLE Classes (id INTEGER PRIMARY KEY, '
+                               'label_property TEXT, column_name TEXT, class_name TEXT)')
+            connection.execute("INSERT INTO Classes VALUES (1, '_filename', 'c01', 'String')")
+            connection.execute('CREATE TABLE Objects (id INTEGER PRIMARY KEY, c01 TEXT)')
+            connection.execute("INSERT INTO Objects VALUES (1, 'mic1.mrc')")
+            connection.commit()
+            connection.close()
+
+            # The tables without 'enabled' column are not given one
+            dao, tables = self._createDao(fileName)
+            columns = [col.getName() for col in tables['objects'].getColumns()]
+            self.assertEqual(columns, ['id', '_filename'])
+            rows = self._getRows(dao, tables['objects'])
+            self.assertEqual(rows[0].getValues(), [1, 'mic1.mrc'])
+            dao.close()
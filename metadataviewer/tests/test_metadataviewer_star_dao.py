@@ -0,0 +1,156 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *          Pablo Conesa Mingo         (pconesa@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+
+import os
+import tempfile
+import unittest
+
+from metadataviewer.dao.star_dao import StarDao
+from metadataviewer.model import Page
+
+DATASETS = os.path.join(os.path.dirname(__file__), 'datasets')
+
+
+class TestStarDao(unittest.TestCase):
+
+    def setUp(self):
+        self.fileName = os.path.join(DATASETS, 'output_particle.star')
+
+    def _createDao(self, fileName=None):
+        dao = StarDao(fileName or self.fileName)
+        tables = dao.getTables()
+        for table in tables.values():
+            dao.fillTable(table, None)
+        return dao, tables
+
+    def testTables(self):
+        dao, tables = self._createDao()
+        self.assertEqual(list(tables), ['optics', 'particles'])
+        self.assertEqual(dao.getTableRowCount('optics'), 1)
+        self.assertEqual(dao.getTableRowCount('particles'), 373)
+        columns = [col.getName() for col in tables['particles'].getColumns()]
+        self.assertEqual(len(columns), 14)
+        self.assertEqual(columns[0], 'rlnImageName')
+
+    def testRowsIndex(self):
+        indexStep = StarDao._indexStep
+        dao, tables = self._createDao()
+        table = tables['particles']
+        page = Page(table, pageNumber=1, pageSize=373)
+        dao.fillPage(page, None, True)
+        allRows = [row.getValues() for row in page.getRows()]
+        self.assertEqual(allRows[0][1], 123.30246)
+
+        StarDao.setIndexStep(7)
+        try:
+            dao, tables = self._createDao()
+            for pageNumber in [1, 4, 38]:
+                page = Page(tables['particles'], pageNumber=pageNumber, pageSize=10)
+                dao.fillPage(page, None, True)
+                firstRow = (pageNumber - 1) * 10
+                self.assertEqual([row.getId() for row in page.getRows()],
+                                 list(range(firstRow, min(firstRow + 10, 373))))
+                self.assertEqual([row.getValues() for row in page.getRows()],
+                                 allRows[firstRow:firstRow + 10])
+        finally:
+            StarDao.setIndexStep(indexStep)
+
+        # Only the projected columns are read
+        page = Page(table, pageNumber=2, pageSize=10, columns=[1, 3])
+        dao.fillPage(page, None, True)
+        for row, values in zip(page.getRows(), allRows[10:20]):
+            self.assertEqual(row.getValues(),
+                             [values[i] if i in (1, 3) else None
+                              for i in range(len(values))])
+
+    def testSorting(self):
+        dao, tables = self._createDao()
+        table = tables['particles']
+        table.setSortingColumn('rlnAngleRot')
+        table.setSortingAsc(True)
+        page = Page(table, pageNumber=1, pageSize=373)
+        dao.fillPage(page, 'rlnAngleRot', True)
+        angles = [row.getValues()[1] for row in page.getRows()]
+        self.assertEqual(angles, sorted(angles))
+
+        values = dao.getColumnsValues('particles', ['rlnAngleRot'], None, None,
+                                      None, False)
+        self.assertEqual(len(values['rlnAngleRot']), 373)
+        self.assertEqual(values['rlnAngleRot'][page.getRows()[0].getId()], angles[0])
+
+    def testKeyValueBlocks(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            fileName = os.path.join(tmpDir, 'model.star')
+            with open(fileName, 'w') as starFile:
+                starFile.write("\ndata_model_general\n\n_rlnReferenceDimensionality 2\n"
+                               "_rlnModelName 'model one'\n\ndata_\n\nloop_\n_rlnX #1\n")
+            dao, tables = self._createDao(fileName)
+            self.assertEqual(list(tables), ['model_general', 'data'])
+            self.assertEqual(dao.getTableRowCount('data'), 0)
+            page = Page(tables['model_general'], pageNumber=1, pageSize=10)
+            dao.fillPage(page, None, True)
+            self.assertEqual(page.getRows()[0].getValues(), [2, 'model one'])
+
+    def testTruncatedFile(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            fileName = os.path.join(tmpDir, 'particles.star')
+            with open(fileName, 'w') as starFile:
+                starFile.write("data_particles\n\nloop_\n_rlnA #1\n_rlnB #2\n")
+                for i in range(100):
+                    starFile.write("%d %f\n" % (i, (100 - i) * 0.5))
+            dao, tables = self._createDao(fileName)
+            table = tables['particles']
+            dao.getSortedIndexes('rlnB', True, 'particles')
+            with open(fileName, 'r+') as starFile:
+                starFile.truncate(os.path.getsize(fileName) - 45)
+
+            # The rows lost are not returned (or returned empty if sorted)
+            page = Page(table, pageNumber=10, pageSize=10)
+            dao.fillPage(page, None, True)
+            self.assertLess(page.getSize(), 10)
+            self.assertEqual(page.getRows()[-1].getValues(), [96, ''])
+            table.setSortingColumn('rlnB')
+            page = Page(table, pageNumber=1, pageSize=10)
+            dao.fillPage(page, 'rlnB', True)
+            self.assertEqual(page.getRows()[0].getValues(), ['', ''])
+            self.assertEqual(page.getRows()[9].getValues()[0], 90)
+
+            values = dao.getColumnsValues('particles', ['rlnB'], None, None,
+                                          None, False)
+            self.assertEqual(values['rlnB'][-1], '')
+
+    def testSeveralLoops(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            fileName = os.path.join(tmpDir, 'loops.star')
+            with open(fileName, 'w') as starFile:
+                starFile.write("data_\nloop_\n_rlnA #1\n1\n2\n3\n"
+                               "loop_\n_rlnB #1\n_rlnC #2\nx 1.5\n")
+            dao, tables = self._createDao(fileName)
+            self.assertEqual(dao.getTableRowCount('data'), 1)
+            page = Page(tables['data'], pageNumber=1, pageSize=10)
+            dao.fillPage(page, None, True)
+            self.assertEqual(page.getRows()[0].getValues(), ['x', 1.5])
@@ -0,0 +1,68 @@
+# **************************************************************************
+# *
+# * Authors: Yunior C. Fonseca Reyna    (cfonseca@cnb.csic.es)
+# *          Pablo Conesa Mingo         (pconesa@cnb.csic.es)
+# *
+# * Unidad de  Bioinformatica of Centro Nacional de Biotecnologia , CSIC
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 2 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# **************************************************************************
+
+import os
+import tempfile
+import unittest
+
+from metadataviewer.dao.xmd_dao import XmdDao
+from metadataviewer.model import Page
+
+
+class TestXmdDao(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tmpDir.name, 'images.xmd')
+        with open(self.fileName, 'w') as xmdFile:
+            xmdFile.write("# XMIPP_STAR_1 *\n#\ndata_noname\nloop_\n"
+                          " _image\n _enabled\n _shiftX\n")
+            for i in range(1000):
+                xmdFile.write(" %06d@images.stk %d %f\n" % (i + 1, i % 2, i * 0.5))
+            xmdFile.write("\ndata_block2\n_sampling 1.5\n")
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def testBlocks(self):
+        dao = XmdDao(self.fileName)
+        tables = dao.getTables()
+        self.assertEqual(list(tables), ['noname', 'block2'])
+        self.assertEqual(dao.getTableRowCount('noname'), 1000)
+        table = tables['noname']
+        dao.fillTable(table, None)
+        self.assertEqual([col.getName() for col in table.getColumns()],
+                         ['image', 'enabled', 'shiftX'])
+
+        page = Page(table, pageNumber=50, pageSize=15)
+        dao.fillPage(page, None, True)
+        self.assertEqual(page.getRows()[0].getId(), 735)
+        self.assertEqual(page.getRows()[0].getValues(), ['000736@images.stk', 1, 367.5])
+
+        values = dao.getColumnsValues('noname', ['shiftX'], 'enabled', None, 100, False)
+        self.assertEqual(len(values['shiftX']), 100)
+        self.assertEqual(values['enabled'].sum(), 50)